@@ -6,75 +6,53 @@ import pypdfium2 as pdfium
 from PIL import Image
 import io
 from dotenv import load_dotenv
-import pandas as pd
 from gradio_client import Client
 import tempfile
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import httpx
+from result_store import ResultStore, content_hash
+from dedup import RunDuplicates, hash_drawing, pack_detail, unpack_detail, same_drawing
+from file_source import list_files
+from report_export import write_json, write_rows_excel
+import model_router
+from schema_registry import get_template, plan_feature_groups
+from hedging import Deadline, DeadlineExceeded, HEDGER, LATENCIES, STAGE_TIMEOUTS, FILE_DEADLINE_S, latency_report
+from profiling import profile_stage
+from json_stream import IncrementalObjectParser
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
 API_URL = "https://api.openai.com/v1/chat/completions"
+ORIENTATION_MODEL = "gpt-4o"
+EXTRACTION_MODEL = "o4-mini-2025-04-16"
+TITLE_BLOCK_MODEL = "gpt-4o-mini"
 
-# Full JSON schema for all parameters
-FULL_SCHEMA = {
-    "type": "object",
-    "properties": {
-        # Important features
-        "cylinder_action":            {"type": "string"},
-        "bore_diameter":              {"type": "string"},
-        "outside_diameter":           {"type": "string"},
-        "rod_diameter":               {"type": "string"},
-        "stroke_length":              {"type": "string"},
-        "close_length":               {"type": "string"},
-        "operating_pressure":         {"type": "string"},
-        "operating_temperature":      {"type": "string"},
-        "mounting":                   {"type": "string"},
-        "rod_end":                    {"type": "string"},
-        "fluid":                      {"type": "string"},
-        "drawing_number":             {"type": "string"},
-        "revision":                   {"type": "string"}
-    },
-
-    "required": [
-        "cylinder_action","bore_diameter","outside_diameter","rod_diameter",
-        "stroke_length","close_length","operating_pressure",
-        "operating_temperature","mounting","rod_end","fluid","drawing_number","revision"
-    ]
-}
-                
-'''# Optional features
-        "body_material":              {"type": "string"},
-        "piston_material":            {"type": "string"},
-        "cylinder_configuration":     {"type": "string"},
-        "cylinder_style":             {"type": "string"},
-        "rated_load":                 {"type": "string"},
-        "standard":                   {"type": "string"},
-        "surface_finish":             {"type": "string"},
-        "coating_thickness":          {"type": "string"},
-        "special_features":           {"type": "string"},
-        "concentricity_of_rod_and_tube": {"type": "string"}
-        
-       in required: "body_material","piston_material","cylinder_configuration","cylinder_style",
-        "rated_load","standard","surface_finish","coating_thickness",
-        "special_features","concentricity_of_rod_and_tube"'''
-    
+# Fields, schemas and the extraction-call plan come from the component template
+# registry (schema_registry.py); the cylinder template is the default.
+CYLINDER_TEMPLATE = get_template("cylinder")
+FULL_SCHEMA = CYLINDER_TEMPLATE["schema"]
+IMPORTANT_FEATURES = CYLINDER_TEMPLATE["important"]
+OPTIONAL_FEATURES = CYLINDER_TEMPLATE["optional"]
 
+# Knobs of process_single_file_async(); pass a dict with any subset to override them.
+PIPELINE_CONFIG = {
+    "render_scale": 2,               # pdfium render scale of the first page
+    "image_transport": "imgbb",      # "imgbb" (hosted URL) or "base64" (inline data URL)
+    "orient": True,                  # ask the model for the upright rotation
+    "template": "cylinder",          # component template in schema_registry
+    "optional_features": False,      # True, or a list of the template's optional fields to extract as well
+    "feature_batches": None,         # {group name: [fields], ...}; None plans them with plan_feature_groups()
+    "extraction_tiers": None,        # list of {"model", "reasoning_effort"}; None uses model_router policies
+    "validation": False,             # re-check every batch with validate_feature_batch's prompt
+    "stream": True,                  # stream model answers and emit a "field" event per completed value
+    "dedup": True,                   # look for stored near-duplicates by perceptual hash (needs a store)
+}
 
-
-# Feature groups
-IMPORTANT_FEATURES = [
-    "cylinder_action", "bore_diameter", "outside_diameter",
-    "rod_diameter", "stroke_length", "close_length",  # first 6
-    "operating_pressure", "operating_temperature",
-    "mounting", "rod_end", "fluid", "drawing_number", "revision"   # next 7
-]
-
-'''OPTIONAL_FEATURES = [
-    "body_material", "piston_material", "cylinder_configuration",
-    "cylinder_style", "rated_load", "standard", "surface_finish",
-    "coating_thickness", "special_features", "concentricity_of_rod_and_tube"
-]
-'''
 SYSTEM_CONTENT_ANALYSIS = (
     """You are an elite mechanical drawing interpreter with 50 years of experience as a hydraulic cylinder engineer. 
     Your expertise lies in analyzing technical drawings of hydraulic and pneumatic cylinders with unparalleled precision. 
@@ -124,34 +102,37 @@ except Exception as e:
 
 # --- Utility functions ---
 
+_PDFIUM_LOCK = threading.Lock()
+
+@profile_stage("encode_base64")
 def encode_image_to_base64(image_bytes):
     return "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode('utf-8')
 
 
-def convert_pdf_to_image_bytes(pdf_bytes):
+@profile_stage("render")
+def convert_pdf_to_image_bytes(pdf_bytes, scale=2):
     """Converts the first page of a PDF to JPEG image bytes using pypdfium2."""
     try:
-        pdf_doc = pdfium.PdfDocument(pdf_bytes)
-        page = pdf_doc[0]
-        image_pil = page.render(scale=2).to_pil()
+        # pdfium is not thread-safe; renders from the async pipeline's thread pool are serialised.
+        with _PDFIUM_LOCK:
+            pdf_doc = pdfium.PdfDocument(pdf_bytes)
+            page = pdf_doc[0]
+            image_pil = page.render(scale=scale).to_pil()
 
-        if image_pil.mode == 'RGBA':
-            image_pil = image_pil.convert('RGB')
+            if image_pil.mode == 'RGBA':
+                image_pil = image_pil.convert('RGB')
 
-        buf = io.BytesIO()
-        image_pil.save(buf, format='JPEG', quality=95)
-        pdf_doc.close()
+            buf = io.BytesIO()
+            image_pil.save(buf, format='JPEG', quality=95)
+            pdf_doc.close()
         return buf.getvalue()
     except Exception as e:
         print(f"Error converting PDF with pypdfium2: {e}")
         return None
 
 
-def get_rotation_suggestion_from_ai(image_bytes, filename="unknown"):
-    """
-    Uses GPT-4o to determine the necessary rotation for an engineering drawing.
-    (This function remains unchanged, using gpt-4o and base64).
-    """
+def build_rotation_payload(image_bytes, model=ORIENTATION_MODEL, ask_confidence=False):
+    """Builds the payload that asks for the rotation needed to make the drawing upright."""
     base64_image = encode_image_to_base64(image_bytes)
     
     system_prompt = (
@@ -200,9 +181,13 @@ def get_rotation_suggestion_from_ai(image_bytes, filename="unknown"):
       "required": ["rotation_angle_ccw", "reasoning"]
     }}
     """
+    if ask_confidence:
+        user_prompt_template += (
+            '\n    Also include a "confidence" property: a number from 0 to 1 giving how sure you are of the angle.\n'
+        )
 
     payload = {
-        "model": "gpt-4o", 
+        "model": model,
         "messages": [
             {"role": "system", "content": system_prompt},
             {
@@ -217,6 +202,30 @@ def get_rotation_suggestion_from_ai(image_bytes, filename="unknown"):
         "temperature": 0,
         "response_format": {"type": "json_object"}
     }
+    return payload
+
+
+def parse_rotation_angle(response_json):
+    """Returns the suggested counter-clockwise rotation, or 0 if the answer is not a valid angle."""
+    return rotation_angle_from_data(parse_completion_content(response_json))
+
+
+def rotation_angle_from_data(data):
+    angle = data.get("rotation_angle_ccw", 0)
+    if angle in [0, 90, 180, 270]:
+        print(f"-> AI suggests {angle}° rotation. Reason: {data.get('reasoning', 'N/A')}")
+        return angle
+    else:
+        print(f"-> AI returned an invalid angle: {angle}. Defaulting to 0.")
+        return 0
+
+
+def get_rotation_suggestion_from_ai(image_bytes, filename="unknown"):
+    """
+    Uses GPT-4o to determine the necessary rotation for an engineering drawing.
+    (This function remains unchanged, using gpt-4o and base64).
+    """
+    payload = build_rotation_payload(image_bytes)
     local_headers = {
         "Authorization": f"Bearer {OPENAI_API_KEY}", 
         "Content-Type": "application/json"
@@ -225,22 +234,13 @@ def get_rotation_suggestion_from_ai(image_bytes, filename="unknown"):
         print(f"-> AI checking orientation for {filename}...")
         response = requests.post("https://api.openai.com/v1/chat/completions", headers=local_headers, json=payload, timeout=30)
         response.raise_for_status()
-        
-        content = response.json()["choices"][0]["message"]["content"]
-        data = json.loads(content)
-        
-        angle = data.get("rotation_angle_ccw", 0)
-        if angle in [0, 90, 180, 270]:
-            print(f"-> AI suggests {angle}° rotation. Reason: {data.get('reasoning', 'N/A')}")
-            return angle
-        else:
-            print(f"-> AI returned an invalid angle: {angle}. Defaulting to 0.")
-            return 0
+        return parse_rotation_angle(response.json())
     except Exception as e:
         print(f"-> Error during AI orientation check for {filename}: {e}. Defaulting to no rotation.")
         return 0
 
 
+@profile_stage("rotate")
 def rotate_image(image_bytes, angle_ccw):
     if angle_ccw == 0:
         return image_bytes
@@ -262,6 +262,7 @@ def rotate_image(image_bytes, angle_ccw):
         return image_bytes
 
 
+@profile_stage("upscale")
 def try_upscale(image_bytes):
     if not upscale_client:
         print("-> Upscaling client not available. Skipping.")
@@ -289,6 +290,21 @@ def try_upscale(image_bytes):
             os.remove(temp_output_path)
 
 
+def prepare_drawing_image(file_bytes, filename="unknown", orient=True):
+    """Runs the local stages (PDF render, orientation, rotation) and returns the image bytes or None."""
+    if file_bytes[:4] == b'%PDF':
+        image = convert_pdf_to_image_bytes(file_bytes)
+        if not image:
+            return None
+    else:
+        image = file_bytes
+    if orient:
+        angle = get_rotation_suggestion_from_ai(image, filename)
+        if angle != 0:
+            image = rotate_image(image, angle)
+    return image
+
+
 # --- NEW: Image Upload Function ---
 def upload_to_imgbb(image_bytes):
     """Uploads image bytes to imgbb and returns the public URL."""
@@ -318,26 +334,39 @@ def upload_to_imgbb(image_bytes):
 
 
 
-def extract_feature_batch(image_url, features, filename, batch_name):
-    """MODIFIED: Accepts an image_url and uses o4 mini model."""
-    local_headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
+def build_extraction_payload(image_url, features, model=EXTRACTION_MODEL, reasoning_effort=None,
+                             ask_confidence=False, template=None):
+    """
+    Builds the chat-completions payload used to extract one feature batch. The model
+    routing cascade passes its tier's model and reasoning effort, and asks for a
+    self-reported confidence. `template` is a compiled schema_registry template
+    (default: cylinder); templates with their own instructions get a generic prompt.
+    """
+    template = template or CYLINDER_TEMPLATE
     minimal_schema = {
     "type": "object",
     "properties": {
-        k: FULL_SCHEMA["properties"][k] for k in features
-    } | {
-        "close_length_reasoning": {
-            "type": "string",
-            "description": "Step-by-step reasoning and justification for the extracted close length value. Mention what values were used, whether it was explicitly found or inferred, and how."
-        }
-    },
-    "required": features + ["close_length_reasoning"]
+        k: template["properties"][k] for k in features
+    } | template["extra_properties"],
+    "required": features + list(template["extra_properties"])
 }
-    user_msg = (
+    if ask_confidence:
+        minimal_schema["properties"][model_router.CONFIDENCE_FIELD] = {
+            "type": "number",
+            "description": "How sure you are, from 0 to 1, that every extracted value is correct."
+        }
+        minimal_schema["required"] = minimal_schema["required"] + [model_router.CONFIDENCE_FIELD]
+    if template["instructions"]:
+        user_msg = (
+            f"{template['instructions']}\n\n"
+            "OUTPUT REQUIREMENTS:\n"
+            "- Respond only with a JSON object exactly matching the JSON schema below.\n"
+            '- Use "NA" for uninferable values.\n'
+            "- No additional text, explanations, or markdown outside the JSON.\n\n"
+            f"JSON SCHEMA:\n{json.dumps(minimal_schema, indent=2)}"
+        )
+    else:
+        user_msg = (
         f'''YOU MUST EXTRACT 100% OF ALL PARAMETERS DEFINED IN THE JSON SCHEMA BELOW — NO EXCEPTIONS.
 
 ABSOLUTE EXTRACTION RULES:
@@ -450,10 +479,10 @@ NOW ANALYZE THIS CYLINDER DRAWING AND EXTRACT ALL PARAMETERS INTO THE JSON OBJEC
     )
     payload = {
         #"model": "gpt-4o-mini", 
-        "model": "o4-mini-2025-04-16", # CHANGED to reasoning model
+        "model": model, # CHANGED to reasoning model
         # "reasoning": {"effort": "high"},
         "messages": [
-            {"role": "system", "content": SYSTEM_CONTENT_ANALYSIS},
+            {"role": "system", "content": template["system_prompt"] or SYSTEM_CONTENT_ANALYSIS},
             {"role": "user", "content": [
                 {"type": "text", "text": user_msg},
                 {"type": "image_url", "image_url": {"url": image_url, "detail": "high"}}
@@ -463,23 +492,36 @@ NOW ANALYZE THIS CYLINDER DRAWING AND EXTRACT ALL PARAMETERS INTO THE JSON OBJEC
         # "temperature": 0,
         #"response_format": {"type": "json_object"}
     }
-    print(f"-> Analyzing {batch_name} for '{filename}'...")
-    print(payload)
-    resp = requests.post(API_URL, headers=local_headers, json=payload)
-    print(resp.json())
-    resp.raise_for_status()
-    content = resp.json()["choices"][0]["message"]["content"]
+    if reasoning_effort:
+        payload["reasoning_effort"] = reasoning_effort
+    return payload
+
+
+def parse_completion_content(response_json):
+    """Returns the JSON object a chat-completions response carries in its message content."""
+    content = response_json["choices"][0]["message"]["content"]
     if isinstance(content, str):
         content = json.loads(content)
     return content
 
 
-def validate_feature_batch(image_url, extracted, filename, batch_name):
+def extract_feature_batch(image_url, features, filename, batch_name):
     """MODIFIED: Accepts an image_url and uses o4 mini model."""
     local_headers = {
         "Authorization": f"Bearer {OPENAI_API_KEY}",
         "Content-Type": "application/json"
     }
+    payload = build_extraction_payload(image_url, features)
+    print(f"-> Analyzing {batch_name} for '{filename}'...")
+    print(payload)
+    resp = requests.post(API_URL, headers=local_headers, json=payload, timeout=STAGE_TIMEOUTS["extraction"])
+    print(resp.json())
+    resp.raise_for_status()
+    return parse_completion_content(resp.json())
+
+
+def build_validation_payload(image_url, extracted, model=EXTRACTION_MODEL, reasoning_effort=None):
+    """Builds the payload that re-checks an extracted batch against the drawing."""
     user_msg = (
     "Please validate the following extracted parameters against the attached cylinder drawing image."
     "Validation Instructions:"
@@ -492,7 +534,7 @@ def validate_feature_batch(image_url, extracted, filename, batch_name):
     + json.dumps(extracted, indent=2)
     )
     payload = {
-        "model": "o4-mini-2025-04-16", 
+        "model": model,
         "messages": [
             {"role": "system", "content": SYSTEM_CONTENT_VALIDATOR},
             {"role": "user", "content": [
@@ -504,133 +546,694 @@ def validate_feature_batch(image_url, extracted, filename, batch_name):
         # "temperature": 0,
        # "response_format": {"type": "json_object"}
     }
+    if reasoning_effort:
+        payload["reasoning_effort"] = reasoning_effort
+    return payload
+
+
+def validate_feature_batch(image_url, extracted, filename, batch_name):
+    """MODIFIED: Accepts an image_url and uses o4 mini model."""
+    local_headers = {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    payload = build_validation_payload(image_url, extracted)
     print(f"-> Validating {batch_name} for '{filename}'...")
-    resp = requests.post(API_URL, headers=local_headers, json=payload)
+    resp = requests.post(API_URL, headers=local_headers, json=payload, timeout=STAGE_TIMEOUTS["extraction"])
     print("\n\n\n\n\n\n\n\n\n\n\n")
     print(resp.json(),"validation")
     resp.raise_for_status()
-    content = resp.json()["choices"][0]["message"]["content"]
-    if isinstance(content, str):
-        content = json.loads(content)
-    return content
+    return parse_completion_content(resp.json())
 
 
-def process_single_file(file_bytes, filename="uploaded_file"):
+def build_title_block_payload(image_url):
     """
-    Accepts raw bytes, runs the full pipeline, and YIELDS status updates.
-    MODIFIED to upload the image to ImgBB once and reuse the URL.
+    Cheap title-block read (drawing number and revision only) used to look a drawing up
+    in the result store before running the full extraction.
     """
+    return {
+        "model": TITLE_BLOCK_MODEL,
+        "messages": [
+            {"role": "system", "content": "You read the title block of engineering drawings. Respond only with a JSON object."},
+            {"role": "user", "content": [
+                {"type": "text", "text": (
+                    "Read the title block of this drawing (usually bottom-right). "
+                    'Return {"drawing_number": "...", "revision": "..."}. '
+                    'Drawing number labels: "DWG NO", "DRG NO", "PART NO". Revision labels: "REV", "Revision". '
+                    'Use "NA" if the drawing number is not legible and "00" if no revision is given.'
+                )},
+                {"type": "image_url", "image_url": {"url": image_url, "detail": "high"}}
+            ]}
+        ],
+        "max_tokens": 100,
+        "temperature": 0,
+        "response_format": {"type": "json_object"}
+    }
+
+
+# --- Async pipeline ---
+# The network-bound stages run on httpx.AsyncClient and the CPU stages (PDF render,
+# rotation, hashing, base64) on a thread pool, so one process can keep hundreds of
+# drawings in flight. process_single_file() is a thin synchronous wrapper around it.
+
+_CPU_EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="pipeline-cpu")
+
+
+def new_async_client():
+    """AsyncClient shared by the async pipeline. No overall timeout, like the sync requests calls."""
+    return httpx.AsyncClient(timeout=httpx.Timeout(None, connect=30.0),
+                             limits=httpx.Limits(max_connections=200, max_keepalive_connections=50))
+
+
+async def run_cpu(func, *args):
+    """Runs a CPU-bound stage on the pipeline's thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(_CPU_EXECUTOR, func, *args)
+
+
+async def post_chat_async(client, payload, timeout=None):
+    """POSTs a chat-completions payload and returns the decoded response JSON."""
+    local_headers = {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    kwargs = {"timeout": timeout} if timeout is not None else {}
+    resp = await client.post(API_URL, headers=local_headers, json=payload, **kwargs)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def stream_chat_async(client, payload, on_field, timeout=None):
+    """
+    Streamed counterpart of post_chat_async(): reads the completion as server-sent events and
+    calls on_field(key, value) for each top-level field of the answer as soon as its value is
+    complete. Returns a response-shaped dict (content already parsed, usage from the last
+    chunk). Raises MalformedStream, dropping the connection, as soon as the text cannot be the
+    expected JSON object.
+    """
+    local_headers = {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    kwargs = {"timeout": timeout} if timeout is not None else {}
+    payload = dict(payload, stream=True, stream_options={"include_usage": True})
+    parser = IncrementalObjectParser()
+    usage = None
+    async with client.stream("POST", API_URL, headers=local_headers, json=payload, **kwargs) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if chunk.get("error"):
+                raise RuntimeError(f"Stream error: {chunk['error']}")
+            usage = chunk.get("usage") or usage
+            for choice in chunk.get("choices") or []:
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    for key, value in parser.feed(delta):
+                        on_field(key, value)
+    return {"choices": [{"message": {"content": parser.finish()}}], "usage": usage}
+
+
+async def run_cascade_async(client, stage, build_payload, check, stats, timeout=None, tiers=None, on_field=None,
+                            fields=(), deadline=None, call_timeout=None):
+    """
+    Calls the tiers of the routing policy in order until one gives an accepted answer; the
+    policy is resolved from the `fields` the call reads, else from the `stage` name.
+    build_payload(tier) returns the request payload; check(data, confidence) returns the
+    reasons to escalate (empty to accept). The last tier's answer is returned even if it
+    fails the checks; if its request fails, the error is raised. Calls are hedged per
+    stage and tier when hedging is enabled. `tiers` overrides the stage's routing policy.
+    With `on_field`, answers are streamed (see stream_chat_async); a malformed stream counts
+    as a failed request, and an escalated tier's values arrive after the ones it replaces.
+    With a `deadline` (the file's hedging.Deadline), every tier's call gets its own
+    `call_timeout` within the file's remaining budget; a call that runs out escalates like
+    a failed request, unless the file's budget is spent.
+    """
+    tiers = tiers or model_router.tiers_for(stage, fields)
+    for n, tier in enumerate(tiers, start=1):
+        payload = await run_cpu(build_payload, tier)
+        started = time.perf_counter()
+        hedge_key = f"{stage}@{tier['model']}/{tier.get('reasoning_effort') or 'default'}"
+        try:
+            if on_field:
+                # Only a tier's first request shows its fields; a hedged duplicate streams silently.
+                requests_made = 0
+
+                def make_call():
+                    nonlocal requests_made
+                    requests_made += 1
+                    forward = on_field if requests_made == 1 else (lambda key, value: None)
+                    return stream_chat_async(client, payload, forward, timeout=timeout)
+            else:
+                make_call = lambda: post_chat_async(client, payload, timeout=timeout)
+            call = HEDGER.call(hedge_key, make_call)
+            if deadline is not None:
+                call = deadline.run(stage, call, timeout=call_timeout)
+            response = await call
+            data = parse_completion_content(response)
+        except Exception as e:
+            if n == len(tiers) or (deadline is not None and deadline.remaining() <= 0):
+                stats.record(stage, tier, time.perf_counter() - started, None)
+                raise
+            reasons = [f"request failed: {e}"]
+            response, data = {}, None
+        else:
+            reasons = check(data, model_router.pop_confidence(data))
+            if reasons and n == len(tiers):
+                print(f"-> {stage}: keeping {tier['model']} answer from the last tier ({', '.join(reasons)})")
+                reasons = []
+        stats.record(stage, tier, time.perf_counter() - started, response.get("usage"), "; ".join(reasons) or None)
+        if not reasons:
+            return data
+        print(f"-> {stage}: escalating from {tier['model']} ({', '.join(reasons)})")
+
+
+async def get_rotation_suggestion_async(client, image_bytes, filename="unknown", stats=None):
+    stats = stats if stats is not None else model_router.RoutingStats()
     try:
+        print(f"-> AI checking orientation for {filename}...")
+        data = await run_cascade_async(
+            client, "orientation",
+            lambda tier: build_rotation_payload(image_bytes, tier["model"], ask_confidence=True),
+            model_router.orientation_reasons, stats, timeout=30
+        )
+        return rotation_angle_from_data(data)
+    except Exception as e:
+        print(f"-> Error during AI orientation check for {filename}: {e}. Defaulting to no rotation.")
+        return 0
+
+
+async def upload_to_imgbb_async(client, image_bytes):
+    """Async counterpart of upload_to_imgbb()."""
+    if not IMGBB_API_KEY:
+        print("-> Error: IMGBB_API_KEY is not set. Cannot upload image.")
+        return None
+
+    print("-> Uploading image to ImgBB for analysis...")
+    try:
+        response = await client.post(
+            "https://api.imgbb.com/1/upload",
+            params={"key": IMGBB_API_KEY},
+            files={"image": image_bytes}
+        )
+        response.raise_for_status()
+        data = response.json()
+        if data.get("success"):
+            image_url = data["data"]["url"]
+            print(f"-> ImgBB upload successful: {image_url}")
+            return image_url
+        else:
+            print(f"-> ImgBB upload failed. Response: {data}")
+            return None
+    except Exception as e:
+        print(f"-> Error during ImgBB upload: {e}")
+        return None
+
+
+async def read_title_block_async(client, image_url, filename, stats=None):
+    """Returns {"drawing_number", "revision"} read from the title block, or {} on failure. The call is recorded in `stats`."""
+    tier = {"model": TITLE_BLOCK_MODEL}
+    started = time.perf_counter()
+    response = {}
+    try:
+        print(f"-> Reading title block for '{filename}'...")
+        response = await post_chat_async(client, build_title_block_payload(image_url), timeout=30)
+        return parse_completion_content(response)
+    except Exception as e:
+        print(f"-> Title block read failed for {filename}: {e}")
+        return {}
+    finally:
+        if stats is not None:
+            stats.record("title_block", tier, time.perf_counter() - started, response.get("usage"))
+
+
+async def extract_feature_batch_async(client, image_url, features, filename, batch_name, stats=None, tiers=None,
+                                      template=None, on_field=None, deadline=None):
+    """
+    Extracts one feature batch through the batch's routing policy (cheapest tier first).
+    With `on_field`, the answer is streamed and on_field(key, value) called per completed field.
+    With a `deadline`, each call is limited to STAGE_TIMEOUTS["extraction"].
+    """
+    print(f"-> Analyzing {batch_name} for '{filename}'...")
+    return await run_cascade_async(
+        client, batch_name,
+        lambda tier: build_extraction_payload(image_url, features, tier["model"], tier.get("reasoning_effort"),
+                                              ask_confidence=True, template=template),
+        lambda data, confidence: model_router.escalation_reasons(data, features, confidence),
+        stats if stats is not None else model_router.RoutingStats(), tiers=tiers, on_field=on_field, fields=features,
+        deadline=deadline, call_timeout=STAGE_TIMEOUTS["extraction"]
+    )
+
+
+async def validate_feature_batch_async(client, image_url, extracted, features, filename, batch_name, stats=None,
+                                       tiers=None, on_field=None, deadline=None):
+    """Async validate_feature_batch(), routed by its fields like the extraction, under the stage 'validate_<batch>'."""
+    print(f"-> Validating {batch_name} for '{filename}'...")
+    return await run_cascade_async(
+        client, f"validate_{batch_name}",
+        lambda tier: build_validation_payload(image_url, extracted, tier["model"], tier.get("reasoning_effort")),
+        lambda data, confidence: model_router.escalation_reasons(data, features, confidence),
+        stats if stats is not None else model_router.RoutingStats(), tiers=tiers, on_field=on_field, fields=features,
+        deadline=deadline, call_timeout=STAGE_TIMEOUTS["validation"]
+    )
+
+
+def _stored_result(record, matched_by, routing=None):
+    """Final-result event for a drawing answered from the result store."""
+    return {
+        "final_result": {
+            "data": record["data"],
+            "image": None,
+            "store_match": {"matched_by": matched_by, "filename": record["filename"], "id": record["id"]},
+            "routing": routing.summary() if routing is not None else None
+        },
+        "progress": 1.0
+    }
+
+
+def pin_feature_batches(config=None):
+    """
+    Returns `config` with its feature batches planned, so a run keeps one plan even if
+    field_stats.json changes while it runs. Results record the plan in their provenance.
+    """
+    config = dict(config or {})
+    if not config.get("feature_batches"):
+        merged = dict(PIPELINE_CONFIG, **config)
+        config["feature_batches"] = plan_feature_groups(merged["template"], merged["optional_features"])
+    return config
+
+
+async def process_single_file_async(file_bytes, filename="uploaded_file", store=None, reuse_stored=True, client=None,
+                                    deadline_s=FILE_DEADLINE_S, config=None, duplicates=None):
+    """
+    Async generator version of process_single_file(): yields the same status, final_result and
+    error events, plus a "field" event per extracted value. `config` overrides PIPELINE_CONFIG;
+    results are saved to and reused from `store`, and every stage runs within `deadline_s`.
+    """
+    config = dict(PIPELINE_CONFIG, **(config or {}))
+    template = get_template(config["template"])
+    feature_batches = config["feature_batches"] or plan_feature_groups(template["name"], config["optional_features"])
+    planned_fields = [f for fields in feature_batches.values() for f in fields]
+
+    def covers_plan(record):
+        # A stored result only answers this run if it has every field this run would extract.
+        return record and all(f in record["data"] for f in planned_fields)
+
+    started = time.monotonic()
+    deadline = Deadline(deadline_s)
+    # Other copies of this drawing in the run wait on `own` for this file's record.
+    own = asyncio.get_running_loop().create_future() if duplicates is not None else None
+    drawing_hash = None
+
+    def save(data, provenance):
+        """Stores this file's result, if there is a store, and hands the record to the run's copies."""
+        row_id = None
+        if store is not None:
+            row_id = store.save(file_hash, filename, data, provenance,
+                                drawing_hash["hashes"][0] if drawing_hash else None,
+                                pack_detail(drawing_hash["detail"]) if drawing_hash else None)
+        if own is not None and not own.done():
+            own.set_result({"id": row_id, "filename": filename, "data": data, "provenance": provenance})
+
+    def reuse(record, matched_by, turns=0, routing=None, **overrides):
+        """
+        Saves this file as a copy of `record`, whose page is this one turned `turns` quarter turns.
+        The provenance (models, routing, plan) is the stored one, as that run produced the data.
+        """
+        provenance = dict(record["provenance"], filename=filename, matched_by=matched_by, matched_id=record["id"],
+                          rotation_ccw=(record["provenance"].get("rotation_ccw", 0) + 90 * turns) % 360)
+        provenance.update(overrides)
+        save(record["data"], provenance)
+        return _stored_result(record, matched_by, routing)
+
+    own_client = client is None
+    if own_client:
+        client = new_async_client()
+    try:
+        # --- Stage 0: Result store lookup by content, then identical files of this run ---
+        file_hash = await run_cpu(content_hash, file_bytes) if store is not None or duplicates is not None else None
+        if store is not None and reuse_stored:
+            stored = store.get_by_hash(file_hash)
+            if covers_plan(stored):
+                yield {"status": "Found identical file in the result store.", "progress": 0.9}
+                yield _stored_result(stored, "content_hash")
+                return
+        if duplicates is not None:
+            leader = duplicates.join_content(file_hash, own)
+            if leader is not None:
+                yield {"status": "Waiting for an identical file of this run...", "progress": 0.05}
+                record = await deadline.run("duplicate", asyncio.shield(leader))
+                if covers_plan(record):
+                    yield reuse(record, "content_hash")
+                    return
+
         # --- Stage 1: Pre-processing (Unchanged) ---
         yield {"status": "Preparing file...", "progress": 0.05}
         if file_bytes[:4] == b'%PDF':
             yield {"status": "Converting PDF to image...", "progress": 0.1}
-            image = convert_pdf_to_image_bytes(file_bytes)
+            image = await deadline.run("render", run_cpu(convert_pdf_to_image_bytes, file_bytes, config["render_scale"]))
             if not image:
                 yield {"error": "Failed to convert PDF to image."}
                 return
         else:
             image = file_bytes
-        
+
+        # --- Stage 1a: Near-duplicates in the result store or earlier in this run ---
+        # Found by perceptual hash and confirmed on the detail thumbnail, without any model call.
+        if config["dedup"] and (store is not None or duplicates is not None):
+            drawing_hash = await run_cpu(hash_drawing, image)
+        if drawing_hash and store is not None and reuse_stored:
+            for stored in store.find_similar(drawing_hash["hashes"]):
+                if covers_plan(stored) and stored["detail"] and \
+                        same_drawing(drawing_hash["detail"], unpack_detail(stored["detail"]), stored["rotation"]):
+                    yield {"status": f"Found a near-duplicate ({stored['filename']}) in the result store.", "progress": 0.9}
+                    yield reuse(stored, "near_duplicate", stored["rotation"])
+                    return
+        if drawing_hash and duplicates is not None:
+            match = duplicates.join_similar(drawing_hash, own)
+            if match:
+                leader, turns = match
+                yield {"status": "Waiting for a near-identical drawing of this run...", "progress": 0.15}
+                record = await deadline.run("duplicate", asyncio.shield(leader))
+                if covers_plan(record):
+                    yield reuse(record, "near_duplicate", turns)
+                    return
+
         '''if upscale_client:
             yield {"status": "Upscaling image for better clarity...", "progress": 0.15}
-            image = try_upscale(image)'''
+            image = await run_cpu(try_upscale, image)'''
 
-        yield {"status": "AI (GPT-4o) is checking orientation...", "progress": 0.25}
-        angle = get_rotation_suggestion_from_ai(image, filename)
+        routing = model_router.RoutingStats()
+        angle = 0
+        if config["orient"]:
+            yield {"status": "AI is checking orientation...", "progress": 0.25}
+            try:
+                angle = await deadline.run("orientation", get_rotation_suggestion_async(client, image, filename, routing))
+            except DeadlineExceeded as e:
+                print(f"-> Orientation check for {filename} cancelled: {e}. Defaulting to no rotation.")
         if angle != 0:
             yield {"status": f"Rotating image by {angle} degrees...", "progress": 0.30}
-            image = rotate_image(image, angle)
+            image = await run_cpu(rotate_image, image, angle)
 
-        # --- NEW Stage: Upload to ImgBB ---
-        yield {"status": "Uploading image for analysis...", "progress": 0.35}
-        image_url = upload_to_imgbb(image)
+        # --- NEW Stage: Upload to ImgBB (or inline the image) ---
+        if config["image_transport"] == "base64":
+            image_url = await run_cpu(encode_image_to_base64, image)
+        else:
+            yield {"status": "Uploading image for analysis...", "progress": 0.35}
+            image_url = await deadline.run("upload", upload_to_imgbb_async(client, image))
         if not image_url:
             yield {"error": "Failed to upload image to hosting service. Cannot proceed."}
             return
 
+        # "models" and "routing" are filled in from the calls once the extraction is done.
+        provenance = {
+            "filename": filename,
+            "template": template["name"],
+            "feature_batches": feature_batches,
+            "rotation_ccw": angle,
+            # Inline base64 images are not worth keeping in the store.
+            "image_url": image_url if config["image_transport"] != "base64" else None,
+        }
+
+        # --- Stage 1b: Result store lookup by drawing number / revision ---
+        # Only worth a title-block call when a stored result has a drawing number it could match.
+        if store is not None and reuse_stored and store.has_drawing_numbers():
+            yield {"status": "Reading title block...", "progress": 0.37}
+            try:
+                title = await deadline.run("title_block", read_title_block_async(client, image_url, filename, routing))
+            except DeadlineExceeded as e:
+                print(f"-> Title block read for {filename} cancelled: {e}")
+                title = {}
+            stored = store.get_by_drawing(title.get("drawing_number"), title.get("revision"))
+            if covers_plan(stored):
+                yield {"status": f"Drawing {title.get('drawing_number')} rev {title.get('revision')} already extracted.", "progress": 0.9}
+                yield reuse(stored, "drawing_revision", routing=routing, rotation_ccw=angle,
+                            image_url=provenance["image_url"])
+                return
+
+        # --- Stage 2: Feature batches, requested concurrently (each validated right after, if enabled) ---
+        # Streamed fields are queued by the batch tasks and yielded from the loop below as
+        # "provisional" (the tier may still escalate); each batch's accepted answer is then
+        # yielded field by field with "provisional": False.
+        field_queue = deque()
+        fields_ready = asyncio.Event()
+
+        def field_callback(batch_name, features):
+            wanted = set(features)
+
+            def on_field(key, value):
+                if key in wanted:
+                    field_queue.append((batch_name, key, value, True))
+                    fields_ready.set()
+            return on_field if config["stream"] else None
+
+        async def run_batch(batch_name, features):
+            tiers = config["extraction_tiers"]
+            on_field = field_callback(batch_name, features)
+            extracted = await extract_feature_batch_async(client, image_url, features, filename, batch_name, routing,
+                                                          tiers, template, on_field, deadline)
+            if config["validation"]:
+                extracted = await validate_feature_batch_async(client, image_url, extracted, features, filename,
+                                                               batch_name, routing, tiers, on_field, deadline)
+            return extracted
+
+        n_batches = len(feature_batches)
+        yield {"status": f"Analyzing parameters ({n_batches} batches in parallel)...", "progress": 0.4}
+        # Each model call of a batch has its own timeout; the batch as a whole only has the file's budget.
+        tasks = {
+            asyncio.ensure_future(deadline.run(batch_name, run_batch(batch_name, features),
+                                               timeout=deadline.remaining())): batch_name
+            for batch_name, features in feature_batches.items()
+        }
+        pending = set(tasks)
+        batch_results = {}
+        shown = {}
+        first_value_s = None
+        try:
+            while pending:
+                waiter = asyncio.ensure_future(fields_ready.wait())
+                done, _ = await asyncio.wait(pending | {waiter}, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                fields_ready.clear()
+                finished = done & pending
+                pending -= finished
+                for task in finished:
+                    batch_name = tasks[task]
+                    batch_results[batch_name] = task.result()
+                    # The accepted answer replaces whatever was streamed for this batch.
+                    field_queue.extend((batch_name, key, value, False) for key, value in batch_results[batch_name].items()
+                                       if key in feature_batches[batch_name])
+                while field_queue:
+                    batch_name, key, value, provisional = field_queue.popleft()
+                    if provisional and (batch_name in batch_results or shown.get(key) == (value, True)):
+                        continue  # late value of a finished batch, or an escalation that agreed so far
+                    if first_value_s is None:
+                        first_value_s = time.monotonic() - started
+                        LATENCIES.record("first_value", first_value_s)
+                    shown[key] = (value, provisional)
+                    yield {"status": f"Read {key}: {value}", "field": key, "value": value, "batch": batch_name,
+                           "provisional": provisional,
+                           "progress": 0.4 + 0.5 * len(shown) / max(1, len(planned_fields))}
+                for task in finished:
+                    yield {"status": f"Finished {tasks[task]} ({len(batch_results)}/{n_batches})...",
+                           "progress": 0.4 + 0.5 * len(shown) / max(1, len(planned_fields))}
+        finally:
+            for task in pending:
+                task.cancel()
+
         results = {}
-        
-        # --- Stage 2: Batch 1 (Core Parameters) ---
-        yield {"status": "Analyzing core parameters (Batch 1/2)...", "progress": 0.4}
-        ext1 = extract_feature_batch(image_url, IMPORTANT_FEATURES[:6], filename, 'batch1')
-        yield {"status": "Validating core parameters (Batch 1/2)...", "progress": 0.5}
-        # val1 = validate_feature_batch(image_url, ext1, filename, 'batch1')
-        results.update(ext1)
-
-        # --- Stage 3: Batch 2 (Secondary Parameters) ---
-        yield {"status": "Analyzing secondary parameters (Batch 2/2)...", "progress": 0.6}
-        ext2 = extract_feature_batch(image_url, IMPORTANT_FEATURES[6:], filename, 'batch2')
-        yield {"status": "Validating secondary parameters (Batch 2/2)...", "progress": 0.8}
-        # val2 = validate_feature_batch(image_url, ext2, filename, 'batch2')
-        results.update(ext2)
-
-        # --- Stage 4: Batch 3 (Optional Parameters) ---
-        #yield {"status": "Analyzing optional parameters (Batch 3/3)...", "progress": 0.9}
-        #ext3 = extract_feature_batch(image_url, OPTIONAL_FEATURES, filename, 'batch3')
-        #results.update(ext3)
-        #yield {"status": "Validating optional parameters (Batch 3/3)...", "progress": 0.9}
-        #val3 = validate_feature_batch(image_url, ext3, filename, 'batch3')
-        #results.update(val3)
-        
+        for batch_name in feature_batches:
+            results.update(batch_results[batch_name])
+
         yield {"status": "Finalizing results...", "progress": 0.9}
+        routing_summary = routing.summary()
+        provenance["models"] = routing_summary["final_models"]
+        provenance["routing"] = routing_summary
+        save(results, provenance)
 
         # --- Final Stage: Yield the result ---
         yield {
             "final_result": {
                 "data": results,
                 # The final image bytes are still available if needed by the frontend
-                "image": image 
+                "image": image,
+                "routing": routing_summary,
+                "time_to_first_value_s": first_value_s
             },
             "progress": 1.0
         }
 
+    except DeadlineExceeded as e:
+        yield {"error": f"Deadline exceeded: {e}"}
     except Exception as e:
         yield {"error": f"An unexpected error occurred in the backend: {str(e)}"}
+    finally:
+        if own is not None and not own.done():
+            own.set_result(None)  # failed or cancelled: the run's copies are processed on their own
+        LATENCIES.record("file", time.monotonic() - started)
+        if own_client:
+            await client.aclose()
+
+
+def _iterate_async_gen(agen):
+    """Drives an async generator from synchronous code on a private event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
+
+
+def process_single_file(file_bytes, filename="uploaded_file", store=None, reuse_stored=True, config=None):
+    """
+    Accepts raw bytes, runs the full pipeline, and YIELDS status updates.
+    Synchronous wrapper around process_single_file_async(), kept for the Streamlit
+    frontend and scripts; see there for the store behaviour.
+    """
+    yield from _iterate_async_gen(process_single_file_async(file_bytes, filename, store, reuse_stored, config=config))
+
+
+async def process_many_async(sources, concurrency=32, store=None, reuse_stored=True, client=None, config=None):
+    """
+    Runs many drawings through the async pipeline with at most `concurrency` in flight and
+    yields (source, event) pairs as they happen. `sources` is an iterable, or an async
+    iterable, of file sources (file_source.FileSource / UploadSource: `.name` and `.read()`);
+    the next source is only taken, and read, once a slot is free. Every drawing ends with
+    exactly one final_result or error event. Pass `client` to share one httpx.AsyncClient
+    across calls; `config` is passed to process_single_file_async() with the feature batches
+    planned once, so every drawing of the run uses the same plan. With config["dedup"],
+    identical and near-identical drawings of the run are processed once and the other copies
+    reuse that result. Closing or cancelling the consumer cancels every drawing still in flight.
+    """
+    config = pin_feature_batches(config)
+    duplicates = RunDuplicates() if dict(PIPELINE_CONFIG, **config)["dedup"] else None
+    queue = asyncio.Queue(maxsize=concurrency * 4)
+    semaphore = asyncio.Semaphore(concurrency)
+    done_marker = object()
+
+    async def run_one(source, client):
+        try:
+            print(f"→ Processing {source.name}")
+            file_bytes = await run_cpu(source.read)
+            async for event in process_single_file_async(file_bytes, source.name, store, reuse_stored, client,
+                                                         config=config, duplicates=duplicates):
+                await queue.put((source, event))
+        except Exception as e:
+            await queue.put((source, {"error": f"An unexpected error occurred in the backend: {str(e)}"}))
+        finally:
+            semaphore.release()
+
+    async def next_source(iterator):
+        try:
+            if hasattr(iterator, "__anext__"):
+                return await iterator.__anext__()
+            return next(iterator)
+        except (StopIteration, StopAsyncIteration):
+            return done_marker
+
+    async def feed(client):
+        workers = set()
+        error = None
+        iterator = sources.__aiter__() if hasattr(sources, "__aiter__") else iter(sources)
+        try:
+            while True:
+                await semaphore.acquire()
+                source = await next_source(iterator)
+                if source is done_marker:
+                    semaphore.release()
+                    break
+                task = asyncio.ensure_future(run_one(source, client))
+                workers.add(task)
+                task.add_done_callback(workers.discard)
+            if workers:
+                await asyncio.gather(*list(workers))
+        except asyncio.CancelledError:
+            in_flight = list(workers)
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            raise
+        except Exception as e:
+            for task in list(workers):
+                task.cancel()
+            error = e
+        await queue.put((None, done_marker))
+        if error:
+            raise error
+
+    own_client = client is None
+    if own_client:
+        client = new_async_client()
+    feeder = asyncio.ensure_future(feed(client))
+    try:
+        while True:
+            source, event = await queue.get()
+            if event is done_marker:
+                break
+            yield source, event
+        await feeder
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+            await asyncio.gather(feeder, return_exceptions=True)
+        if own_client:
+            await client.aclose()
+
+
+async def _process_folder_async(sources, store):
+    """Runs the drawings of main() through process_many_async; returns (records, routing summaries)."""
+    all_data = []
+    routing_summaries = []
+    async for source, update in process_many_async(sources, store=store):
+        if "error" in update:
+            print(f"ERROR: {source.name}: {update['error']}")
+            all_data.append({"filename": source.name, "data": {"error": update['error']}})
+        elif "final_result" in update:
+            all_data.append({"filename": source.name, "data": update['final_result']['data']})
+            routing_summaries.append(update['final_result'].get('routing'))
+        elif not update.get("provisional"):
+            # Print progress updates to the console; streamed values are logged once accepted
+            print(f"  [{source.name}] [{int(update['progress']*100)}%] {update['status']}")
+    # Drawings finish in any order; report them in listing order.
+    all_data.sort(key=lambda record: record["filename"])
+    return all_data, routing_summaries
 
 
 # --- Main entrypoint ---
 
 def main():
     pdf_dir = r"C:\Users\Omkar\Desktop\Final_code_with_98%_accuracy\data"
-    pdf_files = [os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')]
-    
-    all_data = []
-    for pdf_path in pdf_files:
-        try:
-            print(f"→ Processing {os.path.basename(pdf_path)}")
-            with open(pdf_path, 'rb') as f:
-                pdf_bytes = f.read()
-
-            final_result = None
-            # The process_single_file is a generator, so we must iterate through it
-            for update in process_single_file(pdf_bytes, filename=os.path.basename(pdf_path)):
-                if "error" in update:
-                    print(f"ERROR: {update['error']}")
-                    final_result = {"filename": os.path.basename(pdf_path), "data": {"error": update['error']}}
-                    break
-                elif "final_result" in update:
-                    # We only care about the final result for this main script
-                    record_data = update['final_result']['data']
-                    final_result = {"filename": os.path.basename(pdf_path), "data": record_data}
-                    break # Exit the loop once we have the final result
-                else:
-                    # Print progress updates to the console
-                    print(f"  [{int(update['progress']*100)}%] {update['status']}")
-            
-            if final_result:
-                all_data.append(final_result)
-
-        except Exception as exc:
-            record = {"filename": os.path.basename(pdf_path), "data": {"error": str(exc)}}
-            all_data.append(record)
+    # Files are listed lazily and each one is read only when a pipeline slot is free.
+    pdf_files = list_files(pdf_dir, patterns=("*.pdf",), recursive=False)
+
+    store = ResultStore()
+    all_data, routing_summaries = asyncio.run(_process_folder_async(pdf_files, store))
+
+    save_results(all_data)
+    print(f"Model routing: {json.dumps(model_router.summarize_runs(routing_summaries), indent=2)}")
+    print(f"Latency: {json.dumps(latency_report(), indent=2)}")
 
+
+@profile_stage("save_results")
+def save_results(all_data, json_path='extracted_data.json', xlsx_path='extracted_data.xlsx'):
+    """
+    Writes the per-file records to the JSON and Excel report files. `all_data` is a list,
+    or a callable returning a fresh iterator so large result sets are streamed twice.
+    """
+    iter_records = all_data if callable(all_data) else (lambda: iter(all_data))
     # Save JSON
-    with open('extracted_data.json', 'w') as outf:
-        json.dump(all_data, outf, indent=2)
+    write_json(iter_records(), json_path)
     # Save Excel
-    df = pd.DataFrame([{'filename': r['filename'], **r['data']} for r in all_data])
-    df.to_excel('extracted_data.xlsx', index=False)
+    write_rows_excel(iter_records, xlsx_path)
     print(" Done: Data saved to JSON and Excel.")
 
 if __name__ == '__main__':
@@ -0,0 +1,246 @@
+"""
+Offline bulk mode for the nightly backlog of archived drawings.
+
+Phase one (`prepare`) runs the local stages for every drawing in a folder
+(render, orient, rotate, host the image, build the prompts) and streams one
+chat-completions request per feature batch into a JSONL file in the OpenAI
+Batch API format.
+
+Phase two (`ingest`) streams a Batch API results file back into the same
+records, JSON and Excel output that `backend12.main()` produces.
+
+Both phases hold at most one drawing (prepare) or the drawings whose batches
+are still outstanding (ingest) in memory, so corpus size is bounded by disk.
+`simulate` writes a results file locally from a requests file so both phases
+can be exercised without any network access.
+
+Usage:
+    python bulk_batch.py prepare <drawings_dir> [--out batch_requests.jsonl] [--no-orient] [--inline-images] [--profile [DIR]]
+    python bulk_batch.py simulate <batch_requests.jsonl> <results.jsonl>
+    python bulk_batch.py ingest <results.jsonl> [--manifest manifest.jsonl] [--json extracted_data.json] [--xlsx extracted_data.xlsx]
+"""
+import os
+import json
+import argparse
+
+import profiling
+from backend12 import (
+    pin_feature_batches, prepare_drawing_image, upload_to_imgbb,
+    encode_image_to_base64, build_extraction_payload, parse_completion_content
+)
+from file_source import list_files
+from report_export import write_json, write_rows_excel
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_REQUESTS_PATH = "batch_requests.jsonl"
+CUSTOM_ID_SEPARATOR = "::"
+
+
+# --- custom_id helpers ---
+
+def make_custom_id(filename, batch_name, batch_index, batch_count):
+    """Encodes the file, its batch, the batch's position in the plan and the number of batches expected."""
+    return CUSTOM_ID_SEPARATOR.join([filename, batch_name, str(batch_index), str(batch_count)])
+
+
+def parse_custom_id(custom_id):
+    filename, batch_name, batch_index, batch_count = custom_id.rsplit(CUSTOM_ID_SEPARATOR, 3)
+    return filename, batch_name, int(batch_index), int(batch_count)
+
+
+def iter_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+# --- Phase one: prepare ---
+
+def prepare(drawings_dir, requests_path=BATCH_REQUESTS_PATH, manifest_path=None, orient=True, inline_images=False):
+    """
+    Runs the local stages for every drawing and streams the batch requests to disk.
+    A manifest line is written per drawing so that ingestion can report drawings
+    that failed locally or never came back from the batch. The feature batches are
+    planned once, so every drawing of the file is split the same way.
+    """
+    manifest_path = manifest_path or os.path.splitext(requests_path)[0] + ".manifest.jsonl"
+    feature_batches = pin_feature_batches()["feature_batches"]
+    print(f"-> Feature batches: {json.dumps(feature_batches)}")
+    n_files = n_requests = 0
+    with open(requests_path, "w", encoding="utf-8") as req_out, \
+            open(manifest_path, "w", encoding="utf-8") as man_out:
+        for source in list_files(drawings_dir):
+            name = source.name
+            n_files += 1
+            print(f"→ Preparing {name}")
+            entry = {"filename": name}
+            try:
+                file_bytes = source.read()
+                image = prepare_drawing_image(file_bytes, filename=name, orient=orient)
+                if not image:
+                    raise ValueError("Failed to convert PDF to image.")
+                image_url = encode_image_to_base64(image) if inline_images else upload_to_imgbb(image)
+                if not image_url:
+                    raise ValueError("Failed to upload image to hosting service.")
+
+                entry["custom_ids"] = []
+                for batch_index, (batch_name, features) in enumerate(feature_batches.items()):
+                    custom_id = make_custom_id(name, batch_name, batch_index, len(feature_batches))
+                    request_line = {
+                        "custom_id": custom_id,
+                        "method": "POST",
+                        "url": BATCH_ENDPOINT,
+                        "body": build_extraction_payload(image_url, features),
+                    }
+                    req_out.write(json.dumps(request_line) + "\n")
+                    entry["custom_ids"].append(custom_id)
+                    n_requests += 1
+            except Exception as e:
+                print(f"ERROR: {name}: {e}")
+                entry["error"] = str(e)
+            man_out.write(json.dumps(entry) + "\n")
+
+    print(f" Done: {n_requests} requests for {n_files} drawings written to {requests_path} (manifest: {manifest_path}).")
+    return requests_path, manifest_path
+
+
+# --- Local results for dry runs ---
+
+def simulate(requests_path, results_path, value="NA"):
+    """Writes a Batch API results file answering every request with `value` for each schema field."""
+    with open(results_path, "w", encoding="utf-8") as out:
+        for i, request_line in enumerate(iter_jsonl(requests_path)):
+            body = request_line["body"]
+            schema_text = body["messages"][1]["content"][0]["text"].rsplit("JSON SCHEMA:", 1)[1]
+            schema = json.JSONDecoder().raw_decode(schema_text.strip())[0]
+            content = {k: value for k in schema["required"]}
+            result_line = {
+                "id": f"batch_req_{i}",
+                "custom_id": request_line["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "request_id": f"req_{i}",
+                    "body": {
+                        "model": body["model"],
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(content)}}],
+                    },
+                },
+                "error": None,
+            }
+            out.write(json.dumps(result_line) + "\n")
+    return results_path
+
+
+# --- Phase two: ingest ---
+
+def _result_line_data(result_line):
+    """Returns the extracted parameters of one results line, or {"error": ...}."""
+    if result_line.get("error"):
+        return {"error": str(result_line["error"])}
+    response = result_line.get("response") or {}
+    if response.get("status_code") != 200:
+        return {"error": f"Batch request failed with status {response.get('status_code')}: {response.get('body')}"}
+    try:
+        return parse_completion_content(response["body"])
+    except Exception as e:
+        return {"error": f"Could not parse model output: {e}"}
+
+
+def _merge_batches(filename, batches):
+    """
+    Combines the batch outputs of one drawing into a single record, in plan order.
+    `batches` maps batch name -> (position in the plan, parsed output).
+    """
+    data, errors = {}, []
+    for batch_name, (_, part) in sorted(batches.items(), key=lambda item: item[1][0]):
+        if "error" in part:
+            errors.append(f"{batch_name}: {part['error']}")
+        else:
+            data.update(part)
+    if errors:
+        data = {"error": "; ".join(errors)}
+    return {"filename": filename, "data": data}
+
+
+def iter_ingested_records(results_path, manifest_path=None):
+    """
+    Streams records out of a results file. A drawing is emitted as soon as all of its
+    batches have arrived, so only drawings with outstanding batches are held in memory.
+    """
+    pending = {}
+    seen = set()
+    for result_line in iter_jsonl(results_path):
+        filename, batch_name, batch_index, batch_count = parse_custom_id(result_line["custom_id"])
+        batches = pending.setdefault(filename, {})
+        batches[batch_name] = (batch_index, _result_line_data(result_line))
+        if len(batches) == batch_count:
+            seen.add(filename)
+            yield _merge_batches(filename, pending.pop(filename))
+
+    for filename in pending:
+        seen.add(filename)
+        yield {"filename": filename, "data": {"error": "Missing batch results for this drawing."}}
+
+    if manifest_path and os.path.exists(manifest_path):
+        for entry in iter_jsonl(manifest_path):
+            if entry["filename"] in seen:
+                continue
+            error = entry.get("error") or "No batch results were returned for this drawing."
+            yield {"filename": entry["filename"], "data": {"error": error}}
+
+
+def ingest(results_path, manifest_path=None, json_path="extracted_data.json", xlsx_path="extracted_data.xlsx"):
+    """Streams the results to a JSONL spool, then writes the JSON and Excel reports from it."""
+    n_records = 0
+    records_path = json_path + ".records.jsonl"
+    with open(records_path, "w", encoding="utf-8") as rec_out:
+        for record in iter_ingested_records(results_path, manifest_path):
+            rec_out.write(json.dumps(record) + "\n")
+            n_records += 1
+
+    try:
+        write_json(iter_jsonl(records_path), json_path)
+        write_rows_excel(lambda: iter_jsonl(records_path), xlsx_path)
+    finally:
+        os.remove(records_path)
+
+    print(f" Done: {n_records} records saved to {json_path} and {xlsx_path}.")
+    return n_records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline bulk extraction via the OpenAI Batch API.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_prep = sub.add_parser("prepare", help="Run local stages and write the batch requests file.")
+    p_prep.add_argument("drawings_dir")
+    p_prep.add_argument("--out", default=BATCH_REQUESTS_PATH)
+    p_prep.add_argument("--manifest", default=None)
+    p_prep.add_argument("--no-orient", action="store_true", help="Skip the AI orientation check.")
+    p_prep.add_argument("--inline-images", action="store_true", help="Embed images as base64 instead of uploading them.")
+    profiling.add_argument(p_prep)
+
+    p_sim = sub.add_parser("simulate", help="Write a local results file for a requests file.")
+    p_sim.add_argument("requests_path")
+    p_sim.add_argument("results_path")
+
+    p_ing = sub.add_parser("ingest", help="Turn a batch results file into the JSON/Excel report.")
+    p_ing.add_argument("results_path")
+    p_ing.add_argument("--manifest", default=None)
+    p_ing.add_argument("--json", default="extracted_data.json")
+    p_ing.add_argument("--xlsx", default="extracted_data.xlsx")
+
+    args = parser.parse_args()
+    profiling.enable_from_args(args)
+    if args.command == "prepare":
+        prepare(args.drawings_dir, args.out, args.manifest, orient=not args.no_orient, inline_images=args.inline_images)
+    elif args.command == "simulate":
+        simulate(args.requests_path, args.results_path)
+    elif args.command == "ingest":
+        ingest(args.results_path, args.manifest, args.json, args.xlsx)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Perceptual-hash deduplication of engineering drawings.
+
+The pipeline hashes every drawing right after rendering it, before the
+orientation check: the page is normalised to a small grayscale thumbnail and
+hashed with a 64-bit DCT hash (pHash). That hash of the page as rendered (not
+rotated upright) is saved with the result in the result store, together with
+the rotation the pipeline applied, and the store keeps the hashes of its
+successful results in a BK-tree so near-duplicates (same sheet exported as PDF
+and PNG, re-scans, copies in several project folders) are found in sub-linear
+time by Hamming distance. Drawings of one run are grouped the same way by
+RunDuplicates, so each group is processed once.
+
+Engineering drawings look alike at 32x32 (white sheet, border, title block),
+so a hash match is only a candidate. It is confirmed locally on a 384x384
+detail thumbnail, where a changed dimension or drawing number shows up as a
+large grey-level difference while re-encoding, re-rendering at another
+resolution or a light blur barely move any pixel. Copies that differ more
+(e.g. scans shifted by a few pixels) are not confirmed and are extracted again.
+
+Usage:
+    drawing_hash = hash_drawing(rendered_page_bytes)
+    for rotation, h in enumerate(drawing_hash["hashes"]):
+        ...
+    same_drawing(drawing_hash["detail"], unpack_detail(stored_detail), rotation)
+"""
+import io
+import zlib
+import numpy as np
+from PIL import Image
+
+from profiling import profile_stage
+
+HASH_SIZE = 8           # 8x8 low-frequency block -> 64-bit hash
+HIGHFREQ_FACTOR = 4     # hash is computed on a 32x32 thumbnail
+DEFAULT_MAX_DISTANCE = 6
+DETAIL_SIZE = 384       # side of the thumbnail that confirms a near-duplicate
+DETAIL_MAX_DIFF = 24    # largest grey-level difference of any thumbnail pixel between copies
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis, so that dct2(x) = M @ x @ M.T."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0, :] = np.sqrt(1.0 / n)
+    return m
+
+
+_DCT = _dct_matrix(HASH_SIZE * HIGHFREQ_FACTOR)
+
+
+def normalized_page(image):
+    """Returns the 32x32 grayscale float array of a PIL page image."""
+    size = HASH_SIZE * HIGHFREQ_FACTOR
+    return np.asarray(image.resize((size, size), Image.Resampling.LANCZOS), dtype=np.float64)
+
+
+def detail_thumbnail(image):
+    """Returns the DETAIL_SIZE x DETAIL_SIZE uint8 grayscale thumbnail of a PIL page image."""
+    # Bilinear, unlike PIL's box filter, gives the same thumbnail for a page turned a quarter turn.
+    return np.asarray(image.resize((DETAIL_SIZE, DETAIL_SIZE), Image.Resampling.BILINEAR), dtype=np.uint8)
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def average_hash(pixels):
+    """64-bit average hash of a normalised page."""
+    small = pixels.reshape(HASH_SIZE, HIGHFREQ_FACTOR, HASH_SIZE, HIGHFREQ_FACTOR).mean(axis=(1, 3))
+    return _bits_to_int(small > small.mean())
+
+
+def dct_hash(pixels):
+    """64-bit DCT hash (pHash) of a normalised page."""
+    coeffs = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only encodes overall brightness, so it is left out of the median.
+    return _bits_to_int(coeffs > np.median(coeffs.ravel()[1:]))
+
+
+def rotation_hashes(pixels):
+    """DCT hashes of the page turned 0/90/180/270 degrees counter-clockwise, so rotated re-scans still match."""
+    return [dct_hash(np.rot90(pixels, k)) for k in range(4)]
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def pack_detail(detail):
+    """Compressed bytes of a detail thumbnail, for the result store."""
+    return zlib.compress(detail.tobytes())
+
+
+def unpack_detail(blob):
+    return np.frombuffer(zlib.decompress(blob), dtype=np.uint8).reshape(DETAIL_SIZE, DETAIL_SIZE)
+
+
+def same_drawing(detail, other_detail, rotation=0):
+    """
+    True if two detail thumbnails show the same drawing: `detail` turned `rotation` quarter
+    turns counter-clockwise differs from `other_detail` by at most DETAIL_MAX_DIFF anywhere.
+    """
+    diff = np.abs(np.rot90(detail, rotation).astype(np.int16) - other_detail.astype(np.int16))
+    return int(diff.max()) <= DETAIL_MAX_DIFF
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes with Hamming distance."""
+
+    def __init__(self):
+        self.root = None  # [hash, item, {distance: child}]
+
+    def add(self, hash_value, item):
+        if self.root is None:
+            self.root = [hash_value, item, {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(hash_value, node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [hash_value, item, {}]
+                return
+            node = child
+
+    def search(self, hash_value, max_distance):
+        """Returns [(distance, item)] for every stored hash within max_distance, closest first."""
+        matches = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = hamming(hash_value, node[0])
+            if d <= max_distance:
+                matches.append((d, node[1]))
+            for child_d, child in node[2].items():
+                if d - max_distance <= child_d <= d + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda m: m[0])
+        return matches
+
+
+class RunDuplicates:
+    """
+    Identical and near-identical drawings of one run. The first drawing of a group registers
+    a future for its result record; the others wait on it instead of being processed.
+    Used from a single event loop, so it needs no lock.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._by_content = {}   # content hash -> future of the group's record
+        self._tree = BKTree()   # page hash -> (detail thumbnail, future of the group's record)
+
+    def join_content(self, file_hash, future):
+        """Returns the future of an identical file already in the run, or registers `future` and returns None."""
+        leader = self._by_content.get(file_hash)
+        if leader is None or (leader.done() and leader.result() is None):
+            self._by_content[file_hash] = future
+            return None
+        return leader
+
+    def join_similar(self, drawing_hash, future):
+        """
+        Returns (future, rotation) of a confirmed near-duplicate already in the run, `rotation`
+        being the quarter turns that bring this page onto it; otherwise registers `future`.
+        """
+        for rotation, h in enumerate(drawing_hash["hashes"]):
+            for _, (detail, leader) in self._tree.search(h, self.max_distance):
+                if leader.done() and leader.result() is None:
+                    continue  # that copy failed; this one is processed instead
+                if same_drawing(drawing_hash["detail"], detail, rotation):
+                    return leader, rotation
+        self._tree.add(drawing_hash["hashes"][0], (drawing_hash["detail"], future))
+        return None
+
+
+@profile_stage("dedup_hash")
+def hash_drawing(image_bytes):
+    """
+    Returns {"hashes": rotation hashes (first is the page as rendered), "detail": detail
+    thumbnail} of a rendered page, or None if it cannot be read.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes)).convert("L")
+        return {"hashes": rotation_hashes(normalized_page(image)), "detail": detail_thumbnail(image)}
+    except Exception as e:
+        print(f"-> Could not hash drawing: {e}")
+        return None
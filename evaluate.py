@@ -0,0 +1,416 @@
+"""
+Golden-set evaluation harness.
+
+Runs a labeled corpus of drawings through one or more pipeline configurations
+(render scale, image transport, feature-batch split, model, validation on/off;
+see backend12.PIPELINE_CONFIG) and reports, per configuration, the exact and
+normalized match rate of every labeled field next to wall time,
+tokens, cost and bytes per drawing.
+
+Labels are a JSON file in either the extracted_data.json layout
+([{"filename": ..., "data": {...}}, ...]) or {filename: {field: value}}, so a
+reviewed export can become the golden set. Configurations are a JSON list of
+PIPELINE_CONFIG overrides with a "name"; feature_batches may be given as a list
+of field lists. Each configuration's feature batches are planned once and
+recorded in its report entry.
+
+Model and upload traffic goes through EvalClient:
+  * live   - real API calls;
+  * record - like replay, but requests missing from the cassette are made for real
+             and saved (one cassette per drawing);
+  * replay - answered from the cassettes, no network or API keys needed.
+Requests are keyed by a hash of their content (payload, or uploaded image), so a
+recorded configuration replays exactly and a changed prompt, model or render is
+reported as a cache miss. Streamed answers are recorded line by line with their
+arrival times, so evaluations run the same streaming path as production and,
+with --replay-latency, reproduce its time to first value.
+
+Usage:
+    python evaluate.py <corpus_dir> <labels.json> [--configs configs.json]
+                       [--mode live|record|replay] [--cassettes eval_cassettes]
+                       [--report eval_report.json] [--replay-latency 0]
+                       [--profile [DIR]]
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import contextlib
+
+import backend12
+import profiling
+from backend12 import (
+    process_single_file_async, new_async_client, pin_feature_batches, IMPORTANT_FEATURES, OPTIONAL_FEATURES
+)
+from file_source import list_files
+from hedging import percentile
+from schema_registry import name_feature_groups
+
+CASSETTE_DIR = "eval_cassettes"
+EVAL_REPORT_PATH = "eval_report.json"
+
+DEFAULT_CONFIGS = [
+    {"name": "baseline"},
+    {"name": "render_scale_1", "render_scale": 1},
+    {"name": "base64_transport", "image_transport": "base64"},
+    {"name": "single_batch", "feature_batches": [IMPORTANT_FEATURES]},
+    {"name": "validation_on", "validation": True},
+    {"name": "optional_fields", "optional_features": True},
+]
+SCORED_FIELDS = IMPORTANT_FEATURES + OPTIONAL_FEATURES
+
+_NA_VALUES = {"", "na", "n/a", "none", "null", "-", "not specified"}
+
+
+# --- Labels and scoring ---
+
+def load_labels(path):
+    """Returns {filename: {field: expected value}} from either supported layout."""
+    with open(path, "r", encoding="utf-8") as f:
+        labels = json.load(f)
+    if isinstance(labels, list):
+        labels = {r["filename"]: r.get("data") or {} for r in labels}
+    return {name: {k: v for k, v in fields.items() if k in SCORED_FIELDS} for name, fields in labels.items()}
+
+
+def normalize_value(value):
+    """Comparable form of a field value: case, spacing, units and NA spellings ignored; numbers compared as numbers."""
+    text = str(value if value is not None else "").strip().lower()
+    if text in _NA_VALUES:
+        return "na"
+    numbers = re.findall(r"\d+(?:\.\d+)?", text.replace(",", ""))
+    if numbers:
+        return "#" + "/".join(str(float(n)) for n in numbers)
+    return re.sub(r"[^a-z0-9]", "", text)
+
+
+def score_drawing(expected, actual):
+    """{field: (exact, normalized)} for every labeled field."""
+    scores = {}
+    for field, want in expected.items():
+        got = (actual or {}).get(field)
+        exact = got is not None and str(got).strip() == str(want).strip()
+        scores[field] = (exact, exact or normalize_value(got) == normalize_value(want))
+    return scores
+
+
+def resolve_config(config):
+    """Turns a configuration from JSON into PIPELINE_CONFIG overrides, with its feature batches planned."""
+    overrides = {k: v for k, v in config.items() if k != "name"}
+    batches = overrides.get("feature_batches")
+    if isinstance(batches, list):
+        overrides["feature_batches"] = name_feature_groups(batches)
+    if "model" in overrides:
+        tier = {"model": overrides.pop("model")}
+        if "reasoning_effort" in overrides:
+            tier["reasoning_effort"] = overrides.pop("reasoning_effort")
+        overrides["extraction_tiers"] = [tier]
+    return pin_feature_batches(overrides)
+
+
+# --- Recording / replaying HTTP client ---
+
+class _Response:
+    def __init__(self, data, status_code=200):
+        self._data = data
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"Replayed HTTP {self.status_code}")
+
+    def json(self):
+        return self._data
+
+
+class _StreamedResponse(_Response):
+    """Streamed response for the pipeline's `async with client.stream(...)`: lines from a live or replayed stream."""
+
+    def __init__(self, lines, status_code=200, http_response=None):
+        super().__init__(None, status_code)
+        self._lines = lines
+        self._http_response = http_response
+
+    def raise_for_status(self):
+        if self._http_response is not None:
+            self._http_response.raise_for_status()
+        else:
+            super().raise_for_status()
+
+    def aiter_lines(self):
+        return self._lines
+
+
+class EvalClient:
+    """
+    Stands in for the pipeline's httpx.AsyncClient for one drawing: counts bytes sent and
+    received and, depending on `mode`, records responses to or replays them from a cassette.
+    """
+
+    def __init__(self, mode, cassette_path, http_client=None, replay_latency=0.0):
+        self.mode = mode
+        self.cassette_path = cassette_path
+        self.http_client = http_client
+        self.replay_latency = replay_latency
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.misses = 0
+        self.dirty = False
+        self.cassette = {}
+        if mode != "live" and os.path.exists(cassette_path):
+            with open(cassette_path, "r", encoding="utf-8") as f:
+                self.cassette = json.load(f)
+
+    @staticmethod
+    def request_key(url, json_body=None, files=None):
+        digest = hashlib.sha256(url.encode("utf-8"))
+        if json_body is not None:
+            digest.update(json.dumps(json_body, sort_keys=True).encode("utf-8"))
+        for name, content in sorted((files or {}).items()):
+            digest.update(name.encode("utf-8"))
+            digest.update(bytes(content))
+        return digest.hexdigest()
+
+    async def post(self, url, headers=None, json=None, params=None, files=None, **kwargs):
+        key = self.request_key(url, json, files)
+        self.bytes_sent += len(_dumps(json)) if json is not None else 0
+        self.bytes_sent += sum(len(content) for content in (files or {}).values())
+
+        entry = self.cassette.get(key) if self.mode != "live" else None
+        if self.mode == "replay" and entry is None:
+            self.misses += 1
+            raise RuntimeError(f"No recorded response for this request ({url})")
+        if entry is not None:
+            # Recorded requests are never repeated, so a drawing keeps one upload URL across configurations.
+            if self.replay_latency:
+                await asyncio.sleep(entry["latency_s"] * self.replay_latency)
+            self.bytes_received += len(_dumps(entry["response"]))
+            return _Response(entry["response"], entry.get("status_code", 200))
+
+        started = time.perf_counter()
+        resp = await self.http_client.post(url, headers=headers, json=json, params=params, files=files, **kwargs)
+        self.bytes_received += len(resp.content)
+        if self.mode == "record" and resp.status_code < 400:
+            self.dirty = True
+            self.cassette[key] = {"response": resp.json(), "status_code": resp.status_code,
+                                  "latency_s": time.perf_counter() - started}
+        return resp
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method, url, headers=None, json=None, **kwargs):
+        """Streamed request; recorded and replayed as [arrival offset in seconds, line] pairs."""
+        key = self.request_key(url, json)
+        self.bytes_sent += len(_dumps(json)) if json is not None else 0
+
+        entry = self.cassette.get(key) if self.mode != "live" else None
+        if self.mode == "replay" and entry is None:
+            self.misses += 1
+            raise RuntimeError(f"No recorded stream for this request ({url})")
+        if entry is not None:
+            yield _StreamedResponse(self._replay_lines(entry["stream"]), entry.get("status_code", 200))
+            return
+
+        started = time.perf_counter()
+        lines = []
+        async with self.http_client.stream(method, url, headers=headers, json=json, **kwargs) as resp:
+            async def read_lines():
+                async for line in resp.aiter_lines():
+                    self.bytes_received += len(line.encode("utf-8")) + 1
+                    lines.append([round(time.perf_counter() - started, 4), line])
+                    yield line
+
+            async def record():
+                if self.mode != "record" or resp.status_code >= 400:
+                    return
+                async for _line in reader:  # whatever the pipeline did not read
+                    pass
+                self.dirty = True
+                self.cassette[key] = {"stream": lines, "status_code": resp.status_code,
+                                      "latency_s": time.perf_counter() - started}
+
+            reader = read_lines()
+            try:
+                yield _StreamedResponse(reader, resp.status_code, resp)
+            except asyncio.CancelledError:
+                raise  # hedge loser or deadline: nothing complete to record
+            except Exception:
+                await record()  # rejected answers (e.g. a malformed stream) are replayed too
+                raise
+            await record()
+
+    async def _replay_lines(self, recorded):
+        previous = 0.0
+        for offset, line in recorded:
+            if self.replay_latency:
+                await asyncio.sleep((offset - previous) * self.replay_latency)
+                previous = offset
+            self.bytes_received += len(line.encode("utf-8")) + 1
+            yield line
+
+    def save(self):
+        if self.dirty:
+            os.makedirs(os.path.dirname(self.cassette_path) or ".", exist_ok=True)
+            tmp_path = self.cassette_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.cassette, f)
+            os.replace(tmp_path, self.cassette_path)
+
+
+def _dumps(obj):
+    return json.dumps(obj).encode("utf-8")
+
+
+def cassette_path(cassette_dir, filename):
+    safe = re.sub(r"[^A-Za-z0-9._-]", "_", filename)
+    return os.path.join(cassette_dir, safe + ".json")
+
+
+# --- Running ---
+
+async def evaluate_drawing_async(source, expected, overrides, mode, cassette_dir, http_client, replay_latency):
+    """Runs one drawing through one configuration (resolve_config() overrides) and returns its measurement row."""
+    client = EvalClient(mode, cassette_path(cassette_dir, source.name), http_client, replay_latency)
+    file_bytes = await backend12.run_cpu(source.read)
+    started = time.perf_counter()
+    data, routing, first_value_s = {"error": "No result produced."}, {}, None
+    async for event in process_single_file_async(file_bytes, source.name, client=client,
+                                                 config=overrides):
+        if "error" in event:
+            data = {"error": event["error"]}
+        elif "final_result" in event:
+            data = event["final_result"]["data"]
+            routing = event["final_result"].get("routing") or {}
+            first_value_s = event["final_result"].get("time_to_first_value_s")
+    wall_s = time.perf_counter() - started
+    client.save()
+    return {
+        "filename": source.name,
+        "error": data.get("error"),
+        "scores": score_drawing(expected, None if "error" in data else data),
+        "wall_s": wall_s,
+        "time_to_first_value_s": first_value_s,
+        "model_latency_s": routing.get("model_latency_s", 0.0),
+        "tokens": routing.get("tokens", 0),
+        "cost_usd": routing.get("cost_usd", 0.0),
+        "calls": routing.get("calls", 0),
+        "bytes_sent": client.bytes_sent,
+        "bytes_received": client.bytes_received,
+        "replay_misses": client.misses,
+        "data": data,
+    }
+
+
+def summarize_configuration(name, config, rows, feature_batches=None):
+    """Comparison-report entry of one configuration."""
+    n = len(rows)
+    fields = sorted({field for row in rows for field in row["scores"]}, key=SCORED_FIELDS.index)
+    per_field = {}
+    for field in fields:
+        scored = [row["scores"][field] for row in rows if field in row["scores"]]
+        per_field[field] = {
+            "n": len(scored),
+            "exact": sum(exact for exact, _ in scored) / len(scored),
+            "normalized": sum(norm for _, norm in scored) / len(scored),
+        }
+    all_scores = [s for row in rows for s in row["scores"].values()]
+    walls = [row["wall_s"] for row in rows]
+    first_values = [row["time_to_first_value_s"] for row in rows if row["time_to_first_value_s"] is not None]
+
+    def mean(key):
+        return sum(row[key] for row in rows) / n if n else 0.0
+
+    return {
+        "name": name,
+        "config": config,
+        "feature_batches": feature_batches,
+        "drawings": n,
+        "errors": sum(1 for row in rows if row["error"]),
+        "replay_misses": sum(row["replay_misses"] for row in rows),
+        "exact_match": sum(e for e, _ in all_scores) / len(all_scores) if all_scores else None,
+        "normalized_match": sum(m for _, m in all_scores) / len(all_scores) if all_scores else None,
+        "per_field": per_field,
+        "mean_wall_s": mean("wall_s"),
+        "p95_wall_s": percentile(walls, 95) if walls else None,
+        "mean_time_to_first_value_s": sum(first_values) / len(first_values) if first_values else None,
+        "mean_model_latency_s": mean("model_latency_s"),
+        "mean_tokens": mean("tokens"),
+        "mean_cost_usd": mean("cost_usd"),
+        "mean_calls": mean("calls"),
+        "mean_bytes_sent": mean("bytes_sent"),
+        "mean_bytes_received": mean("bytes_received"),
+        "drawings_detail": rows,
+    }
+
+
+async def evaluate_async(corpus_dir, labels, configs, mode="replay", cassette_dir=CASSETTE_DIR, concurrency=4,
+                         replay_latency=0.0):
+    """Runs every configuration over the labeled drawings of `corpus_dir`; returns the report entries."""
+    sources = [s for s in list_files(corpus_dir) if s.name in labels or os.path.basename(s.name) in labels]
+    semaphore = asyncio.Semaphore(concurrency)
+    report = []
+    async with new_async_client() as http_client:
+        for config in configs:
+            name = config.get("name", f"config{len(report) + 1}")
+            print(f"→ Evaluating {name} on {len(sources)} drawings ({mode})")
+            overrides = resolve_config(config)
+
+            async def run(source):
+                expected = labels.get(source.name) or labels[os.path.basename(source.name)]
+                async with semaphore:
+                    return await evaluate_drawing_async(source, expected, overrides, mode, cassette_dir,
+                                                        http_client, replay_latency)
+
+            rows = await asyncio.gather(*(run(s) for s in sources))
+            report.append(summarize_configuration(name, config, rows, overrides["feature_batches"]))
+    return report
+
+
+def print_comparison(report):
+    header = f"{'configuration':<22}{'exact':>8}{'norm':>8}{'errors':>8}{'wall s':>9}{'tokens':>9}{'cost $':>9}{'KB sent':>9}"
+    print(header)
+    print("-" * len(header))
+    for entry in report:
+        exact = f"{entry['exact_match']:.1%}" if entry["exact_match"] is not None else "-"
+        norm = f"{entry['normalized_match']:.1%}" if entry["normalized_match"] is not None else "-"
+        print(f"{entry['name']:<22}{exact:>8}{norm:>8}{entry['errors']:>8}{entry['mean_wall_s']:>9.1f}"
+              f"{entry['mean_tokens']:>9.0f}{entry['mean_cost_usd']:>9.4f}{entry['mean_bytes_sent'] / 1024:>9.0f}")
+        if entry["replay_misses"]:
+            print(f"    {entry['replay_misses']} requests had no recorded response; record this configuration first.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score pipeline configurations against a labeled golden set.")
+    parser.add_argument("corpus_dir")
+    parser.add_argument("labels")
+    parser.add_argument("--configs", help="JSON list of PIPELINE_CONFIG overrides, each with a 'name'.")
+    parser.add_argument("--mode", choices=("live", "record", "replay"), default="replay")
+    parser.add_argument("--cassettes", default=CASSETTE_DIR)
+    parser.add_argument("--report", default=EVAL_REPORT_PATH)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--replay-latency", type=float, default=0.0,
+                        help="Replay recorded call latencies scaled by this factor (0 answers instantly).")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.enable_from_args(args)
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, "r", encoding="utf-8") as f:
+            configs = json.load(f)
+    if args.mode == "replay" and not backend12.IMGBB_API_KEY:
+        # Uploads are answered from the cassettes, but the pipeline refuses to upload without a key.
+        backend12.IMGBB_API_KEY = "replay"
+
+    report = asyncio.run(evaluate_async(args.corpus_dir, load_labels(args.labels), configs, args.mode,
+                                        args.cassettes, args.concurrency, args.replay_latency))
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print_comparison(report)
+    print(f" Done: report saved to {args.report}.")
+
+
+if __name__ == '__main__':
+    main()
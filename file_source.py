@@ -0,0 +1,77 @@
+"""
+Lazy file sources shared by every ingestion path.
+
+Listing a folder only collects names, paths and sizes; a file's content is
+read when a worker actually picks it up, so memory holds only the drawings in
+flight. Interactive uploads are wrapped in the same interface, so the
+frontend, the CLI and the async batch runner (`process_many_async`) all take
+the same source objects.
+"""
+import os
+import fnmatch
+
+SUPPORTED_PATTERNS = ("*.pdf", "*.png", "*.jpg", "*.jpeg")
+
+
+class FileSource:
+    """A drawing on disk; `read()` returns its bytes."""
+
+    def __init__(self, path, name=None, size=None):
+        self.path = path
+        self.name = name or os.path.basename(path)
+        self.size = os.path.getsize(path) if size is None else size
+
+    @property
+    def file_id(self):
+        return f"{self.path}:{self.size}"
+
+    def read(self):
+        # Always bytes: pdfium, the content hash and the upload all need a bytes object.
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def __repr__(self):
+        return f"FileSource({self.name!r}, {self.size} bytes)"
+
+
+class UploadSource:
+    """Wraps a Streamlit UploadedFile (already in memory) in the FileSource interface."""
+
+    def __init__(self, uploaded_file):
+        self._uploaded_file = uploaded_file
+        self.name = uploaded_file.name
+        self.size = getattr(uploaded_file, "size", None)
+        self.file_id = getattr(uploaded_file, "file_id", uploaded_file.name)
+
+    def read(self):
+        return self._uploaded_file.getvalue()
+
+
+def parse_patterns(text):
+    """Turns '*.pdf, drawings/*.png' into a tuple of glob patterns; empty means the defaults."""
+    patterns = tuple(p.strip() for p in (text or "").split(",") if p.strip())
+    return patterns or SUPPORTED_PATTERNS
+
+
+def matches(rel_path, patterns=SUPPORTED_PATTERNS):
+    """True if a '/'-separated path relative to the listed folder, or its file name, matches a pattern."""
+    rel_path = rel_path.lower()
+    name = rel_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(name, p.lower()) or fnmatch.fnmatch(rel_path, p.lower()) for p in patterns)
+
+
+def list_files(root, patterns=SUPPORTED_PATTERNS, recursive=True):
+    """
+    Yields a FileSource for every file under `root` matching any glob pattern, in a stable
+    order. Patterns match the file name or the '/'-separated path relative to `root`.
+    Nothing is read here; only directory entries are touched.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if not recursive:
+            dirnames.clear()
+        for fn in sorted(filenames):
+            path = os.path.join(dirpath, fn)
+            rel_path = os.path.relpath(path, root).replace(os.sep, "/")
+            if matches(rel_path, patterns):
+                yield FileSource(path, name=rel_path)
@@ -2,8 +2,293 @@ import streamlit as st
 import pandas as pd
 import io
 import os
+import html
 import math
-from backend12 import process_single_file
+import uuid
+import shutil
+import weakref
+import tempfile
+from PIL import Image
+from backend12 import process_single_file, pin_feature_batches
+from result_store import ResultStore
+from file_source import list_files, parse_patterns, UploadSource
+from report_export import EXPORT_FORMATS, export_bytes
+from model_router import summarize_runs
+from hedging import latency_report
+from schema_registry import REGISTRY, template_fields
+from profiling import profile_stage
+
+STORE_PAGE_SIZE = 50
+SESSION_PAGE_SIZE = 10
+THUMBNAIL_SIZE = (480, 480)
+HIGHLIGHT_PARAMS = [p.upper() for p in ["Cylinder Action", "Bore Diameter", "Rod Diameter", "Stroke Length", "Close Length", "Operating Pressure", "Operating Temperature", "Mounting", "Rod End", "Fluid", "Drawing Number"]]
+
+
+@st.cache_resource
+def get_result_store():
+    """One shared ResultStore per Streamlit server process."""
+    return ResultStore()
+
+
+def show_export_controls(records, export_key, version):
+    """
+    Format picker plus a download button. The report is only built when asked for, and is
+    kept in the session until the underlying results (`version`) change.
+    `records` is a list or a callable returning a fresh iterator of records.
+    """
+    fmt_col, build_col = st.columns([3, 1])
+    with fmt_col:
+        fmt = st.selectbox("Report format", list(EXPORT_FORMATS), key=f"{export_key}_format")
+    with build_col:
+        st.write("")
+        build = st.button("Prepare report", key=f"{export_key}_build", use_container_width=True)
+    if build:
+        with st.spinner("Writing report..."):
+            data, ext, mime = export_bytes(records, fmt)
+        st.session_state[export_key] = {"version": version, "format": fmt, "data": data, "ext": ext, "mime": mime}
+
+    prepared = st.session_state.get(export_key)
+    if prepared and prepared["version"] == version and prepared["format"] == fmt:
+        st.download_button(
+            label=f"📄 Download Report ({fmt})",
+            data=prepared["data"],
+            file_name=f"engineering_parameters_report.{prepared['ext']}",
+            mime=prepared["mime"],
+            use_container_width=True
+        )
+
+
+@profile_stage("thumbnail")
+def make_thumbnail(image_bytes):
+    """Returns a small JPEG preview of a result image."""
+    image = Image.open(io.BytesIO(image_bytes))
+    image.thumbnail(THUMBNAIL_SIZE)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=80)
+    return buf.getvalue()
+
+
+class SessionImageDir:
+    """
+    Temporary folder for one session's full-resolution result images. It is deleted by
+    remove(), when the session state holding it is dropped (the session ended), or at exit.
+    """
+
+    def __init__(self):
+        self.path = tempfile.mkdtemp(prefix="mppg_images_")
+        self._cleanup = weakref.finalize(self, shutil.rmtree, self.path, ignore_errors=True)
+
+    def remove(self):
+        self._cleanup()
+
+
+def clear_results():
+    """Drops the session's results and deletes their images from disk."""
+    image_dir = st.session_state.pop("image_dir", None)
+    if image_dir is not None:
+        image_dir.remove()
+    st.session_state.pop("results", None)
+    st.session_state.pop("results_signature", None)
+
+
+def store_result_image(image_bytes, filename):
+    """
+    Writes the full-resolution image to this session's image folder and returns
+    (thumbnail bytes, image path), so only the thumbnail is held in session memory.
+    """
+    if not image_bytes:
+        return None, None
+    if "image_dir" not in st.session_state:
+        st.session_state["image_dir"] = SessionImageDir()
+    image_path = os.path.join(st.session_state["image_dir"].path, f"{uuid.uuid4().hex}_{os.path.basename(filename)}.img")
+    with open(image_path, "wb") as f:
+        f.write(image_bytes)
+    try:
+        thumbnail = make_thumbnail(image_bytes)
+    except Exception:
+        thumbnail = None
+    return thumbnail, image_path
+
+
+def render_parameter_table(data, provisional=()):
+    """Two-column Parameter/Value HTML table for one result; `provisional` values are shown dimmed."""
+    rows = []
+    for key, val in data.items():
+        p_name = str(key).replace("_", " ").title()
+        p_class = "highlight" if p_name.upper() in HIGHLIGHT_PARAMS else ""
+        v_class = "provisional" if key in provisional else ""
+        rows.append(f'<tr><td class="{p_class}">{html.escape(p_name)}</td>'
+                    f'<td class="{v_class}">{html.escape(str(val))}</td></tr>')
+    return (
+        '<div class="results-table-container"><table><thead><tr>'
+        '<th class="header">Parameter</th><th class="header">Value</th>'
+        '</tr></thead><tbody>' + "".join(rows) + '</tbody></table></div>'
+    )
+
+
+def render_result_item(item, index):
+    filename = item.get("filename", "unknown file")
+    data = item.get("data", {})
+    reasoning = item.get("reasoning")
+
+    st.markdown(f"### Analysis Results: `{filename}`")
+    img_col, results_col = st.columns([1, 1.2])
+
+    with img_col:
+        if item.get("store_match"):
+            match = item["store_match"]
+            how = {"content_hash": "same file content",
+                   "near_duplicate": "near-identical drawing"}.get(
+                match["matched_by"], "same drawing number and revision")
+            st.info(f"Reused stored result of `{match['filename']}` ({how}).")
+        elif item.get("thumbnail"):
+            st.image(item["thumbnail"], caption=f"Analyzed Image: {filename}")
+        else:
+            st.info("No image to display for this item.")
+        # The full-resolution image is only read from disk when the user asks for it.
+        if item.get("image_path") and st.toggle("Show full-resolution image", key=f"full_{index}"):
+            if os.path.exists(item["image_path"]):
+                st.image(item["image_path"], use_column_width=True)
+            else:
+                st.warning("The full-resolution image is no longer available.")
+
+    with results_col:
+        if "error" in data:
+            st.error(f"Processing Error: {data['error']}")
+        elif data:
+            st.markdown(render_parameter_table(data), unsafe_allow_html=True)
+        else:
+            st.info("No parameters were extracted.")
+        routing = item.get("routing")
+        if routing:
+            escalated = ", ".join(routing["escalated_stages"]) or "none"
+            st.caption(f"Models: {routing['model_latency_s']:.1f}s, {routing['tokens']} tokens, "
+                       f"${routing['cost_usd']:.4f}; escalated: {escalated}")
+
+    if reasoning:
+        with st.expander("🤖 View AI Reasoning Details"):
+            for batch_no, title in ((1, "Core Parameters"), (2, "Secondary Parameters"), (3, "Optional Parameters")):
+                st.markdown(f"#### Batch {batch_no}: {title}")
+                if reasoning.get(f"extract_batch{batch_no}"):
+                    st.text_area(f"Extraction Reasoning (Batch {batch_no})", reasoning[f"extract_batch{batch_no}"], height=150, key=f"re{batch_no}_{index}")
+                if reasoning.get(f"validate_batch{batch_no}"):
+                    st.text_area(f"Validation Reasoning (Batch {batch_no})", reasoning[f"validate_batch{batch_no}"], height=150, key=f"rv{batch_no}_{index}")
+
+    st.markdown("---")
+
+
+def show_results(all_extracted_data, fields):
+    """
+    Filtered, paginated results view; render cost depends on the page size, not the batch size.
+    `fields` are the parameters offered in the parameter filter.
+    """
+    st.markdown("---")
+    st.markdown("## Extracted Parameter Results")
+    routing = summarize_runs([item.get("routing") for item in all_extracted_data])
+    if routing["drawings"]:
+        st.caption(f"Model routing over {routing['drawings']} drawings: "
+                   f"{routing['drawings_with_escalation']:.0%} escalated at least once, "
+                   f"mean {routing['mean_model_latency_s']:.1f}s and ${routing['mean_cost_usd']:.4f} per drawing.")
+    latency = latency_report()
+    if "file" in latency["latency_s"]:
+        file_latency = latency["latency_s"]["file"]
+        # LATENCIES is shared by every session of this server process.
+        st.caption(f"Per-file latency across all sessions on this server: p50 {file_latency['p50']:.1f}s, "
+                   f"p95 {file_latency['p95']:.1f}s, p99 {file_latency['p99']:.1f}s over the last {file_latency['n']} files.")
+    if "first_value" in latency["latency_s"]:
+        first_value = latency["latency_s"]["first_value"]
+        st.caption(f"Time to first extracted value across all sessions: p50 {first_value['p50']:.1f}s, "
+                   f"p95 {first_value['p95']:.1f}s.")
+
+    f1, f2, f3, f4 = st.columns(4)
+    with f1:
+        status = st.selectbox("Show", ("All results", "Errors only", "Successful only"), key="results_status")
+    with f2:
+        name_filter = st.text_input("Filename contains", key="results_name")
+    with f3:
+        param = st.selectbox("Parameter", [""] + list(fields), key="results_param")
+    with f4:
+        value_filter = st.text_input("Value contains", key="results_value", disabled=not param)
+
+    def keep(item):
+        data = item.get("data", {})
+        if status == "Errors only" and "error" not in data:
+            return False
+        if status == "Successful only" and "error" in data:
+            return False
+        if name_filter and name_filter.lower() not in item.get("filename", "").lower():
+            return False
+        if param and value_filter.lower() not in str(data.get(param, "")).lower():
+            return False
+        return True
+
+    matching = [idx for idx, item in enumerate(all_extracted_data) if keep(item)]
+    if not matching:
+        st.info("No results match these filters.")
+    else:
+        pages = math.ceil(len(matching) / SESSION_PAGE_SIZE)
+        if st.session_state.get("results_page", 1) > pages:
+            st.session_state["results_page"] = 1
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key="results_page")
+        st.caption(f"{len(matching)} of {len(all_extracted_data)} results")
+        for idx in matching[(page - 1) * SESSION_PAGE_SIZE: page * SESSION_PAGE_SIZE]:
+            render_result_item(all_extracted_data[idx], idx)
+
+    st.markdown("### Export Full Report")
+    show_export_controls(all_extracted_data, "results_export", st.session_state.get("results_signature"))
+
+
+def show_result_store(store, fields):
+    """Filtered, paginated view over every stored result, with an Excel export of the matches."""
+    st.markdown("## Stored Extraction Results")
+    f1, f2, f3, f4 = st.columns(4)
+    with f1:
+        drawing_number = st.text_input("Drawing number contains")
+    with f2:
+        revision = st.text_input("Revision")
+    with f3:
+        filename = st.text_input("Filename contains")
+    with f4:
+        status = st.selectbox("Status", ("All", "Successful only", "Errors only"))
+    p1, p2, p3 = st.columns([1, 1, 2])
+    with p1:
+        param = st.selectbox("Parameter filter", [""] + list(fields))
+    with p2:
+        value = st.text_input("Value contains", disabled=not param)
+    with p3:
+        latest_only = st.checkbox("Latest result per file only", value=True)
+
+    filters = {
+        "drawing_number": drawing_number or None,
+        "revision": revision or None,
+        "filename": filename or None,
+        "has_error": {"All": None, "Successful only": False, "Errors only": True}[status],
+        "param": param or None,
+        "value": value,
+        "latest_only": latest_only,
+    }
+    total = store.count(**filters)
+    if not total:
+        st.info("No stored results match these filters.")
+        return
+
+    pages = math.ceil(total / STORE_PAGE_SIZE)
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+    records = store.query(limit=STORE_PAGE_SIZE, offset=(page - 1) * STORE_PAGE_SIZE, **filters)
+    st.caption(f"{total} matching results")
+    st.dataframe(
+        pd.DataFrame([{"filename": r["filename"], "stored": pd.to_datetime(r["created_at"], unit="s"), **r["data"]} for r in records]),
+        use_container_width=True, hide_index=True
+    )
+
+    st.markdown("### Export Matching Results")
+    show_export_controls(
+        lambda: ({"filename": r["filename"], "data": r["data"]} for r in store.iter_records(**filters)),
+        "store_export", (tuple(sorted(filters.items())), total)
+    )
+
 
 def main():
 
@@ -17,10 +302,26 @@ def main():
     # --- Sidebar and Mode Selection ---
     mode = st.sidebar.radio(
         "Select run mode",
-        ("Interactive Upload", "Batch‑from‑Folder"),
-        help="Interactive: choose files manually. Batch: pick a folder and process everything inside."
+        ("Interactive Upload", "Batch‑from‑Folder", "Result Store"),
+        help="Interactive: choose files manually. Batch: pick a folder and process everything inside. Result Store: browse earlier results."
     )
+    if st.session_state.get("results") and st.sidebar.button("Clear results"):
+        clear_results()
     st.sidebar.markdown("---")
+    store = get_result_store()
+    reuse_stored = st.sidebar.checkbox(
+        "Skip drawings already in the result store", value=True,
+        help="Files whose content, or drawing number and revision, match a stored result reuse it without extraction calls."
+    )
+    template_name = st.sidebar.selectbox(
+        "Component template", list(REGISTRY), format_func=lambda name: REGISTRY[name]["label"]
+    )
+    include_optional = st.sidebar.checkbox(
+        "Extract optional fields", value=False,
+        help="Adds the template's optional fields; they are spread over the parallel extraction calls."
+    )
+    pipeline_config = {"template": template_name, "optional_features": include_optional}
+    planned_fields = template_fields(template_name, include_optional)
 
     # --- CSS for styling and the results table ---
     # Comments have been added to explain what each style does.
@@ -114,6 +415,10 @@ def main():
         .results-table-container .highlight {
             color: #FF4B4B;                             /* Red color for highlighted parameter names */
         }
+        .results-table-container .provisional {
+            opacity: 0.6;                               /* Dim values the model may still revise */
+            font-style: italic;
+        }
 
         /* --- Status Text Area with Spinner --- */
         .status-text {
@@ -155,20 +460,35 @@ def main():
         st.image("jswlogo.png", width=160)
 
     with title_col:
-        st.markdown("""
+        st.markdown(f"""
             <h1 style='margin-top: 10px; margin-bottom: 0;'>Engineering Drawing Parameter Extractor - MPPG</h1>
             <p style='font-size: 1.2rem; opacity: 0.8;'>
-                Template: CYLINDER,HYD/PNUEMATIC
+                Template: {html.escape(REGISTRY[template_name]["label"])}
             </p>
         """, unsafe_allow_html=True)
 
+    if mode == "Result Store":
+        show_result_store(store, template_fields(template_name, include_optional=True))
+        return
+
     # --- File handling logic ---
     batch_dir = None
     run_batch = False
+    skip_duplicates = True
     if mode == "Batch‑from‑Folder":
         batch_dir = st.sidebar.text_input(
             "Folder path containing drawings", help="Provide the absolute path to your folder of PDF or image files."
         )
+        recursive = st.sidebar.checkbox("Include subfolders", value=True)
+        file_patterns = st.sidebar.text_input(
+            "File patterns", value="*.pdf, *.png, *.jpg, *.jpeg",
+            help="Comma-separated glob patterns, matched against file names or paths relative to the folder."
+        )
+        skip_duplicates = st.sidebar.checkbox(
+            "Reuse results for duplicate drawings", value=True, disabled=not reuse_stored,
+            help="Near-identical drawings (PDF/PNG exports, re-encoded or rotated copies) reuse a stored result "
+                 "without any model call."
+        )
         run_batch = st.sidebar.button("Run batch processing")
 
     file_objs = []
@@ -177,18 +497,14 @@ def main():
             "Upload Your Engineering Drawings", type=["pdf", "png", "jpg", "jpeg"],
             accept_multiple_files=True, label_visibility="visible"
         )
-        file_objs = uploaded_files or []
+        file_objs = [UploadSource(f) for f in uploaded_files or []]
     elif run_batch and batch_dir:
         try:
             if os.path.isdir(batch_dir):
-                files_to_process = [f for f in os.listdir(batch_dir) if f.lower().endswith((".pdf", ".png", ".jpg", ".jpeg"))]
-                if files_to_process:
-                    for fn in files_to_process:
-                        path = os.path.join(batch_dir, fn)
-                        with open(path, "rb") as f:
-                            data = f.read()
-                        file_objs.append(type("UploadedFile", (), {"name": fn, "read": lambda d=data: d})())
-                    st.success(f"Loaded {len(file_objs)} files from the folder.")
+                # Only names and sizes are collected here; each file is read when it is processed.
+                file_objs = list(list_files(batch_dir, parse_patterns(file_patterns), recursive))
+                if file_objs:
+                    st.success(f"Found {len(file_objs)} files in the folder.")
                 else:
                     st.warning("No supported files found in the folder.")
             else:
@@ -196,17 +512,27 @@ def main():
         except Exception as e:
             st.error(f" Could not load files: {e}")
 
-    # --- Main processing and display logic ---
-    if file_objs:
+    # --- Main processing logic ---
+    # Results live in the session so that paging and filtering do not re-run the pipeline.
+    batch_signature = (template_name, include_optional) + tuple((mode, getattr(f, "file_id", f.name)) for f in file_objs)
+    if file_objs and (run_batch or batch_signature != st.session_state.get("results_signature")):
         total_files = len(file_objs)
         st.markdown("### Processing Status...")
         progress_bar = st.progress(0)
         status_text_area = st.empty() # Placeholder for our detailed status
+        live_table_area = st.empty()  # Values of the current file, filled in as the model writes them
         all_extracted_data = []
+        clear_results()  # the previous run's images are replaced along with its results
 
-        for i, uploaded_file in enumerate(file_objs):
+        # Near-duplicates are found by the pipeline in the result store: files run one after
+        # another, so a duplicate later in the batch finds its earlier copy's stored result.
+        # The feature batches are planned once, so every file of the run is split the same way.
+        file_config = pin_feature_batches(dict(pipeline_config, dedup=skip_duplicates))
 
-            for update in process_single_file(uploaded_file.read()):
+        for i, uploaded_file in enumerate(file_objs):
+            live_values = {}
+            provisional_fields = set()
+            for update in process_single_file(uploaded_file.read(), filename=uploaded_file.name, store=store, reuse_stored=reuse_stored, config=file_config):
                 
                 # --- Update UI based on the yielded message from the backend ---
                 if "status" in update:
@@ -216,22 +542,36 @@ def main():
                     <div class="status-text">
                         <div class="spinner"></div>
                         <div>
-                            <strong>{update['status']}</strong><br>
-                            File: <code>{uploaded_file.name}</code> ({i+1}/{total_files})
+                            <strong>{html.escape(update['status'])}</strong><br>
+                            File: <code>{html.escape(uploaded_file.name)}</code> ({i+1}/{total_files})
                         </div>
                     </div>
                     """
                     status_text_area.markdown(status_message, unsafe_allow_html=True)
                     progress_bar.progress(current_progress)
+                    if "field" in update:
+                        # Provisional values are replaced by the accepted answer's event for the same field.
+                        live_values[update["field"]] = update["value"]
+                        if update.get("provisional"):
+                            provisional_fields.add(update["field"])
+                        else:
+                            provisional_fields.discard(update["field"])
+                        live_table_area.markdown(render_parameter_table(live_values, provisional_fields),
+                                                 unsafe_allow_html=True)
 
                 elif "final_result" in update:
                     # The backend finished this file and sent the final data.
                     result = update["final_result"]
+                    # Only a thumbnail stays in the session; the full image goes to disk.
+                    thumbnail, image_path = store_result_image(result.get("image"), uploaded_file.name)
                     all_extracted_data.append({
                         "filename": uploaded_file.name,
                         "data": result.get("data", {}),
-                        "image": result.get("image"),
-                        "reasoning": result.get("reasoning", {})
+                        "thumbnail": thumbnail,
+                        "image_path": image_path,
+                        "reasoning": result.get("reasoning", {}),
+                        "store_match": result.get("store_match"),
+                        "routing": result.get("routing")
                     })
 
                 elif "error" in update:
@@ -239,150 +579,25 @@ def main():
                     all_extracted_data.append({
                         "filename": uploaded_file.name,
                         "data": {"error": update["error"]},
-                        "image": None
+                        "thumbnail": None,
+                        "image_path": None
                     })
                     break # Stop processing this file and move to the next
 
+            live_table_area.empty()
+
         status_text_area.markdown(f'<div class="success-box"><strong>All {total_files} files processed</strong></div>', unsafe_allow_html=True)
         progress_bar.progress(1.0)
-        
-        if all_extracted_data:
-            st.markdown("---")
-            st.markdown("## Extracted Parameter Results")
-            highlight_params = [p.upper() for p in ["Cylinder Action", "Bore Diameter", "Rod Diameter", "Stroke Length", "Close Length", "Operating Pressure", "Operating Temperature", "Mounting", "Rod End", "Fluid", "Drawing Number"]]
-            flattened_data_for_csv = []
-            
-            for item in all_extracted_data:
-                filename = item.get("filename", "unknown file")
-                data = item.get("data", {})
-                image_bytes = item.get("image", None)
-                reasoning = item.get("reasoning")
-
-                st.markdown(f"### Analysis Results: `{filename}`")
-                img_col, results_col = st.columns([1, 1.2])
-                
-                with img_col:
-                    if image_bytes:
-                        st.image(image_bytes, caption=f"Analyzed Image: {filename}", use_column_width=True)
-                    else:
-                        st.info("No image to display for this item.")
-                
-                with results_col:
-                    if "error" in data:
-                        st.error(f"Processing Error: {data['error']}")
-                    elif data:
-                        # 1. Define simpler table headers for just two columns.
-                        html_table = "<table><thead><tr>"
-                        html_table += '<th class="header">Parameter</th><th class="header">Value</th>'
-                        html_table += "</tr></thead><tbody>"
-
-                        # 2. Loop through every parameter and create one row for each.
-                        for key, val in data.items():
-                            html_table += "<tr>"
-                            
-                            # Get the parameter name and check if it should be highlighted
-                            p_name = str(key).replace("_", " ").title()
-                            p_class = "highlight" if p_name.upper() in highlight_params else ""
-                            
-                            # Add the two cells for the parameter and its value
-                            html_table += f'<td class="{p_class}">{p_name}</td>'
-                            html_table += f'<td>{val}</td>'
-                            
-                            html_table += "</tr>"
-
-                        html_table += "</tbody></table>"
-                        st.markdown(f'<div class="results-table-container">{html_table}</div>', unsafe_allow_html=True)
-                    else:
-                        st.info("No parameters were extracted.")
-
-                if reasoning:
-                    with st.expander("🤖 View AI Reasoning Details"):
-                        st.markdown("#### Batch 1: Core Parameters")
-                        if reasoning.get("extract_batch1"):
-                            st.text_area("Extraction Reasoning (Batch 1)", reasoning["extract_batch1"], height=150, key=f"re1_{filename}")
-                        if reasoning.get("validate_batch1"):
-                            st.text_area("Validation Reasoning (Batch 1)", reasoning["validate_batch1"], height=150, key=f"rv1_{filename}")
-
-                        st.markdown("#### Batch 2: Secondary Parameters")
-                        if reasoning.get("extract_batch2"):
-                            st.text_area("Extraction Reasoning (Batch 2)", reasoning["extract_batch2"], height=150, key=f"re2_{filename}")
-                        if reasoning.get("validate_batch2"):
-                            st.text_area("Validation Reasoning (Batch 2)", reasoning["validate_batch2"], height=150, key=f"rv2_{filename}")
-
-                        st.markdown("#### Batch 3: Optional Parameters")
-                        if reasoning.get("extract_batch3"):
-                            st.text_area("Extraction Reasoning (Batch 3)", reasoning["extract_batch3"], height=150, key=f"re3_{filename}")
-                        if reasoning.get("validate_batch3"):
-                            st.text_area("Validation Reasoning (Batch 3)", reasoning["validate_batch3"], height=150, key=f"rv3_{filename}")
-
-                st.markdown("---")
-            
-            st.markdown("### Export Full Report")
-            if all_extracted_data:
-                processed_filenames = [item.get("filename", "unknown file") for item in all_extracted_data]
-
-                long_format_data = []
-                all_params_in_order = []
-                for item in all_extracted_data:
-                    filename = item.get("filename", "unknown file")
-                    data = item.get("data", {})
-
-                    if "error" in data:
-                        long_format_data.append({"Filename": filename, "Parameter": "Processing Error", "Value": data["error"]})
-                        if "Processing Error" not in all_params_in_order:
-                            all_params_in_order.append("Processing Error")
-                    elif data:
-                        for key, value in data.items():
-                            param_name = str(key).replace("_", " ").title()
-                            long_format_data.append({"Filename": filename, "Parameter": param_name, "Value": value})
-                            if param_name not in all_params_in_order:
-                                all_params_in_order.append(param_name)
-                
-                if long_format_data:
-                    df_long = pd.DataFrame(long_format_data)
-                    df_long['Parameter'] = pd.Categorical(df_long['Parameter'], categories=all_params_in_order, ordered=True)
-
-                    df_pivoted = df_long.pivot(index='Parameter', columns='Filename', values='Value').fillna('')
-                    df_pivoted = df_pivoted[processed_filenames]
-                    df_pivoted = df_pivoted.reset_index()
-                    output = io.BytesIO()
-
-                    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                        df_pivoted.to_excel(writer, index=False, sheet_name='Report')
-
-                        workbook  = writer.book
-                        worksheet = writer.sheets['Report']
-
-                        bold_format = workbook.add_format({'bold': True})
-
-                        for row_num in range(len(df_pivoted)):
-                            worksheet.write(row_num + 1, 0, df_pivoted.iloc[row_num, 0], bold_format)
-
-                        for idx, col in enumerate(df_pivoted):
-                            series = df_pivoted[col]
-                            max_len = max((
-                                series.astype(str).map(len).max(),
-                                len(str(series.name))
-                            )) + 3 
-                            
-                            worksheet.set_column(idx, idx, max_len)
-
-                    excel_data = output.getvalue()
-                    st.download_button(
-                        label="📄 Download Report as Excel",
-                        data=excel_data,
-                        file_name="engineering_parameters_report.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        use_container_width=True
-                    )
-                else:
-                    st.info("No data available to generate a report.")
-    
+        st.session_state["results"] = all_extracted_data
+        st.session_state["results_signature"] = batch_signature
+
+    # --- Results display ---
+    if st.session_state.get("results"):
+        show_results(st.session_state["results"], planned_fields)
+    elif mode == "Batch‑from‑Folder" and not run_batch:
+        st.info("Provide a folder path and click ' Run batch processing' to begin.")
     else:
-        if mode == "Batch‑from‑Folder" and not run_batch:
-            st.info("Provide a folder path and click ' Run batch processing' to begin.")
-        else:
-            st.info("Upload files to begin analysis.")
+        st.info("Upload files to begin analysis.")
 
 
 if __name__ == "__main__":
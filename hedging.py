@@ -0,0 +1,181 @@
+"""
+Deadlines and hedged requests for the async pipeline.
+
+Every drawing gets a wall-clock budget (FILE_DEADLINE_S) and every stage a
+timeout (STAGE_TIMEOUTS); a stage gets whichever is shorter, and is cancelled
+when it runs out, so one stuck model call can no longer hold a worker.
+
+With HEDGE_REQUESTS=1, a model call that has not returned by the running p95
+latency of its stage is issued a second time and whichever answer arrives
+first wins; the other request is cancelled. Hedges are capped at HEDGE_BUDGET
+(a fraction of all calls) so a slow API is not hit with twice the load.
+
+latency_report() gives p50/p95/p99 per stage and per file, and the hedge win
+rates, for tuning both. The trackers are shared by the whole process, including
+every Streamlit session thread, so they are guarded by locks.
+"""
+import os
+import time
+import math
+import asyncio
+import threading
+from collections import deque
+
+FILE_DEADLINE_S = float(os.getenv("FILE_DEADLINE_S", "600"))
+STAGE_TIMEOUTS = {
+    # seconds
+    "render": 120,
+    "orientation": 75,
+    "upload": 60,
+    "title_block": 30,
+    "extraction": 300,   # per model call, each cascade tier separately
+    "validation": 300,   # per model call
+}
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "0") == "1"
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))
+HEDGE_MIN_SAMPLES = 20   # calls of a stage seen before its p95 is trusted
+LATENCY_WINDOW = 500     # most recent samples kept per stage
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies (seconds) per key."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def count(self, key):
+        with self._lock:
+            return len(self._samples.get(key, ()))
+
+    def _snapshot(self, key):
+        with self._lock:
+            return list(self._samples.get(key, ()))
+
+    def percentile(self, key, q):
+        samples = self._snapshot(key)
+        return percentile(samples, q) if samples else None
+
+    def summary(self):
+        with self._lock:
+            snapshot = {key: list(samples) for key, samples in self._samples.items() if samples}
+        return {
+            key: {"n": len(samples), "p50": round(percentile(samples, 50), 3),
+                  "p95": round(percentile(samples, 95), 3), "p99": round(percentile(samples, 99), 3)}
+            for key, samples in snapshot.items()
+        }
+
+
+class Deadline:
+    """Wall-clock budget of one drawing."""
+
+    def __init__(self, seconds=FILE_DEADLINE_S):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    async def run(self, stage, awaitable, timeout=None):
+        """Awaits one stage within min(stage timeout, remaining budget); cancels it when that runs out."""
+        budget = min(timeout or STAGE_TIMEOUTS.get(stage, math.inf), self.remaining())
+        if budget <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceeded(f"file deadline of {self.seconds:.1f}s reached before {stage}")
+        try:
+            return await asyncio.wait_for(awaitable, budget)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"{stage} did not finish within {budget:.1f}s") from None
+
+
+class Hedger:
+    """Issues a duplicate of calls that outlive their stage's running p95, within a budget."""
+
+    def __init__(self, latencies, enabled=HEDGE_REQUESTS, budget=HEDGE_BUDGET, min_samples=HEDGE_MIN_SAMPLES):
+        self.latencies = latencies
+        self.enabled = enabled
+        self.budget = budget
+        self.min_samples = min_samples
+        self.calls, self.hedges, self.wins = {}, {}, {}
+        self._lock = threading.Lock()   # counters are shared by every event loop / session thread
+
+    def _count(self, counter, stage):
+        with self._lock:
+            counter[stage] = counter.get(stage, 0) + 1
+
+    def _may_hedge(self, stage, reserve=False):
+        """True if a hedge of `stage` fits the budget; with `reserve`, also counts it, atomically."""
+        if not self.enabled or self.latencies.count(stage) < self.min_samples:
+            return False
+        with self._lock:
+            if sum(self.hedges.values()) >= self.budget * sum(self.calls.values()):
+                return False
+            if reserve:
+                self.hedges[stage] = self.hedges.get(stage, 0) + 1
+            return True
+
+    async def call(self, stage, make_call):
+        """Runs make_call() (a coroutine factory), hedging it if it is slow; returns the first success."""
+        self._count(self.calls, stage)
+        started = time.monotonic()
+        primary = asyncio.ensure_future(make_call())
+        tasks = [primary]
+        try:
+            if self._may_hedge(stage):
+                done, _ = await asyncio.wait([primary], timeout=self.latencies.percentile(stage, 95))
+                if not done and self._may_hedge(stage, reserve=True):
+                    tasks.append(asyncio.ensure_future(make_call()))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count(self.wins, stage)
+                        self.latencies.record(stage, time.monotonic() - started)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def summary(self):
+        with self._lock:
+            calls, hedges, wins = dict(self.calls), dict(self.hedges), dict(self.wins)
+        return {
+            "enabled": self.enabled,
+            "budget": self.budget,
+            "stages": {
+                stage: {"calls": n, "hedges": hedges.get(stage, 0), "hedge_wins": wins.get(stage, 0),
+                        "win_rate": wins.get(stage, 0) / hedges[stage] if hedges.get(stage) else None}
+                for stage, n in calls.items()
+            },
+        }
+
+
+# Shared by every drawing in the process, so percentiles reflect the whole run.
+LATENCIES = LatencyTracker()
+HEDGER = Hedger(LATENCIES)
+
+
+def latency_report():
+    """Per-stage and per-file ("file") latency percentiles plus hedge counts and win rates."""
+    return {"latency_s": LATENCIES.summary(), "hedging": HEDGER.summary()}
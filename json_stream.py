@@ -0,0 +1,157 @@
+"""
+Incremental parser for the JSON object a streamed chat completion writes.
+
+The extraction prompts ask for one flat JSON object. While the model streams
+it token by token, IncrementalObjectParser.feed() takes each text delta and
+returns the top-level (key, value) pairs whose value just became complete, so
+the pipeline can show a field as soon as the model has written it instead of
+waiting for the whole answer.
+
+The parser is strict about the object's structure and raises MalformedStream
+as soon as the text cannot be the start of a JSON object (prose instead of
+JSON, a bad separator, an unparsable value), so the caller can drop the
+stream right away rather than wait for a response it would reject anyway.
+A leading ```json fence line is tolerated; anything after the closing brace
+is ignored.
+
+Usage:
+    parser = IncrementalObjectParser()
+    for delta in deltas:
+        for key, value in parser.feed(delta):
+            ...
+    data = parser.finish()
+"""
+import json
+
+_SCALAR_START = set('-0123456789tfn')
+_WHITESPACE = set(' \t\r\n')
+
+
+class MalformedStream(ValueError):
+    pass
+
+
+class IncrementalObjectParser:
+    """Parses one JSON object from text arriving in pieces; see the module docstring."""
+
+    def __init__(self):
+        self.result = {}
+        self.chars = 0
+        self._state = "start"   # start, fence, key_or_end, key, colon, value_start, value, comma_or_end, done
+        self._token = []        # characters of the key or value being read
+        self._key = None
+        self._depth = 0         # nesting inside a container value
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def done(self):
+        return self._state == "done"
+
+    def _fail(self, char, expected):
+        raise MalformedStream(f"unexpected {char!r} at character {self.chars}, expected {expected}")
+
+    def _finish_value(self):
+        text = "".join(self._token)
+        try:
+            value = json.loads(text)
+        except ValueError:
+            raise MalformedStream(f"invalid value for {self._key!r}: {text[:80]!r}") from None
+        self.result[self._key] = value
+        self._token = []
+        self._state = "comma_or_end"
+        return self._key, value
+
+    def feed(self, text):
+        """Consumes the next piece of text; returns the (key, value) pairs completed by it."""
+        completed = []
+        for char in text:
+            self.chars += 1
+            state = self._state
+            if state == "value":
+                if self._in_string:
+                    self._token.append(char)
+                    if self._escaped:
+                        self._escaped = False
+                    elif char == "\\":
+                        self._escaped = True
+                    elif char == '"':
+                        self._in_string = False
+                        if self._depth == 0:
+                            completed.append(self._finish_value())
+                elif char in '{[':
+                    self._depth += 1
+                    self._token.append(char)
+                elif char in '}]' and self._depth > 0:
+                    self._depth -= 1
+                    self._token.append(char)
+                    if self._depth == 0:
+                        completed.append(self._finish_value())
+                elif self._depth == 0 and (char in _WHITESPACE or char in ',}'):
+                    # End of a number / true / false / null.
+                    completed.append(self._finish_value())
+                    if char == ",":
+                        self._state = "key_or_end"
+                    elif char == "}":
+                        self._state = "done"
+                else:
+                    if char == '"':
+                        self._in_string = True
+                    self._token.append(char)
+            elif state == "key":
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._key = json.loads('"' + "".join(self._token) + '"')
+                    self._token = []
+                    self._state = "colon"
+                    continue
+                self._token.append(char)
+            elif state == "fence":
+                if char == "\n":
+                    self._state = "start"
+            elif char in _WHITESPACE or state == "done":
+                continue
+            elif state == "start":
+                if char == "{":
+                    self._state = "key_or_end"
+                elif char == "`" and self.chars == 1:
+                    self._state = "fence"
+                else:
+                    self._fail(char, "'{'")
+            elif state == "key_or_end":
+                if char == '"':
+                    self._state = "key"
+                elif char == "}" and not self.result:
+                    self._state = "done"
+                else:
+                    self._fail(char, "a key")
+            elif state == "colon":
+                if char != ":":
+                    self._fail(char, "':'")
+                self._state = "value_start"
+            elif state == "value_start":
+                self._state = "value"
+                self._token = [char]
+                if char == '"':
+                    self._in_string = True
+                elif char in '{[':
+                    self._depth = 1
+                elif char not in _SCALAR_START:
+                    self._fail(char, "a value")
+            elif state == "comma_or_end":
+                if char == ",":
+                    self._state = "key_or_end"
+                elif char == "}":
+                    self._state = "done"
+                else:
+                    self._fail(char, "',' or '}'")
+        return completed
+
+    def finish(self):
+        """Returns the parsed object; raises MalformedStream if the text ended before it was complete."""
+        if not self.done:
+            raise MalformedStream(f"stream ended inside the JSON object (state {self._state}, {self.chars} characters)")
+        return self.result
@@ -0,0 +1,205 @@
+"""
+Cost/latency model cascade.
+
+Each stage of the pipeline (orientation and every feature batch) has a routing
+policy: an ordered list of tiers, cheapest first. A call is made on the first
+tier and only escalated to the next one when the output fails the schema
+check, the engineering consistency checks, or reports low confidence, so
+clean CAD drawings finish on the fast tier.
+
+Policies can be overridden with a JSON file named by the MODEL_ROUTING_CONFIG
+environment variable. Feature batches are planned per run (see
+schema_registry.plan_feature_groups), so extraction policies are keyed by
+field: a batch uses the policy of the first of its fields that has one, e.g.
+
+    {"confidence_threshold": 0.7,
+     "policies": {"close_length": [{"model": "o4-mini-2025-04-16", "reasoning_effort": "medium"}]}}
+
+puts whichever batch reads close_length on the stronger tier. Other stages
+(orientation) are keyed by stage name.
+
+RoutingStats records every call (model, effort, latency, tokens, cost,
+escalation reason) so escalation rate and per-drawing latency/cost can be
+reported.
+"""
+import os
+import re
+import json
+
+EXTRACTION_TIERS = [
+    {"model": "o4-mini-2025-04-16", "reasoning_effort": "low"},
+    {"model": "o4-mini-2025-04-16", "reasoning_effort": "medium"},
+]
+ORIENTATION_TIERS = [
+    {"model": "gpt-4o-mini"},
+    {"model": "gpt-4o"},
+]
+DEFAULT_POLICIES = {
+    "orientation": ORIENTATION_TIERS,
+}
+DEFAULT_CONFIDENCE_THRESHOLD = 0.6
+
+# USD per 1M tokens (input, output); used for reporting only.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "o4-mini-2025-04-16": (1.10, 4.40),
+}
+
+CONFIDENCE_FIELD = "confidence"
+
+
+def load_routing_config(path=None):
+    """Returns {"policies": {...}, "confidence_threshold": float}, merged over the defaults."""
+    config = {"policies": dict(DEFAULT_POLICIES), "confidence_threshold": DEFAULT_CONFIDENCE_THRESHOLD}
+    path = path or os.getenv("MODEL_ROUTING_CONFIG")
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+        config["policies"].update(overrides.get("policies", {}))
+        config["confidence_threshold"] = overrides.get("confidence_threshold", config["confidence_threshold"])
+    return config
+
+
+ROUTING_CONFIG = load_routing_config()
+
+
+def tiers_for(stage, fields=()):
+    """Tiers of a stage: the policy of the first of its `fields` that has one, else the stage's own policy."""
+    policies = ROUTING_CONFIG["policies"]
+    for field in fields:
+        if policies.get(field):
+            return policies[field]
+    return policies.get(stage) or EXTRACTION_TIERS
+
+
+def call_cost(model, usage):
+    prices = MODEL_PRICES.get(model)
+    if not prices or not usage:
+        return 0.0
+    return (usage.get("prompt_tokens", 0) * prices[0] + usage.get("completion_tokens", 0) * prices[1]) / 1_000_000
+
+
+# --- Checks ---
+
+def _number(value):
+    match = re.search(r"\d+(?:\.\d+)?", str(value or "").replace(",", ""))
+    return float(match.group()) if match else None
+
+
+def check_schema(data, features):
+    """Problems with the shape of an extraction: missing or non-string fields, or nothing extracted."""
+    if not isinstance(data, dict):
+        return ["response is not a JSON object"]
+    problems = [f"missing {f}" for f in features if f not in data]
+    problems += [f"{f} is not a string" for f in features if f in data and not isinstance(data[f], str)]
+    if not problems and all(str(data[f]).strip().upper() in ("", "NA") for f in features):
+        problems.append("every field is NA")
+    return problems
+
+
+def check_consistency(data):
+    """Engineering sanity checks between the dimensions present in `data`."""
+    problems = []
+    bore, rod, od = (_number(data.get(k)) for k in ("bore_diameter", "rod_diameter", "outside_diameter"))
+    stroke, close = _number(data.get("stroke_length")), _number(data.get("close_length"))
+    if bore and rod and rod >= bore:
+        problems.append("rod_diameter is not smaller than bore_diameter")
+    if bore and od and bore >= od:
+        problems.append("bore_diameter is not smaller than outside_diameter")
+    if stroke is not None and "stroke_length" in data and stroke == 0:
+        problems.append("stroke_length is zero")
+    if stroke and close and close < stroke:
+        problems.append("close_length is shorter than stroke_length")
+    return problems
+
+
+def escalation_reasons(data, features, confidence):
+    """Why an extraction should be retried on a stronger tier; empty when it is accepted."""
+    reasons = check_schema(data, features)
+    if not reasons:
+        reasons = check_consistency(data)
+    threshold = ROUTING_CONFIG["confidence_threshold"]
+    if confidence is not None and confidence < threshold:
+        reasons.append(f"confidence {confidence:.2f} below {threshold}")
+    return reasons
+
+
+def orientation_reasons(data, confidence):
+    """Escalation reasons for an orientation answer."""
+    reasons = []
+    if not isinstance(data, dict) or data.get("rotation_angle_ccw") not in (0, 90, 180, 270):
+        reasons.append("invalid rotation angle")
+    threshold = ROUTING_CONFIG["confidence_threshold"]
+    if confidence is not None and confidence < threshold:
+        reasons.append(f"confidence {confidence:.2f} below {threshold}")
+    return reasons
+
+
+def pop_confidence(data):
+    """Removes the self-reported confidence from a model output and returns it as a float (or None)."""
+    if not isinstance(data, dict):
+        return None
+    try:
+        return float(data.pop(CONFIDENCE_FIELD))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# --- Reporting ---
+
+class RoutingStats:
+    """Calls made for one drawing."""
+
+    def __init__(self):
+        self.calls = []
+
+    def record(self, stage, tier, latency, usage, escalated_because=None):
+        self.calls.append({
+            "stage": stage,
+            "model": tier["model"],
+            "reasoning_effort": tier.get("reasoning_effort"),
+            "latency_s": round(latency, 3),
+            "prompt_tokens": (usage or {}).get("prompt_tokens", 0),
+            "completion_tokens": (usage or {}).get("completion_tokens", 0),
+            "cost_usd": call_cost(tier["model"], usage),
+            "escalated_because": escalated_because,
+        })
+
+    def summary(self):
+        stages = {c["stage"] for c in self.calls}
+        escalated = {c["stage"] for c in self.calls if c["escalated_because"]}
+        return {
+            "calls": len(self.calls),
+            "escalated_stages": sorted(escalated),
+            "escalation_rate": len(escalated) / len(stages) if stages else 0.0,
+            "model_latency_s": round(sum(c["latency_s"] for c in self.calls), 3),
+            "tokens": sum(c["prompt_tokens"] + c["completion_tokens"] for c in self.calls),
+            "cost_usd": round(sum(c["cost_usd"] for c in self.calls), 6),
+            "final_models": {c["stage"]: c["model"] + (f"/{c['reasoning_effort']}" if c["reasoning_effort"] else "")
+                             for c in self.calls},
+            "call_log": self.calls,
+        }
+
+
+def summarize_runs(summaries):
+    """Aggregates per-drawing RoutingStats summaries into a batch report."""
+    summaries = [s for s in summaries if s]
+    if not summaries:
+        return {"drawings": 0}
+    stage_calls, stage_escalations = {}, {}
+    for s in summaries:
+        for call in s["call_log"]:
+            stage_calls.setdefault(call["stage"], set()).add(id(s))
+            if call["escalated_because"]:
+                stage_escalations.setdefault(call["stage"], set()).add(id(s))
+    n = len(summaries)
+    return {
+        "drawings": n,
+        "escalation_rate_by_stage": {stage: len(stage_escalations.get(stage, ())) / len(ids)
+                                     for stage, ids in stage_calls.items()},
+        "drawings_with_escalation": sum(1 for s in summaries if s["escalated_stages"]) / n,
+        "mean_model_latency_s": round(sum(s["model_latency_s"] for s in summaries) / n, 3),
+        "mean_cost_usd": round(sum(s["cost_usd"] for s in summaries) / n, 6),
+        "mean_tokens": round(sum(s["tokens"] for s in summaries) / n, 1),
+    }
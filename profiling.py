@@ -0,0 +1,197 @@
+"""
+Opt-in profiling of the local CPU stages (render, rotate, encode, exports, ...).
+
+Enabled by PIPELINE_PROFILE=1 (run directory profiles/<timestamp>) or
+PIPELINE_PROFILE_DIR=<dir>, or by the --profile flag of the command-line tools.
+Functions decorated with @profile_stage("name") then get, per stage:
+  * <stage>.folded   collapsed stacks from a wall-clock sampler thread, ready for
+                     flamegraph.pl / speedscope / inferno;
+  * <stage>.pstats   merged cProfile statistics (open with pstats or snakeviz),
+                     plus <stage>.txt with the top functions by cumulative time;
+  * <stage>.alloc.txt top-N allocation sites by tracemalloc, sampled every
+                     PROFILE_ALLOC_EVERY calls;
+and stages.json with call counts and wall time. Files are written at exit or by
+dump().
+
+When profiling is disabled the decorator costs one global lookup per call.
+Stages run concurrently in the pipeline's thread pool, so allocation diffs can
+include other threads' allocations; the cProfile and stack data are per thread.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import pstats
+import cProfile
+import threading
+import functools
+import tracemalloc
+from collections import Counter
+
+PROFILE_SAMPLE_INTERVAL = 0.005   # seconds between stack samples
+PROFILE_ALLOC_EVERY = 10          # tracemalloc snapshot diff on every Nth call of a stage
+PROFILE_TOP_N = 25
+TRACEMALLOC_FRAMES = 1           # allocation sites are reported by line, so one frame is enough
+
+_profiler = None
+_OWN_FILES = (os.path.abspath(__file__), tracemalloc.__file__)
+
+
+class _Profiler:
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        self.lock = threading.Lock()
+        self.active = {}                 # thread id -> stack of stage names (stages can nest)
+        self.calls = Counter()
+        self.wall = Counter()
+        self.folded = {}                 # stage -> Counter of collapsed stacks
+        self.stats = {}                  # stage -> pstats.Stats
+        self.allocs = {}                 # stage -> Counter of "file:line" -> bytes
+        self.alloc_samples = Counter()
+        os.makedirs(run_dir, exist_ok=True)
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(PROFILE_SAMPLE_INTERVAL):
+            if not self.active:
+                continue
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, stages in list(self.active.items()):
+                    stage = stages[-1]
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        if os.path.abspath(code.co_filename) in _OWN_FILES:
+                            frame = frame.f_back
+                            continue
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    if stack:
+                        self.folded.setdefault(stage, Counter())[";".join(reversed(stack))] += 1
+
+    def run(self, stage, func, args, kwargs):
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.calls[stage] += 1
+            stages = self.active.setdefault(thread_id, [])
+            # A stage called from inside another one is sampled and timed, but its cProfile
+            # and allocation data stay with the outer stage.
+            nested = bool(stages)
+            stages.append(stage)
+            take_alloc = not nested and (PROFILE_ALLOC_EVERY == 1 or self.calls[stage] % PROFILE_ALLOC_EVERY == 1)
+        before = _snapshot() if take_alloc else None
+        profile = None if nested else cProfile.Profile()
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:
+                profile = None  # Python 3.12+ allows one active cProfile at a time; another thread has it
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            if profile is not None:
+                profile.disable()
+            after = _snapshot() if take_alloc else None
+            with self.lock:
+                stages.pop()
+                if not stages:
+                    del self.active[thread_id]
+                self.wall[stage] += elapsed
+                if profile is not None:
+                    if stage in self.stats:
+                        self.stats[stage].add(profile)
+                    else:
+                        self.stats[stage] = pstats.Stats(profile)
+                if after is not None:
+                    self.alloc_samples[stage] += 1
+                    sites = self.allocs.setdefault(stage, Counter())
+                    for diff in after.compare_to(before, "lineno")[:PROFILE_TOP_N * 4]:
+                        if diff.size_diff > 0:
+                            frame = diff.traceback[0]
+                            sites[f"{frame.filename}:{frame.lineno}"] += diff.size_diff
+
+    def dump(self):
+        with self.lock:
+            summary = {}
+            for stage, n in self.calls.items():
+                summary[stage] = {"calls": n, "wall_s": round(self.wall[stage], 4),
+                                  "mean_ms": round(1000 * self.wall[stage] / n, 3),
+                                  "alloc_samples": self.alloc_samples[stage]}
+                prefix = os.path.join(self.run_dir, stage)
+                if stage in self.folded:
+                    with open(prefix + ".folded", "w", encoding="utf-8") as f:
+                        for stack, count in self.folded[stage].most_common():
+                            f.write(f"{stack} {count}\n")
+                if stage in self.stats:
+                    self.stats[stage].dump_stats(prefix + ".pstats")
+                    with open(prefix + ".txt", "w", encoding="utf-8") as f:
+                        pstats.Stats(prefix + ".pstats", stream=f).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+                if stage in self.allocs:
+                    with open(prefix + ".alloc.txt", "w", encoding="utf-8") as f:
+                        f.write(f"Top {PROFILE_TOP_N} allocation sites over {self.alloc_samples[stage]} sampled calls "
+                                f"(bytes still allocated when the call returned)\n")
+                        for site, size in self.allocs[stage].most_common(PROFILE_TOP_N):
+                            f.write(f"{size / 1024:12.1f} KiB  {site}\n")
+            with open(os.path.join(self.run_dir, "stages.json"), "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
+        return summary
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, path) for path in _OWN_FILES])
+
+
+def enable(run_dir=None):
+    """Turns profiling on for the rest of the process; returns the run directory."""
+    global _profiler
+    if _profiler is None:
+        _profiler = _Profiler(run_dir or os.path.join("profiles", time.strftime("%Y%m%d-%H%M%S")))
+        atexit.register(dump)
+        print(f"-> Profiling CPU stages into {_profiler.run_dir}")
+    return _profiler.run_dir
+
+
+def is_enabled():
+    return _profiler is not None
+
+
+def dump():
+    """Writes the reports collected so far; returns the per-stage summary ({} when disabled)."""
+    return _profiler.dump() if _profiler is not None else {}
+
+
+def profile_stage(stage):
+    """Decorator marking a function as a profiled stage."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            return _profiler.run(stage, func, args, kwargs)
+        return wrapper
+    return decorate
+
+
+def add_argument(parser):
+    """Adds the --profile [DIR] flag to a command-line parser."""
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="DIR",
+                        help="Profile CPU stages (cProfile, stack samples, tracemalloc) into DIR "
+                             "(default profiles/<timestamp>).")
+
+
+def enable_from_args(args):
+    if getattr(args, "profile", None) is not None:
+        enable(args.profile or None)
+
+
+if os.getenv("PIPELINE_PROFILE_DIR") or os.getenv("PIPELINE_PROFILE", "0") == "1":
+    enable(os.getenv("PIPELINE_PROFILE_DIR"))
@@ -0,0 +1,214 @@
+"""
+Report writers for extraction records ({"filename": ..., "data": {...}}).
+
+Every writer streams: Excel files are written with xlsxwriter's
+constant_memory mode (one row flushed at a time), CSV row by row and
+Parquet in record batches, so exports of thousands of drawings never build
+a DataFrame or a pivot table.
+
+Layouts:
+  * wide  - one row per parameter, one column per file (the frontend report)
+  * long  - tidy Filename / Parameter / Value rows
+  * rows  - one row per file, one column per parameter (backend12.main output)
+
+`records` may be any iterable. Writers that need to see every record before
+the first row (wide and rows, to know the columns) also accept a zero-argument
+callable returning a fresh iterator, e.g. `lambda: store.iter_records()`, and
+then make two passes instead of holding the records. The wide layout is the
+exception to constant memory: its rows run across files, so its second pass
+keeps the value strings of the whole sheet (see write_wide_excel).
+"""
+import io
+import csv
+import json
+import xlsxwriter
+from profiling import profile_stage
+
+ERROR_PARAMETER = "Processing Error"
+PARQUET_BATCH_ROWS = 10000
+MAX_COLUMN_WIDTH = 80
+
+MIME_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "json": "application/json",
+}
+
+
+def param_label(key):
+    return str(key).replace("_", " ").title()
+
+
+def iter_long_rows(records):
+    """Yields (filename, parameter label, value) for every parameter of every record."""
+    for record in records:
+        filename = record.get("filename", "unknown file")
+        data = record.get("data") or {}
+        if "error" in data:
+            yield filename, ERROR_PARAMETER, str(data["error"])
+        else:
+            for key, value in data.items():
+                yield filename, param_label(key), "" if value is None else str(value)
+
+
+def _passes(records):
+    """Returns a function giving a fresh iterator over the records for each pass."""
+    if callable(records):
+        return records
+    if not isinstance(records, (list, tuple)):
+        records = list(records)
+    return lambda: iter(records)
+
+
+def _width(text):
+    return min(len(text) + 3, MAX_COLUMN_WIDTH)
+
+
+def _open_workbook(target):
+    return xlsxwriter.Workbook(target, {"constant_memory": True})
+
+
+def write_wide_excel(records, target):
+    """
+    Parameters down, files across. `target` is a path or a binary file object.
+    Memory grows with the number of values in the sheet, which Excel's 16,384 column
+    limit caps at about 16k files; use the long or rows layout for bigger exports.
+    """
+    iter_records = _passes(records)
+
+    # Pass 1: column order and widths only.
+    filenames, params = [], {}
+    first_width, file_widths = _width("Parameter"), []
+    for record in iter_records():
+        filenames.append(record.get("filename", "unknown file"))
+        width = _width(filenames[-1])
+        for _filename, param, value in iter_long_rows([record]):
+            params.setdefault(param, len(params))
+            first_width = max(first_width, _width(param))
+            width = max(width, _width(value))
+        file_widths.append(width)
+
+    workbook = _open_workbook(target)
+    worksheet = workbook.add_worksheet("Report")
+    bold_format = workbook.add_format({"bold": True})
+    worksheet.set_column(0, 0, first_width)
+    for col, width in enumerate(file_widths, start=1):
+        worksheet.set_column(col, col, width)
+    worksheet.write_row(0, 0, ["Parameter"] + filenames)
+
+    # Pass 2: one row per parameter. constant_memory needs rows written in order, so each
+    # row keeps only the values its files have ({column: value}), not the records.
+    table = [{} for _ in params]
+    for col, record in enumerate(iter_records(), start=1):
+        for _filename, param, value in iter_long_rows([record]):
+            table[params[param]][col] = value
+    for row_num, param in enumerate(params, start=1):
+        worksheet.write(row_num, 0, param, bold_format)
+        for col, value in table[row_num - 1].items():
+            worksheet.write(row_num, col, value)
+        table[row_num - 1] = None
+    workbook.close()
+
+
+def write_long_excel(records, target):
+    """Tidy Filename / Parameter / Value rows, streamed in a single pass."""
+    workbook = _open_workbook(target)
+    worksheet = workbook.add_worksheet("Report")
+    bold_format = workbook.add_format({"bold": True})
+    worksheet.set_column(0, 0, 40)
+    worksheet.set_column(1, 1, 28)
+    worksheet.set_column(2, 2, 40)
+    worksheet.write_row(0, 0, ["Filename", "Parameter", "Value"], bold_format)
+    for row_num, row in enumerate(iter_long_rows(records), start=1):
+        worksheet.write_row(row_num, 0, row)
+    workbook.close()
+
+
+def record_columns(records):
+    """Column order of the rows layout: filename, then parameters in first-seen order."""
+    columns = ["filename"]
+    seen = set(columns)
+    for record in records:
+        for key in (record.get("data") or {}):
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return columns
+
+
+def write_rows_excel(records, target, columns=None):
+    """One row per file with raw parameter keys as headers, like backend12.main()'s report."""
+    iter_records = _passes(records)
+    columns = columns or record_columns(iter_records())
+    workbook = _open_workbook(target)
+    worksheet = workbook.add_worksheet()
+    worksheet.write_row(0, 0, columns)
+    for row_num, record in enumerate(iter_records(), start=1):
+        row = {"filename": record.get("filename", "unknown file"), **(record.get("data") or {})}
+        worksheet.write_row(row_num, 0, ["" if row.get(col) is None else str(row.get(col, "")) for col in columns])
+    workbook.close()
+
+
+def write_long_csv(records, target):
+    """Tidy CSV. `target` is a path or a text file object."""
+    def _write(f):
+        writer = csv.writer(f)
+        writer.writerow(["Filename", "Parameter", "Value"])
+        writer.writerows(iter_long_rows(records))
+
+    if isinstance(target, str):
+        with open(target, "w", newline="", encoding="utf-8") as f:
+            _write(f)
+    else:
+        _write(target)
+
+
+def write_long_parquet(records, target, batch_rows=PARQUET_BATCH_ROWS):
+    """Tidy Parquet written in record batches. `target` is a path or a binary file object."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([("filename", pa.string()), ("parameter", pa.string()), ("value", pa.string())])
+    with pq.ParquetWriter(target, schema) as writer:
+        batch = ([], [], [])
+        for row in iter_long_rows(records):
+            for column, value in zip(batch, row):
+                column.append(value)
+            if len(batch[0]) >= batch_rows:
+                writer.write_batch(pa.record_batch([pa.array(c, pa.string()) for c in batch], schema=schema))
+                batch = ([], [], [])
+        if batch[0]:
+            writer.write_batch(pa.record_batch([pa.array(c, pa.string()) for c in batch], schema=schema))
+
+
+def write_json(records, target):
+    """JSON array of records, written one record at a time. `target` is a path."""
+    with open(target, "w", encoding="utf-8") as f:
+        f.write("[")
+        for n, record in enumerate(records):
+            f.write(("," if n else "") + "\n" + json.dumps(record, indent=2))
+        f.write("\n]\n")
+
+
+EXPORT_FORMATS = {
+    # label: (writer, file extension)
+    "Excel - one column per file": (write_wide_excel, "xlsx"),
+    "Excel - long (filename, parameter, value)": (write_long_excel, "xlsx"),
+    "Excel - one row per file": (write_rows_excel, "xlsx"),
+    "CSV - long": (write_long_csv, "csv"),
+    "Parquet - long": (write_long_parquet, "parquet"),
+}
+
+
+@profile_stage("export")
+def export_bytes(records, fmt):
+    """Runs one of EXPORT_FORMATS into memory and returns (bytes, extension, mime type)."""
+    writer, ext = EXPORT_FORMATS[fmt]
+    if ext == "csv":
+        buf = io.StringIO()
+        writer(records, buf)
+        return buf.getvalue().encode("utf-8"), ext, MIME_TYPES[ext]
+    buf = io.BytesIO()
+    writer(records, buf)
+    return buf.getvalue(), ext, MIME_TYPES[ext]
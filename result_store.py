@@ -0,0 +1,245 @@
+"""
+Persistent local store of extraction results.
+
+Results are kept in a SQLite database indexed by the SHA-256 of the input file
+and by the (normalised) drawing number and revision read from the title block.
+That lets the pipeline answer "have we already extracted DWG X rev 03?" before
+spending model calls, and lets the frontend and exports run filtered queries
+over tens of thousands of records without loading them all. The perceptual
+hash and detail thumbnail of each drawing are stored too, so near-duplicates
+of stored drawings can be found and confirmed (see dedup.py).
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from dedup import BKTree, DEFAULT_MAX_DISTANCE
+
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", "extraction_results.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    content_hash    TEXT NOT NULL,
+    filename        TEXT,
+    drawing_number  TEXT,
+    revision        TEXT,
+    drawing_key     TEXT,
+    revision_key    TEXT,
+    phash           TEXT,
+    detail          BLOB,
+    has_error       INTEGER NOT NULL DEFAULT 0,
+    data            TEXT NOT NULL,
+    provenance      TEXT NOT NULL,
+    created_at      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_hash ON results(content_hash);
+CREATE INDEX IF NOT EXISTS idx_results_drawing ON results(drawing_key, revision_key);
+CREATE INDEX IF NOT EXISTS idx_results_filename ON results(filename);
+CREATE INDEX IF NOT EXISTS idx_results_error ON results(has_error);
+"""
+
+
+def content_hash(file_bytes):
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def normalize_drawing_number(value):
+    """Drawing numbers are matched case- and whitespace-insensitively; 'NA' counts as unknown."""
+    if value is None:
+        return None
+    key = "".join(str(value).split()).upper()
+    return key if key and key != "NA" else None
+
+
+def normalize_revision(value):
+    """Revisions are compared as two-digit strings ('3' == '03'); a missing revision is '00'."""
+    if value is None:
+        return "00"
+    key = "".join(str(value).split()).upper()
+    for prefix in ("REVISION", "REV.", "REV"):
+        if key.startswith(prefix):
+            key = key[len(prefix):]
+    if not key or key == "NA":
+        return "00"
+    return key.zfill(2) if key.isdigit() else key
+
+
+class ResultStore:
+    """Thread-safe wrapper around the results database."""
+
+    def __init__(self, path=RESULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._phash_tree = BKTree()   # perceptual hashes of successful results -> row id
+        self._phash_last_id = 0       # rows up to this id are in the tree
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(results)")}
+            # Databases created before perceptual hashes and detail thumbnails were stored.
+            for column, column_type in (("phash", "TEXT"), ("detail", "BLOB")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE results ADD COLUMN {column} {column_type}")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _to_record(row):
+        return {
+            "id": row["id"],
+            "filename": row["filename"],
+            "content_hash": row["content_hash"],
+            "drawing_number": row["drawing_number"],
+            "revision": row["revision"],
+            "data": json.loads(row["data"]),
+            "provenance": json.loads(row["provenance"]),
+            "created_at": row["created_at"],
+        }
+
+    def save(self, file_hash, filename, data, provenance=None, phash=None, detail=None):
+        """
+        Stores one result and returns its row id. `phash` and `detail` (packed thumbnail) are
+        dedup.hash_drawing()'s of the page as rendered, before any rotation.
+        """
+        data = data or {}
+        drawing_number = data.get("drawing_number")
+        revision = data.get("revision")
+        provenance = dict(provenance or {})
+        provenance.setdefault("stored_at", time.time())
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO results (content_hash, filename, drawing_number, revision, drawing_key, revision_key,"
+                " phash, detail, has_error, data, provenance, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (file_hash, filename, drawing_number, revision,
+                 normalize_drawing_number(drawing_number), normalize_revision(revision),
+                 None if phash is None else f"{phash:016x}", detail, 1 if "error" in data else 0,
+                 json.dumps(data), json.dumps(provenance), time.time())
+            )
+            self._conn.commit()
+            return cur.lastrowid
+
+    def get_by_hash(self, file_hash):
+        """Latest successful result for exactly this file content, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM results WHERE content_hash = ? AND has_error = 0 ORDER BY id DESC LIMIT 1",
+                (file_hash,)
+            ).fetchone()
+        return self._to_record(row) if row else None
+
+    def get_by_drawing(self, drawing_number, revision):
+        """Latest successful result for a drawing number and revision, or None."""
+        drawing_key = normalize_drawing_number(drawing_number)
+        if not drawing_key:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM results WHERE drawing_key = ? AND revision_key = ? AND has_error = 0"
+                " ORDER BY id DESC LIMIT 1",
+                (drawing_key, normalize_revision(revision))
+            ).fetchone()
+        return self._to_record(row) if row else None
+
+    def find_similar(self, hashes, max_distance=DEFAULT_MAX_DISTANCE, limit=5):
+        """
+        Successful results whose perceptual hash is within max_distance of any of `hashes`
+        (dedup.hash_drawing()'s rotations), closest first. Each record also carries "rotation",
+        the index of the closest of `hashes`, and its packed "detail" thumbnail (or None).
+        Candidates only: confirm them with dedup.same_drawing().
+        """
+        with self._lock:
+            # Pick up rows saved since the last call, by this or another process.
+            rows = self._conn.execute(
+                "SELECT id, phash FROM results WHERE id > ? AND phash IS NOT NULL AND has_error = 0 ORDER BY id",
+                (self._phash_last_id,)
+            ).fetchall()
+            for row in rows:
+                self._phash_tree.add(int(row["phash"], 16), row["id"])
+            if rows:
+                self._phash_last_id = rows[-1]["id"]
+            best = {}
+            for rotation, h in enumerate(hashes):
+                for distance, row_id in self._phash_tree.search(h, max_distance):
+                    best[row_id] = min((distance, rotation), best.get(row_id, (distance, rotation)))
+            ids = sorted(best, key=lambda row_id: (best[row_id][0], -row_id))[:limit]
+            if not ids:
+                return []
+            found = self._conn.execute(
+                f"SELECT * FROM results WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        by_id = {row["id"]: dict(self._to_record(row), rotation=best[row["id"]][1], detail=row["detail"])
+                 for row in found}
+        return [by_id[row_id] for row_id in ids]
+
+    def has_drawing_numbers(self):
+        """True if any successful result has a drawing number, i.e. get_by_drawing() can match anything."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM results WHERE drawing_key IS NOT NULL AND has_error = 0 LIMIT 1"
+            ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def _where(drawing_number=None, revision=None, filename=None, has_error=None, param=None, value=None,
+               latest_only=False):
+        clauses, args = [], []
+        if drawing_number:
+            clauses.append("drawing_key LIKE ?")
+            args.append(f"%{normalize_drawing_number(drawing_number) or ''}%")
+        if revision:
+            clauses.append("revision_key = ?")
+            args.append(normalize_revision(revision))
+        if filename:
+            clauses.append("filename LIKE ?")
+            args.append(f"%{filename}%")
+        if has_error is not None:
+            clauses.append("has_error = ?")
+            args.append(1 if has_error else 0)
+        if param:
+            clauses.append("json_extract(data, ?) LIKE ?")
+            args.extend([f"$.{param}", f"%{value or ''}%"])
+        if latest_only:
+            clauses.append("id IN (SELECT MAX(id) FROM results GROUP BY content_hash)")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def count(self, **filters):
+        where, args = self._where(**filters)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM results{where}", args).fetchone()[0]
+
+    def query(self, limit=50, offset=0, **filters):
+        """
+        Filtered, newest-first page of records. Filters: drawing_number (substring), revision,
+        filename (substring), has_error, param + value (substring of that parameter), latest_only.
+        """
+        where, args = self._where(**filters)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM results{where} ORDER BY id DESC LIMIT ? OFFSET ?", args + [limit, offset]
+            ).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    def iter_records(self, chunk_size=1000, **filters):
+        """Streams matching records (oldest first) in chunks, for exports."""
+        where, args = self._where(**filters)
+        last_id = 0
+        while True:
+            clause = (where + " AND" if where else " WHERE") + " id > ?"
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT * FROM results{clause} ORDER BY id LIMIT ?", args + [last_id, chunk_size]
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._to_record(row)
+            last_id = rows[-1]["id"]
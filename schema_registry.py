@@ -0,0 +1,309 @@
+"""
+Schema registry and feature-group planner.
+
+Every component family is a template: the fields to extract (JSON type, whether
+the field is important or optional, a prior difficulty, and an optional
+cluster of fields that must be read together), plus prompt overrides. Templates
+are compiled once at import into the schema properties and field lists the
+pipeline uses. Extra templates can be added in a JSON file named by
+COMPONENT_TEMPLATES_PATH.
+
+plan_feature_groups() decides how many parallel extraction calls to make and
+which fields go in each. It weighs the wall time of the slowest call (calls run
+concurrently) against the tokens of every extra call (each one re-sends the
+prompt and the image), and keeps every call under a difficulty load, using
+per-field difficulty, latency and output tokens measured into field_stats.json
+(see measure_field_stats) or the template priors. Optional fields are simply
+more fields to plan, so enabling them spreads them over the parallel calls
+instead of adding a sequential round trip.
+
+Each planned call is named after its fields (group_name), not its position, so
+routing overrides, Batch API custom_ids, hedging keys and evaluation cassettes
+see the same name for the same group in every process, even when a new
+field_stats.json changes the plan. Long-running callers plan once per run and
+record the plan with their results.
+
+Usage:
+    python schema_registry.py plan [--template cylinder] [--optional]
+    python schema_registry.py measure [--report eval_report.json] [--store extraction_results.sqlite3]
+"""
+import os
+import json
+import hashlib
+import argparse
+
+FIELD_STATS_PATH = os.getenv("FIELD_STATS_PATH", "field_stats.json")
+COMPONENT_TEMPLATES_PATH = os.getenv("COMPONENT_TEMPLATES_PATH")
+DEFAULT_TEMPLATE = "cylinder"
+
+# Planner cost model
+CALL_BASE_LATENCY_S = 8.0      # upload fetch, image encoding and prompt processing of one call
+FIELD_LATENCY_S = 3.0          # seconds of model time for a field of difficulty 0.5
+FIELD_TOKENS = 60              # output tokens per field when nothing was measured
+CALL_OVERHEAD_TOKENS = 2500    # prompt + high-detail image, paid again by every call
+TOKENS_PER_SECOND = 300        # tokens worth spending to save one second of wall time
+MAX_CALL_LOAD = 4.0            # summed field difficulty one call is trusted with
+OVERLOAD_PENALTY = 20000       # per unit of load above MAX_CALL_LOAD
+MAX_CALLS = 4
+
+
+def _field(name, group="important", difficulty=0.5, cluster=None, type="string", description=None):
+    spec = {"name": name, "group": group, "difficulty": difficulty, "cluster": cluster, "type": type}
+    if description:
+        spec["description"] = description
+    return spec
+
+
+TEMPLATES = {
+    "cylinder": {
+        "label": "CYLINDER,HYD/PNUEMATIC",
+        # None keeps backend12's cylinder extraction prompt.
+        "system_prompt": None,
+        "instructions": None,
+        "extra_properties": {
+            "close_length_reasoning": {
+                "type": "string",
+                "description": "Step-by-step reasoning and justification for the extracted close length value. Mention what values were used, whether it was explicitly found or inferred, and how."
+            }
+        },
+        "fields": [
+            _field("cylinder_action", difficulty=0.2),
+            _field("bore_diameter", difficulty=0.3, cluster="diameters"),
+            _field("outside_diameter", difficulty=0.4, cluster="diameters"),
+            _field("rod_diameter", difficulty=0.3, cluster="diameters"),
+            _field("stroke_length", difficulty=0.4, cluster="lengths"),
+            _field("close_length", difficulty=0.8, cluster="lengths"),
+            _field("operating_pressure", difficulty=0.3),
+            _field("operating_temperature", difficulty=0.4),
+            _field("mounting", difficulty=0.5),
+            _field("rod_end", difficulty=0.5),
+            _field("fluid", difficulty=0.2),
+            _field("drawing_number", difficulty=0.1, cluster="title_block"),
+            _field("revision", difficulty=0.2, cluster="title_block"),
+            _field("body_material", "optional", 0.4),
+            _field("piston_material", "optional", 0.5),
+            _field("cylinder_configuration", "optional", 0.5),
+            _field("cylinder_style", "optional", 0.5),
+            _field("rated_load", "optional", 0.6),
+            _field("standard", "optional", 0.5),
+            _field("surface_finish", "optional", 0.5),
+            _field("coating_thickness", "optional", 0.6),
+            _field("special_features", "optional", 0.6),
+            _field("concentricity_of_rod_and_tube", "optional", 0.7),
+        ],
+    },
+}
+
+
+def compile_template(name, template):
+    """Builds the lookups the pipeline needs from a template definition."""
+    fields = {spec["name"]: spec for spec in template["fields"]}
+    properties = {}
+    for spec in template["fields"]:
+        prop = {"type": spec.get("type", "string")}
+        if spec.get("description"):
+            prop["description"] = spec["description"]
+        properties[spec["name"]] = prop
+    important = [f for f, spec in fields.items() if spec.get("group", "important") == "important"]
+    return {
+        "name": name,
+        "label": template.get("label", name),
+        "system_prompt": template.get("system_prompt"),
+        "instructions": template.get("instructions"),
+        "extra_properties": template.get("extra_properties", {}),
+        "fields": fields,
+        "properties": properties,
+        "important": important,
+        "optional": [f for f in fields if f not in important],
+        "schema": {"type": "object", "properties": {f: properties[f] for f in important}, "required": important},
+    }
+
+
+def _load_templates():
+    templates = dict(TEMPLATES)
+    if COMPONENT_TEMPLATES_PATH and os.path.exists(COMPONENT_TEMPLATES_PATH):
+        with open(COMPONENT_TEMPLATES_PATH, "r", encoding="utf-8") as f:
+            templates.update(json.load(f))
+    return {name: compile_template(name, t) for name, t in templates.items()}
+
+
+# Compiled once at startup.
+REGISTRY = _load_templates()
+
+
+def get_template(name=None):
+    name = name or DEFAULT_TEMPLATE
+    if name not in REGISTRY:
+        raise KeyError(f"Unknown component template '{name}'. Known: {', '.join(REGISTRY)}")
+    return REGISTRY[name]
+
+
+def template_fields(name=None, include_optional=False):
+    """Fields extracted for a template; include_optional is a bool or a list of optional field names."""
+    template = get_template(name)
+    if include_optional is True:
+        return template["important"] + template["optional"]
+    if include_optional:
+        return template["important"] + [f for f in template["optional"] if f in include_optional]
+    return list(template["important"])
+
+
+# --- Measured field statistics ---
+
+def load_field_stats(path=FIELD_STATS_PATH):
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def field_profile(template, field, stats=None):
+    """(difficulty, latency seconds, output tokens) of a field: measured when available, else priors."""
+    measured = (stats or {}).get(template["name"], {}).get(field, {})
+    difficulty = measured.get("difficulty", template["fields"][field].get("difficulty", 0.5))
+    latency = measured.get("latency_s", FIELD_LATENCY_S * (0.5 + difficulty))
+    tokens = measured.get("tokens", FIELD_TOKENS)
+    return difficulty, latency, tokens
+
+
+# --- Planning ---
+
+def _units(template, fields, stats):
+    """Groups fields into clusters that must share a call; returns [(fields, difficulty, latency, tokens)]."""
+    units = {}
+    for field in fields:
+        key = template["fields"][field].get("cluster") or field
+        units.setdefault(key, []).append(field)
+    result = []
+    for members in units.values():
+        profiles = [field_profile(template, f, stats) for f in members]
+        result.append((members, sum(p[0] for p in profiles), sum(p[1] for p in profiles), sum(p[2] for p in profiles)))
+    return result
+
+
+def _pack(units, n_calls):
+    """Longest-processing-time packing of units into n_calls bins balanced on latency."""
+    bins = [{"fields": [], "difficulty": 0.0, "latency": 0.0, "tokens": 0} for _ in range(n_calls)]
+    for members, difficulty, latency, tokens in sorted(units, key=lambda u: (-u[2], u[0][0])):
+        target = min(bins, key=lambda b: b["latency"])
+        target["fields"].extend(members)
+        target["difficulty"] += difficulty
+        target["latency"] += latency
+        target["tokens"] += tokens
+    return [b for b in bins if b["fields"]]
+
+
+def _plan_cost(bins):
+    wall = CALL_BASE_LATENCY_S + max(b["latency"] for b in bins)
+    tokens = sum(CALL_OVERHEAD_TOKENS + b["tokens"] for b in bins)
+    overload = sum(max(0.0, b["difficulty"] - MAX_CALL_LOAD) for b in bins)
+    return wall * TOKENS_PER_SECOND + tokens + overload * OVERLOAD_PENALTY, wall, tokens
+
+
+def group_name(fields):
+    """Name of a feature group derived from its members: its first field plus a digest of all of them."""
+    digest = hashlib.sha1(",".join(sorted(fields)).encode("utf-8")).hexdigest()[:6]
+    return f"{fields[0]}-{digest}"
+
+
+def name_feature_groups(groups):
+    """{group_name(fields): fields} for a list of field lists."""
+    return {group_name(fields): list(fields) for fields in groups}
+
+
+def plan_feature_groups(template_name=None, include_optional=False, stats=None, max_calls=MAX_CALLS,
+                        explain=False):
+    """
+    Returns {group name: [fields], ...}: the parallel extraction calls for a template, named
+    by group_name(). Fields keep the template order within a call, and calls are ordered by
+    their first field. With explain=True, returns (batches, estimate).
+    """
+    template = get_template(template_name)
+    stats = load_field_stats() if stats is None else stats
+    fields = template_fields(template_name, include_optional)
+    units = _units(template, fields, stats)
+    best = None
+    for n_calls in range(1, min(max_calls, len(units)) + 1):
+        bins = _pack(units, n_calls)
+        cost, wall, tokens = _plan_cost(bins)
+        if best is None or cost < best[0]:
+            best = (cost, wall, tokens, bins)
+    _cost, wall, tokens, bins = best
+    order = {f: n for n, f in enumerate(fields)}
+    bins.sort(key=lambda b: min(order[f] for f in b["fields"]))
+    groups = [sorted(b["fields"], key=order.get) for b in bins]
+    batches = name_feature_groups(groups)
+    if explain:
+        return batches, {"calls": len(batches), "est_wall_s": round(wall, 1), "est_tokens": tokens,
+                         "load": {group_name(g): round(b["difficulty"], 2) for g, b in zip(groups, bins)}}
+    return batches
+
+
+def measure_field_stats(store=None, eval_report=None, template_name=None, path=FIELD_STATS_PATH):
+    """
+    Derives per-field difficulty, latency and output tokens and writes them to `path`.
+    Latency and tokens come from the routing call log of stored results (a call's time
+    beyond CALL_BASE_LATENCY_S, which _plan_cost adds once per call, and its completion
+    tokens are shared evenly by its fields); difficulty is 1 - the
+    normalized match rate of the best configuration in an evaluate.py report.
+    """
+    template = get_template(template_name)
+    sums = {}
+    if store is not None:
+        for record in store.iter_records(has_error=False):
+            provenance = record.get("provenance") or {}
+            batches = provenance.get("feature_batches") or {}
+            for call in (provenance.get("routing") or {}).get("call_log", []):
+                fields = [f for f in batches.get(call["stage"], []) if f in template["fields"]]
+                for field in fields:
+                    entry = sums.setdefault(field, {"n": 0, "latency_s": 0.0, "tokens": 0.0})
+                    entry["n"] += 1
+                    entry["latency_s"] += max(call["latency_s"] - CALL_BASE_LATENCY_S, 0.0) / len(fields)
+                    entry["tokens"] += call["completion_tokens"] / len(fields)
+    stats = load_field_stats(path)
+    measured = stats.setdefault(template["name"], {})
+    for field, entry in sums.items():
+        measured.setdefault(field, {}).update({"latency_s": round(entry["latency_s"] / entry["n"], 3),
+                                               "tokens": round(entry["tokens"] / entry["n"], 1)})
+    if eval_report:
+        best = max(eval_report, key=lambda e: e.get("normalized_match") or 0.0)
+        for field, rates in best["per_field"].items():
+            if field in template["fields"]:
+                measured.setdefault(field, {})["difficulty"] = round(1.0 - rates["normalized"], 3)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Component templates and extraction-call planning.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_plan = sub.add_parser("plan", help="Show the extraction calls planned for a template.")
+    p_plan.add_argument("--template", default=DEFAULT_TEMPLATE)
+    p_plan.add_argument("--optional", action="store_true", help="Include the template's optional fields.")
+    p_measure = sub.add_parser("measure", help="Update field_stats.json from stored results and an eval report.")
+    p_measure.add_argument("--template", default=DEFAULT_TEMPLATE)
+    p_measure.add_argument("--report", help="evaluate.py JSON report.")
+    p_measure.add_argument("--store", help="Result store database.")
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        batches, estimate = plan_feature_groups(args.template, args.optional, explain=True)
+        for batch_name, fields in batches.items():
+            print(f"{batch_name} (load {estimate['load'][batch_name]}): {', '.join(fields)}")
+        print(f"Estimated wall time {estimate['est_wall_s']}s, {estimate['est_tokens']} tokens per drawing.")
+    else:
+        report = None
+        if args.report:
+            with open(args.report, "r", encoding="utf-8") as f:
+                report = json.load(f)
+        store = None
+        if args.store:
+            from result_store import ResultStore
+            store = ResultStore(args.store)
+        measure_field_stats(store, report, args.template)
+        print(f" Done: field statistics saved to {FIELD_STATS_PATH}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Bounded-concurrency batch runner (process_many_async) with the per-file pipeline faked."""
+import asyncio
+
+import pytest
+
+backend12 = pytest.importorskip("backend12")  # needs the pipeline's dependencies
+
+
+class Source:
+    def __init__(self, name):
+        self.name = name
+
+    def read(self):
+        return self.name.encode()
+
+
+def run_many(sources, concurrency):
+    async def collect():
+        return [pair async for pair in backend12.process_many_async(sources, concurrency)]
+    return asyncio.run(collect())
+
+
+def test_bounded_concurrency_and_one_result_per_file(monkeypatch):
+    in_flight = []
+    peak = []
+
+    async def fake_pipeline(file_bytes, filename, *args, **kwargs):
+        in_flight.append(filename)
+        peak.append(len(in_flight))
+        yield {"status": "Working...", "progress": 0.5}
+        await asyncio.sleep(0.01 * (len(filename) % 3))
+        if filename == "bad-7.pdf":
+            in_flight.remove(filename)
+            raise RuntimeError("pdfium exploded")
+        in_flight.remove(filename)
+        yield {"final_result": {"data": {"source": file_bytes.decode()}}, "progress": 1.0}
+
+    monkeypatch.setattr(backend12, "process_single_file_async", fake_pipeline)
+    names = [f"bad-{i}.pdf" if i == 7 else f"drawing-{i}.pdf" for i in range(25)]
+    events = run_many(iter([Source(n) for n in names]), concurrency=4)
+
+    assert max(peak) <= 4
+    finals = {}
+    for source, event in events:
+        if "final_result" in event or "error" in event:
+            assert source.name not in finals, "exactly one final event per file"
+            finals[source.name] = event
+    assert sorted(finals) == sorted(names)
+    assert "pdfium exploded" in finals["bad-7.pdf"]["error"]
+    for name in names:
+        if name != "bad-7.pdf":
+            assert finals[name]["final_result"]["data"] == {"source": name}
+
+
+def test_sources_are_read_only_when_a_slot_is_free(monkeypatch):
+    reads, finished, held = [], [], []
+
+    class CountingSource(Source):
+        def read(self):
+            reads.append(self.name)
+            held.append(len(reads) - len(finished))  # files read but not finished, this one included
+            return super().read()
+
+    async def fake_pipeline(file_bytes, filename, *args, **kwargs):
+        await asyncio.sleep(0.01)
+        finished.append(filename)
+        yield {"final_result": {"data": {}}, "progress": 1.0}
+
+    monkeypatch.setattr(backend12, "process_single_file_async", fake_pipeline)
+    run_many((CountingSource(f"d{i}.pdf") for i in range(10)), concurrency=2)
+    assert len(reads) == 10
+    assert max(held) <= 2
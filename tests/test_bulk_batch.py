@@ -0,0 +1,85 @@
+"""Offline bulk round trip: requests file -> simulate -> ingest, without network access."""
+import json
+
+import pytest
+
+bulk_batch = pytest.importorskip("bulk_batch")  # imports backend12 and its dependencies
+
+# Batch names chosen so that lexical order ("batch10" < "batch2") differs from plan order.
+PLAN = {
+    "batch2": ["bore_diameter", "rod_diameter"],
+    "batch10": ["stroke_length", "drawing_number"],
+}
+PLANNED_FIELDS = [f for features in PLAN.values() for f in features]
+
+
+def planned(data):
+    """The planned fields of a record, in record order (templates add extra properties)."""
+    return {k: v for k, v in data.items() if k in PLANNED_FIELDS}
+
+
+def write_requests(path, filenames, plan=PLAN):
+    with open(path, "w", encoding="utf-8") as f:
+        for name in filenames:
+            for index, (batch_name, features) in enumerate(plan.items()):
+                f.write(json.dumps({
+                    "custom_id": bulk_batch.make_custom_id(name, batch_name, index, len(plan)),
+                    "method": "POST",
+                    "url": bulk_batch.BATCH_ENDPOINT,
+                    "body": bulk_batch.build_extraction_payload("https://example.invalid/drawing.png", features),
+                }) + "\n")
+
+
+def reverse_lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(reversed(lines))
+
+
+def test_custom_id_round_trip():
+    custom_id = bulk_batch.make_custom_id("a::b.pdf", "batch10", 1, 2)
+    assert bulk_batch.parse_custom_id(custom_id) == ("a::b.pdf", "batch10", 1, 2)
+
+
+def test_simulate_then_ingest_merges_in_plan_order(tmp_path):
+    requests_path = tmp_path / "batch_requests.jsonl"
+    results_path = tmp_path / "results.jsonl"
+    write_requests(requests_path, ["a.pdf", "b.pdf"])
+    bulk_batch.simulate(str(requests_path), str(results_path), value="42")
+    reverse_lines(results_path)  # the Batch API returns results in any order
+
+    records = list(bulk_batch.iter_ingested_records(str(results_path)))
+
+    assert sorted(r["filename"] for r in records) == ["a.pdf", "b.pdf"]
+    for record in records:
+        assert list(planned(record["data"])) == PLANNED_FIELDS
+        assert set(record["data"].values()) == {"42"}
+
+
+def test_ingest_reports_failed_and_missing_drawings(tmp_path):
+    requests_path = tmp_path / "batch_requests.jsonl"
+    results_path = tmp_path / "results.jsonl"
+    manifest_path = tmp_path / "batch_requests.manifest.jsonl"
+    write_requests(requests_path, ["ok.pdf", "partial.pdf"])
+    bulk_batch.simulate(str(requests_path), str(results_path))
+    with open(results_path, "r", encoding="utf-8") as f:
+        lines = [line for line in f if "partial.pdf::batch10" not in line]
+    with open(results_path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        for entry in ({"filename": "ok.pdf"}, {"filename": "partial.pdf"},
+                      {"filename": "broken.pdf", "error": "Failed to convert PDF to image."}):
+            f.write(json.dumps(entry) + "\n")
+
+    json_path = tmp_path / "extracted_data.json"
+    n_records = bulk_batch.ingest(str(results_path), str(manifest_path), str(json_path),
+                                  str(tmp_path / "extracted_data.xlsx"))
+
+    with open(json_path, "r", encoding="utf-8") as f:
+        records = {r["filename"]: r["data"] for r in json.load(f)}
+    assert n_records == 3
+    assert planned(records["ok.pdf"]) == {f: "NA" for f in PLANNED_FIELDS}
+    assert records["partial.pdf"] == {"error": "Missing batch results for this drawing."}
+    assert records["broken.pdf"] == {"error": "Failed to convert PDF to image."}
+    assert (tmp_path / "extracted_data.xlsx").exists()
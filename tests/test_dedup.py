@@ -0,0 +1,53 @@
+"""Near-duplicates are confirmed on the detail thumbnail and grouped within a run."""
+import io
+import asyncio
+
+from PIL import Image, ImageDraw
+
+from dedup import RunDuplicates, hash_drawing, same_drawing
+
+
+def drawing(label, rotate=0, quality=95):
+    image = Image.new("L", (1600, 1100), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([30, 30, 1570, 1070], outline=0, width=4)
+    draw.rectangle([200, 300, 1000, 600], outline=0, width=5)
+    draw.rectangle([1100, 900, 1570, 1070], outline=0, width=3)
+    draw.text((1120, 920), label, fill=0, font_size=40)
+    buf = io.BytesIO()
+    image.rotate(rotate, expand=True).convert("RGB").save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def test_reencoded_and_rotated_copies_are_confirmed():
+    original = hash_drawing(drawing("DWG 1234 REV 03"))
+    reencoded = hash_drawing(drawing("DWG 1234 REV 03", quality=60))
+    rotated = hash_drawing(drawing("DWG 1234 REV 03", rotate=90))
+    assert same_drawing(reencoded["detail"], original["detail"])
+    # The stored page is the copy turned one quarter turn back.
+    assert same_drawing(rotated["detail"], original["detail"], rotation=3)
+
+
+def test_changed_title_block_is_not_confirmed():
+    original = hash_drawing(drawing("DWG 1234 REV 03"))
+    changed = hash_drawing(drawing("DWG 1234 REV 04"))
+    assert not same_drawing(changed["detail"], original["detail"])
+
+
+def test_run_duplicates_join_the_first_copy():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        duplicates = RunDuplicates()
+        first, second, other = loop.create_future(), loop.create_future(), loop.create_future()
+        assert duplicates.join_content("h1", first) is None
+        assert duplicates.join_content("h1", second) is first
+
+        assert duplicates.join_similar(hash_drawing(drawing("DWG 1234 REV 03")), first) is None
+        assert duplicates.join_similar(hash_drawing(drawing("DWG 1234 REV 03", quality=60)), second) == (first, 0)
+        assert duplicates.join_similar(hash_drawing(drawing("DWG 9999 REV 01")), other) is None
+
+        # A copy whose first drawing failed is processed on its own.
+        first.set_result(None)
+        assert duplicates.join_content("h1", second) is None
+
+    asyncio.run(scenario())
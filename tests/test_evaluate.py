@@ -0,0 +1,83 @@
+"""Record / replay round trip of the evaluation harness's EvalClient."""
+import json
+import asyncio
+
+import pytest
+
+evaluate = pytest.importorskip("evaluate")  # imports backend12 and its dependencies
+import httpx
+import backend12
+
+LABELS = {"a.png": {"bore_diameter": "60"}, "b.png": {"bore_diameter": "75"}}
+
+
+def fake_api(calls):
+    """Upload host and chat completions answering every field; streamed when asked to."""
+    def handler(request):
+        calls.append(str(request.url))
+        if "imgbb" in str(request.url):
+            return httpx.Response(200, json={"success": True, "data": {"url": f"https://img.invalid/{len(calls)}"}})
+        body = json.loads(request.content)
+        answer = {field: "NA" for field in backend12.FULL_SCHEMA["properties"]}
+        answer.update(bore_diameter="60", rotation_angle_ccw=0, confidence=0.95)
+        content = json.dumps(answer)
+        if not body.get("stream"):
+            return httpx.Response(200, json={"choices": [{"message": {"content": content}}], "usage": {}})
+        chunks = [content[i:i + 40] for i in range(0, len(content), 40)]
+        lines = [f"data: {json.dumps({'choices': [{'delta': {'content': c}}]})}\n\n" for c in chunks]
+        return httpx.Response(200, content="".join(lines + ["data: [DONE]\n\n"]).encode(),
+                              headers={"content-type": "text/event-stream"})
+    return handler
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    from PIL import Image, ImageDraw
+    corpus_dir = tmp_path / "corpus"
+    corpus_dir.mkdir()
+    for name in LABELS:
+        image = Image.new("RGB", (300, 200), "white")
+        ImageDraw.Draw(image).text((20, 20), name, fill="black")
+        image.save(corpus_dir / name)
+    monkeypatch.setattr(backend12, "IMGBB_API_KEY", "test")
+    return corpus_dir
+
+
+def run(corpus_dir, cassettes, mode, calls, configs):
+    def client():
+        return httpx.AsyncClient(transport=httpx.MockTransport(fake_api(calls)))
+    evaluate.new_async_client = client
+    try:
+        return asyncio.run(evaluate.evaluate_async(str(corpus_dir), LABELS, configs, mode, str(cassettes)))
+    finally:
+        evaluate.new_async_client = backend12.new_async_client
+
+
+def test_record_then_replay_without_network(corpus, tmp_path):
+    cassettes = tmp_path / "cassettes"
+    configs = [{"name": "baseline"}]
+    recorded_calls, replayed_calls = [], []
+
+    [recorded] = run(corpus, cassettes, "record", recorded_calls, configs)
+    [replayed] = run(corpus, cassettes, "replay", replayed_calls, configs)
+
+    assert recorded_calls and replayed_calls == []
+    assert sorted(p.name for p in cassettes.iterdir()) == ["a.png.json", "b.png.json"]
+    for entry in (recorded, replayed):
+        assert entry["errors"] == 0 and entry["replay_misses"] == 0
+        assert entry["normalized_match"] == 0.5  # the fake API reads 60 on both drawings
+    assert [r["data"] for r in replayed["drawings_detail"]] == [r["data"] for r in recorded["drawings_detail"]]
+
+
+def test_replay_miss_is_reported(corpus, tmp_path):
+    cassettes = tmp_path / "cassettes"
+    run(corpus, cassettes, "record", [], [{"name": "baseline"}])
+
+    # Validation adds requests that were never recorded.
+    [entry] = run(corpus, cassettes, "replay", [], [{"name": "validation_on", "validation": True}])
+    assert entry["replay_misses"] > 0
+
+    client = evaluate.EvalClient("replay", str(tmp_path / "missing.json"))
+    with pytest.raises(RuntimeError, match="No recorded response"):
+        asyncio.run(client.post("https://api.invalid/v1/chat/completions", json={"model": "m"}))
+    assert client.misses == 1
@@ -0,0 +1,34 @@
+"""Pattern parsing and lazy folder listing."""
+from file_source import SUPPORTED_PATTERNS, FileSource, list_files, parse_patterns
+
+
+def make_tree(root):
+    for rel_path in ("b.PNG", "a.pdf", "notes.txt", "sub/c.jpg", "sub/deeper/d.pdf", "other/e.png"):
+        path = root.joinpath(*rel_path.split("/"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(rel_path.encode())
+
+
+def test_parse_patterns():
+    assert parse_patterns(" *.pdf ,sub/*.jpg,, ") == ("*.pdf", "sub/*.jpg")
+    assert parse_patterns("") == SUPPORTED_PATTERNS
+    assert parse_patterns(None) == SUPPORTED_PATTERNS
+
+
+def test_recursive_listing_uses_relative_names(tmp_path):
+    make_tree(tmp_path)
+    sources = list(list_files(str(tmp_path)))
+    assert [s.name for s in sources] == ["a.pdf", "b.PNG", "other/e.png", "sub/c.jpg", "sub/deeper/d.pdf"]
+    assert all(isinstance(s, FileSource) for s in sources)
+    assert sources[3].read() == b"sub/c.jpg" and sources[3].size == len(b"sub/c.jpg")
+
+
+def test_non_recursive_listing_stays_in_the_folder(tmp_path):
+    make_tree(tmp_path)
+    assert [s.name for s in list_files(str(tmp_path), recursive=False)] == ["a.pdf", "b.PNG"]
+
+
+def test_patterns_match_the_name_or_the_relative_path(tmp_path):
+    make_tree(tmp_path)
+    assert [s.name for s in list_files(str(tmp_path), ("*.pdf",))] == ["a.pdf", "sub/deeper/d.pdf"]
+    assert [s.name for s in list_files(str(tmp_path), parse_patterns("sub/*.jpg, *.txt"))] == ["notes.txt", "sub/c.jpg"]
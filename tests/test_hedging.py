@@ -0,0 +1,28 @@
+"""The latency trackers are shared by every session thread of the process."""
+import threading
+
+from hedging import LatencyTracker
+
+
+def test_latency_tracker_is_safe_across_threads():
+    tracker = LatencyTracker(window=100)
+    errors = []
+
+    def hammer(offset):
+        try:
+            for i in range(600):
+                tracker.record("file", offset + i)
+                tracker.record(f"stage-{offset}-{i}", i)  # new keys while other threads summarise
+                if i % 10 == 0:
+                    tracker.summary()
+                    tracker.percentile("file", 95)
+        except Exception as e:  # e.g. "dictionary changed size during iteration"
+            errors.append(e)
+
+    threads = [threading.Thread(target=hammer, args=(n * 10000,)) for n in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert tracker.count("file") == 100
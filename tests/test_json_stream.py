@@ -0,0 +1,70 @@
+"""Incremental parsing of a streamed JSON answer: values appear once complete, whatever the chunking."""
+import json
+
+import pytest
+
+from json_stream import IncrementalObjectParser, MalformedStream
+
+ANSWER = {
+    "bore_diameter": "Ø50 mm",
+    "note": "says \"BORE\" \\ twice",
+    "stroke_length": 250,
+    "cushioning": None,
+    "ports": {"size": "G1/4", "positions": [1, 3]},
+    "confidence": 0.85,
+}
+
+
+def feed_in_chunks(text, size):
+    parser = IncrementalObjectParser()
+    completed = []
+    for i in range(0, len(text), size):
+        completed.extend(parser.feed(text[i:i + size]))
+    return parser, completed
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_values_split_across_chunks(size):
+    # ensure_ascii keeps the Ø escape, so chunks split it and the other escapes.
+    text = json.dumps(ANSWER, indent=1, ensure_ascii=True)
+    parser, completed = feed_in_chunks(text, size)
+    assert completed == list(ANSWER.items())
+    assert parser.finish() == ANSWER
+
+
+def test_value_is_reported_only_once_complete():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"rod_diameter": "4') == []
+    assert parser.feed('0", "stroke_length": 12') == [("rod_diameter", "40")]
+    # A number is only complete at the next separator.
+    assert parser.feed("5") == []
+    assert parser.feed("}") == [("stroke_length", 125)]
+    assert parser.done
+
+
+def test_code_fenced_output():
+    text = "```json\n" + json.dumps({"revision": "03"}) + "\n```"
+    parser, completed = feed_in_chunks(text, 4)
+    assert completed == [("revision", "03")]
+    assert parser.finish() == {"revision": "03"}
+
+
+@pytest.mark.parametrize("text", [
+    "I am sorry, I cannot read this drawing.",
+    '{"bore_diameter" "50"}',
+    '{"bore_diameter": "50" "rod_diameter": "40"}',
+    '{"bore_diameter": 5x}',
+    "[1, 2]",
+])
+def test_malformed_stream_raises(text):
+    parser = IncrementalObjectParser()
+    with pytest.raises(MalformedStream):
+        for char in text:
+            parser.feed(char)
+
+
+def test_truncated_stream_fails_on_finish():
+    parser = IncrementalObjectParser()
+    parser.feed('{"bore_diameter": "50", "rod_')
+    with pytest.raises(MalformedStream):
+        parser.finish()
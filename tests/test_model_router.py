@@ -0,0 +1,15 @@
+"""Routing policies follow the fields of a batch, not its position in the plan."""
+import model_router
+
+STRONG = [{"model": "o4-mini-2025-04-16", "reasoning_effort": "high"}]
+
+
+def test_batch_policy_is_resolved_from_its_fields(monkeypatch):
+    policies = dict(model_router.DEFAULT_POLICIES, close_length=STRONG)
+    monkeypatch.setitem(model_router.ROUTING_CONFIG, "policies", policies)
+
+    # Whatever the planner calls the batch, the one reading close_length gets its policy.
+    for name in ("batch1", "batch2", "stroke_length-1a2b3c"):
+        assert model_router.tiers_for(name, ["stroke_length", "close_length"]) is STRONG
+    assert model_router.tiers_for("batch1", ["bore_diameter", "rod_diameter"]) is model_router.EXTRACTION_TIERS
+    assert model_router.tiers_for("orientation") is model_router.ORIENTATION_TIERS
@@ -0,0 +1,87 @@
+"""Report layouts read back from the written files."""
+import io
+import csv
+import json
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from report_export import export_bytes, write_json, write_long_csv, write_wide_excel
+
+RECORDS = [
+    {"filename": "a.png", "data": {"bore_diameter": "60", "rod_diameter": None}},
+    {"filename": "b.pdf", "data": {"error": "Could not render"}},
+    {"filename": "c.png", "data": {"stroke_length": "200", "bore_diameter": "75"}},
+]
+
+NS = {"x": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+def read_sheet(xlsx_bytes):
+    """{(row, column letters): text} of the first worksheet (inline or shared strings)."""
+    with zipfile.ZipFile(io.BytesIO(xlsx_bytes)) as z:
+        shared = []
+        if "xl/sharedStrings.xml" in z.namelist():
+            shared = [si.findtext(".//x:t", "", NS) for si in ET.fromstring(z.read("xl/sharedStrings.xml"))]
+        sheet = ET.fromstring(z.read("xl/worksheets/sheet1.xml"))
+    cells = {}
+    for c in sheet.iter(f"{{{NS['x']}}}c"):
+        ref = c.get("r")
+        col, row = ref.rstrip("0123456789"), int(ref[len(ref.rstrip("0123456789")):])
+        if c.get("t") == "s":
+            cells[row, col] = shared[int(c.findtext("x:v", "", NS))]
+        else:
+            cells[row, col] = "".join(t.text or "" for t in c.iter(f"{{{NS['x']}}}t")) or c.findtext("x:v", "", NS)
+    return cells
+
+
+def test_wide_excel_puts_parameters_down_and_files_across():
+    buf = io.BytesIO()
+    write_wide_excel(lambda: iter(RECORDS), buf)
+    cells = read_sheet(buf.getvalue())
+    assert [cells[1, c] for c in "ABCD"] == ["Parameter", "a.png", "b.pdf", "c.png"]
+    rows = {cells[r, "A"]: [cells.get((r, c), "") for c in "BCD"] for r in range(2, 6)}
+    assert rows == {
+        "Bore Diameter": ["60", "", "75"],
+        "Rod Diameter": ["", "", ""],
+        "Processing Error": ["", "Could not render", ""],
+        "Stroke Length": ["", "", "200"],
+    }
+
+
+def test_long_csv_round_trip():
+    buf = io.StringIO()
+    write_long_csv(iter(RECORDS), buf)
+    assert list(csv.reader(io.StringIO(buf.getvalue()))) == [
+        ["Filename", "Parameter", "Value"],
+        ["a.png", "Bore Diameter", "60"],
+        ["a.png", "Rod Diameter", ""],
+        ["b.pdf", "Processing Error", "Could not render"],
+        ["c.png", "Stroke Length", "200"],
+        ["c.png", "Bore Diameter", "75"],
+    ]
+
+
+def test_json_round_trip(tmp_path):
+    path = str(tmp_path / "report.json")
+    write_json(iter(RECORDS), path)
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) == RECORDS
+
+
+def test_export_bytes_formats():
+    data, ext, mime = export_bytes(RECORDS, "CSV - long")
+    assert (ext, mime) == ("csv", "text/csv") and data.decode("utf-8").startswith("Filename,Parameter,Value")
+
+    data, ext, _ = export_bytes(RECORDS, "Excel - long (filename, parameter, value)")
+    cells = read_sheet(data)
+    assert ext == "xlsx" and [cells[4, c] for c in "ABC"] == ["b.pdf", "Processing Error", "Could not render"]
+
+
+def test_long_parquet_round_trip():
+    pq = pytest.importorskip("pyarrow.parquet")
+    data, ext, _ = export_bytes(RECORDS, "Parquet - long")
+    table = pq.read_table(io.BytesIO(data))
+    assert ext == "parquet" and table.num_rows == 5
+    assert table.column("value").to_pylist() == ["60", "", "Could not render", "200", "75"]
@@ -0,0 +1,23 @@
+"""Near-duplicate lookup of the result store."""
+from result_store import ResultStore
+
+PHASH = 0x0123456789ABCDEF
+
+
+def test_find_similar_skips_errors_and_sees_other_connections(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    store = ResultStore(path)
+    store.save("h1", "failed.pdf", {"error": "Deadline exceeded"}, phash=PHASH)
+    assert store.find_similar([PHASH]) == []
+
+    # Saved through another connection (another process sharing the database).
+    other = ResultStore(path)
+    other.save("h2", "ok.pdf", {"drawing_number": "D-1", "revision": "2"}, phash=PHASH ^ 0b101)
+    other.save("h3", "far.pdf", {"drawing_number": "D-9"}, phash=~PHASH & (2 ** 64 - 1))
+    other.close()
+
+    # Looked up with the rotations of a page; the closest one is reported.
+    found = store.find_similar([0, PHASH], max_distance=6)
+    assert [r["filename"] for r in found] == ["ok.pdf"]
+    assert found[0]["rotation"] == 1 and found[0]["detail"] is None
+    assert store.find_similar([PHASH], max_distance=1) == []
@@ -0,0 +1,33 @@
+"""Planned feature groups are named after their fields, not their position."""
+from schema_registry import CALL_BASE_LATENCY_S, group_name, measure_field_stats, plan_feature_groups, template_fields
+
+
+def test_group_names_follow_members():
+    assert group_name(["stroke_length", "close_length"]) == group_name(["stroke_length", "close_length"])
+    assert group_name(["stroke_length", "close_length"]) != group_name(["stroke_length", "revision"])
+
+
+def test_plan_names_do_not_depend_on_measured_stats():
+    fields = template_fields("cylinder")
+    # Stats that make every field slow force a different split; names must still be derived from members.
+    slow = {"cylinder": {f: {"latency_s": 30.0, "difficulty": 0.9} for f in fields}}
+    for stats in ({}, slow):
+        batches = plan_feature_groups("cylinder", stats=stats)
+        assert sorted(f for group in batches.values() for f in group) == sorted(fields)
+        assert all(name == group_name(group) for name, group in batches.items())
+
+
+class _Store:
+    def __init__(self, records):
+        self.records = records
+
+    def iter_records(self, has_error=None):
+        return iter(self.records)
+
+
+def test_measured_latency_leaves_out_the_call_overhead(tmp_path):
+    call = {"stage": "g1", "latency_s": CALL_BASE_LATENCY_S + 4.0, "completion_tokens": 100}
+    record = {"provenance": {"feature_batches": {"g1": ["stroke_length", "close_length"]},
+                             "routing": {"call_log": [call]}}}
+    stats = measure_field_stats(_Store([record]), template_name="cylinder", path=str(tmp_path / "stats.json"))
+    assert stats["cylinder"]["stroke_length"] == {"latency_s": 2.0, "tokens": 50.0}
@@ -0,0 +1,65 @@
+"""Change detection and exports of the folder watcher."""
+import os
+import json
+
+import pytest
+
+watch_folder = pytest.importorskip("watch_folder")  # imports backend12 and its dependencies
+from result_store import ResultStore
+
+
+def make_watcher(directory, **kwargs):
+    return watch_folder.FolderWatcher([str(directory)], store=None, state_path=None, settle_seconds=0,
+                                      full_rescan_seconds=1e9, **kwargs)
+
+
+def test_in_place_edit_is_seen_without_a_full_rescan(tmp_path):
+    drawing = tmp_path / "a.pdf"
+    drawing.write_bytes(b"%PDF-1 first")
+    (tmp_path / "notes.txt").write_text("not a drawing")
+    watcher = make_watcher(tmp_path)
+    assert watcher.scan(now=100) == [str(drawing)]
+    assert watcher.changed(str(drawing))
+    assert watcher.scan(now=101) == []
+
+    dir_mtime = os.stat(tmp_path).st_mtime
+    drawing.write_bytes(b"%PDF-1 second version")
+    os.utime(drawing, (200, 200))
+    os.utime(tmp_path, (dir_mtime, dir_mtime))  # editing in place leaves the directory alone
+    assert watcher.scan(now=102) == [str(drawing)]
+
+
+def test_failed_file_is_retried_after_the_retry_delay(tmp_path):
+    drawing = tmp_path / "a.pdf"
+    drawing.write_bytes(b"%PDF-1")
+    watcher = make_watcher(tmp_path, retry_seconds=30)
+    [path] = watcher.scan(now=100)
+    info = watcher.pending[path]
+    watcher.changed(path)
+    watcher.retry_later(path, info, now=100)
+    assert watcher.scan(now=110) == []
+    assert watcher.scan(now=131) == [path]
+
+
+def test_patterns_are_shared_with_file_source(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.png").write_bytes(b"png")
+    (tmp_path / "b.png").write_bytes(b"png")
+    watcher = make_watcher(tmp_path, patterns=("sub/*.png",))
+    assert watcher.scan(now=100) == [str(tmp_path / "sub" / "a.png")]
+
+
+def test_export_has_the_current_version_of_watched_files_only(tmp_path):
+    store = ResultStore(str(tmp_path / "results.sqlite3"))
+    store.save("old", "a.pdf", {"bore_diameter": "50"})
+    store.save("new", "a.pdf", {"bore_diameter": "63"})
+    store.save("other", "elsewhere.pdf", {"bore_diameter": "80"})
+    files = {str(tmp_path / "w" / "a.pdf"): {"mtime": 1, "size": 1, "hash": "new"},
+             str(tmp_path / "w" / "copy.pdf"): {"mtime": 1, "size": 1, "hash": "old"}}
+    json_path = tmp_path / "extracted_data.json"
+    watch_folder.export_from_store(store, files, str(json_path), str(tmp_path / "extracted_data.xlsx"))
+
+    with open(json_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    assert records == [{"filename": "a.pdf", "data": {"bore_diameter": "63"}},
+                       {"filename": "copy.pdf", "data": {"bore_diameter": "50"}}]
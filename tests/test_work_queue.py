@@ -0,0 +1,157 @@
+"""Lease claim / expiry / renewal of the shared-directory work queue, across processes."""
+import os
+import sys
+import json
+import time
+import multiprocessing
+
+import pytest
+
+import work_queue
+from work_queue import WorkQueue
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="uses fork to start contending processes")
+
+TASK_ID = "task"
+
+
+def lease_path(root):
+    return os.path.join(root, "leases", TASK_ID + ".lease")
+
+
+def read_lease(root):
+    with open(lease_path(root), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def contend(root, worker_id, start, results):
+    queue = WorkQueue(root, lease_seconds=60)
+    start.wait()
+    results.put((worker_id, queue.claim(TASK_ID, worker_id)))
+
+
+def hold(root, worker_id, lease, seconds, results):
+    """Keeps renewing a live lease; reports whether every renewal succeeded."""
+    queue = WorkQueue(root, lease_seconds=0.5)
+    ok = True
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        ok = queue.renew(TASK_ID, worker_id, lease) and ok
+        time.sleep(0.05)
+    results.put(ok)
+
+
+def test_one_process_takes_over_an_expired_lease(tmp_path):
+    root = str(tmp_path)
+    WorkQueue(root)
+    with open(lease_path(root), "w", encoding="utf-8") as f:
+        json.dump({"worker": "crashed", "expires_at": time.time() - 1, "attempt": 1}, f)
+
+    ctx = multiprocessing.get_context("fork")
+    start, results = ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=contend, args=(root, f"w{i}", start, results)) for i in range(8)]
+    for p in procs:
+        p.start()
+    start.set()
+    claims = dict(results.get(timeout=30) for _ in procs)
+    for p in procs:
+        p.join(30)
+
+    winners = [w for w, lease in claims.items() if lease]
+    assert len(winners) == 1
+    assert read_lease(root)["worker"] == winners[0]
+    assert claims[winners[0]]["attempt"] == 2
+    assert not [fn for fn in os.listdir(os.path.join(root, "leases")) if ".expired-" in fn]
+
+
+def test_renewed_lease_survives_contenders(tmp_path):
+    root = str(tmp_path)
+    queue = WorkQueue(root, lease_seconds=0.5)
+    lease = queue.claim(TASK_ID, "holder")
+
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    holder = ctx.Process(target=hold, args=(root, "holder", lease, 2.0, results))
+    holder.start()
+    deadline = time.time() + 2.0
+    while time.time() < deadline:
+        assert queue.claim(TASK_ID, "contender") is None
+        time.sleep(0.01)
+    assert results.get(timeout=30) is True
+    holder.join(30)
+    assert read_lease(root)["worker"] == "holder"
+
+
+def test_claim_puts_back_a_lease_renewed_after_it_was_read(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    queue = WorkQueue(root, lease_seconds=60)
+    lease = queue.claim(TASK_ID, "holder")
+    renewed = dict(lease)
+
+    # The contender read the lease just before the holder renewed it.
+    read_json = work_queue._read_json
+    reads = []
+
+    def stale_first_read(path):
+        reads.append(path)
+        if len(reads) == 1:
+            return {**renewed, "expires_at": time.time() - 1}
+        return read_json(path)
+
+    monkeypatch.setattr(work_queue, "_read_json", stale_first_read)
+    assert queue.claim(TASK_ID, "contender") is None
+    monkeypatch.undo()
+
+    assert read_lease(root) == renewed
+    assert queue.renew(TASK_ID, "holder", lease)
+
+
+def test_renew_fails_once_expired_or_taken_over(tmp_path):
+    root = str(tmp_path)
+    queue = WorkQueue(root, lease_seconds=60)
+    lease = queue.claim(TASK_ID, "slow")
+    assert queue.renew(TASK_ID, "slow", lease)
+
+    # Expired but not taken over yet: renewing could race a takeover, so it is refused.
+    expired = {**lease, "expires_at": time.time() - 1}
+    work_queue._write_atomic(lease_path(root), expired)
+    assert not queue.renew(TASK_ID, "slow", dict(expired))
+
+    taken = queue.claim(TASK_ID, "fast")
+    assert taken and taken["attempt"] == 2
+    assert not queue.renew(TASK_ID, "slow", lease)
+    assert read_lease(root) == taken
+
+
+def test_claims_carry_on_instead_of_rescanning(tmp_path, monkeypatch):
+    drawings = tmp_path / "drawings"
+    drawings.mkdir()
+    for i in range(40):
+        (drawings / f"d{i:02d}.pdf").write_bytes(b"%PDF")
+    queue = WorkQueue(str(tmp_path / "queue"))
+    assert queue.enqueue(str(drawings)) == 40
+    other = WorkQueue(str(tmp_path / "queue"))
+    for task_id in queue.task_ids()[:10]:  # finished by another worker
+        other.complete(task_id, "other", {"filename": task_id, "data": {}})
+
+    exists = os.path.exists
+    done_checks = []
+
+    def counting_exists(path):
+        if os.sep + "done" + os.sep in path:
+            done_checks.append(path)
+        return exists(path)
+
+    monkeypatch.setattr(work_queue.os.path, "exists", counting_exists)
+    claimed = []
+    while True:
+        task, lease = queue.next_claimable("w1")
+        if task is None:
+            break
+        claimed.append(task["task_id"])
+        queue.complete(task["task_id"], "w1", {"filename": task["name"], "data": {}})
+
+    assert sorted(claimed) == queue.task_ids()[10:]
+    # One pass, then a final pass that only checks the tasks not yet seen done (none).
+    assert len(done_checks) <= 40
+    assert queue.all_done()
@@ -0,0 +1,255 @@
+"""
+Watch-folder ingestion service.
+
+Polls one or more drawing directories and feeds only new or changed drawings
+to the processing pipeline; results go to the result store and the usual
+extracted_data.json / extracted_data.xlsx exports.
+
+Change detection is incremental:
+  * a directory is only re-listed when its own mtime changed (files added,
+    removed or replaced), or on a slow full-rescan interval;
+  * every tracked file is re-stat'ed on every poll, since editing a file in
+    place does not change its directory's mtime; an idle tree costs one stat
+    per directory and per tracked file, no listing;
+  * a changed file must keep the same size and mtime for `settle_seconds`
+    before it is read, so half-copied files are never processed;
+  * a file whose content hash is unchanged (touched, copied back) is skipped;
+  * a file that failed is queued again after `retry_seconds`.
+Files are matched with file_source's patterns, like every other ingestion path.
+
+The changed files of a polling cycle run concurrently through the async
+pipeline (backend12.process_many_async), sharing one HTTP client.
+
+Usage:
+    python watch_folder.py <dir> [<dir> ...] [--interval 5] [--settle 10] [--state watch_state.json]
+                           [--patterns "*.pdf, *.png"] [--concurrency 8] [--profile [DIR]]
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+
+import profiling
+from backend12 import process_many_async, new_async_client, save_results
+from file_source import FileSource, SUPPORTED_PATTERNS, matches, parse_patterns
+from result_store import ResultStore, content_hash
+
+WATCH_STATE_PATH = "watch_state.json"
+
+
+class FolderWatcher:
+    def __init__(self, directories, store, state_path=WATCH_STATE_PATH, settle_seconds=10.0,
+                 full_rescan_seconds=600.0, patterns=SUPPORTED_PATTERNS, retry_seconds=60.0):
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.store = store
+        self.state_path = state_path
+        self.settle_seconds = settle_seconds
+        self.full_rescan_seconds = full_rescan_seconds
+        self.patterns = patterns
+        self.retry_seconds = retry_seconds
+        self.files = {}      # path -> {"mtime", "size", "hash"} of the last processed version
+        self.dirs = {}       # dir path -> {"mtime", "subdirs"} when it was last listed
+        self.pending = {}    # path -> {"mtime", "size", "since"} changed but not yet settled
+        self.last_full_rescan = 0.0
+        self._load_state()
+
+    # --- persistence ---
+
+    def _load_state(self):
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.files = state.get("files", {})
+            self.dirs = state.get("dirs", {})
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files, "dirs": self.dirs}, f)
+        os.replace(tmp_path, self.state_path)
+
+    # --- change detection ---
+
+    def _note_candidate(self, path, st, now):
+        known = self.files.get(path)
+        if known and known["mtime"] == st.st_mtime and known["size"] == st.st_size:
+            self.pending.pop(path, None)
+            return
+        pending = self.pending.get(path)
+        if not pending or pending["mtime"] != st.st_mtime or pending["size"] != st.st_size:
+            # New change, or still being written: restart the settle timer.
+            self.pending[path] = {"mtime": st.st_mtime, "size": st.st_size, "since": now}
+
+    def _scan_directory(self, directory, root, now, full):
+        try:
+            dir_mtime = os.stat(directory).st_mtime
+        except FileNotFoundError:
+            self.dirs.pop(directory, None)
+            return
+        known = self.dirs.get(directory)
+        if known and known["mtime"] == dir_mtime and not full:
+            # Nothing was added, removed or renamed here: only descend into known subdirectories.
+            for subdir in known["subdirs"]:
+                self._scan_directory(subdir, root, now, full)
+            return
+        subdirs = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif matches(os.path.relpath(entry.path, root).replace(os.sep, "/"), self.patterns):
+                    self._note_candidate(entry.path, entry.stat(), now)
+        self.dirs[directory] = {"mtime": dir_mtime, "subdirs": subdirs}
+        for subdir in subdirs:
+            self._scan_directory(subdir, root, now, full)
+
+    def _recheck_known(self, now):
+        # In-place edits leave the directory mtime alone, so tracked files are stat'ed every poll.
+        for path in list(self.files):
+            try:
+                self._note_candidate(path, os.stat(path), now)
+            except FileNotFoundError:
+                del self.files[path]
+
+    def _recheck_pending(self, now):
+        for path in list(self.pending):
+            try:
+                self._note_candidate(path, os.stat(path), now)
+            except FileNotFoundError:
+                self.pending.pop(path, None)
+
+    def scan(self, now=None):
+        """Updates the pending set and returns the paths whose writes have settled."""
+        now = time.time() if now is None else now
+        full = now - self.last_full_rescan >= self.full_rescan_seconds
+        if full:
+            self.last_full_rescan = now
+        for directory in self.directories:
+            self._scan_directory(directory, directory, now, full)
+        self._recheck_known(now)
+        self._recheck_pending(now)
+        return [p for p, info in self.pending.items() if now - info["since"] >= self.settle_seconds]
+
+    # --- processing ---
+
+    def changed(self, path):
+        """Records the settled version of a file; returns False if its content is unchanged."""
+        info = self.pending.pop(path)
+        # Hashing reads the file once more than the pipeline does, but keeps one file in memory at a time.
+        with open(path, "rb") as f:
+            file_hash = content_hash(f.read())
+        known = self.files.get(path)
+        self.files[path] = {"mtime": info["mtime"], "size": info["size"], "hash": file_hash}
+        if known and known.get("hash") == file_hash:
+            print(f"-> {path} touched but unchanged; skipping.")
+            return False
+        return True
+
+    def retry_later(self, path, info, now):
+        """Forgets a failed version of a file and queues it again once retry_seconds have passed."""
+        self.files.pop(path, None)
+        self.pending[path] = {"mtime": info["mtime"], "size": info["size"], "since": now + self.retry_seconds}
+
+    async def run_once_async(self, client=None, now=None, concurrency=8):
+        """One polling cycle; the changed files run concurrently on `client`. Returns the records produced."""
+        now = time.time() if now is None else now
+        records = []
+        sources = []
+        for path in self.scan(now):
+            info = self.pending[path]
+            try:
+                if self.changed(path):
+                    sources.append(FileSource(path, name=os.path.basename(path)))
+            except Exception as e:
+                self.retry_later(path, info, now)
+                records.append({"filename": os.path.basename(path), "data": {"error": str(e)}})
+
+        async for source, update in process_many_async(sources, concurrency, self.store, client=client):
+            if "error" in update:
+                print(f"ERROR: {source.path}: {update['error']}")
+                records.append({"filename": source.name, "data": {"error": update["error"]}})
+                # Failed results are not remembered, so the file is processed again after retry_seconds.
+                if source.path in self.files:
+                    self.retry_later(source.path, self.files[source.path], now)
+            elif "final_result" in update:
+                records.append({"filename": source.name, "data": update["final_result"]["data"]})
+            elif not update.get("provisional"):
+                print(f"  [{source.name}] [{int(update['progress']*100)}%] {update['status']}")
+        self._save_state()
+        return records
+
+    def run_once(self, now=None):
+        """Synchronous run_once_async() on a private event loop and client."""
+        return asyncio.run(self.run_once_async(now=now))
+
+
+def export_from_store(store, files, json_path="extracted_data.json", xlsx_path="extracted_data.xlsx"):
+    """
+    Regenerates the JSON/Excel exports from the store, one record per watched file: the latest
+    stored result for its current content. `files` is FolderWatcher.files (path -> {"hash", ...}).
+    """
+    def records():
+        for path, info in sorted(files.items()):
+            stored = store.get_by_hash(info["hash"])
+            if stored:
+                yield {"filename": os.path.basename(path), "data": stored["data"]}
+
+    save_results(records, json_path, xlsx_path)
+
+
+async def watch_async(directories, interval=5.0, settle_seconds=10.0, state_path=WATCH_STATE_PATH,
+                      json_path="extracted_data.json", xlsx_path="extracted_data.xlsx", export_interval=60.0,
+                      concurrency=8, patterns=SUPPORTED_PATTERNS):
+    store = ResultStore()
+    watcher = FolderWatcher(directories, store, state_path, settle_seconds, patterns=patterns)
+    print(f"Watching {', '.join(watcher.directories)} (poll every {interval}s, settle {settle_seconds}s). Ctrl+C to stop.")
+    dirty = False
+    last_export = 0.0
+    try:
+        async with new_async_client() as client:
+            while True:
+                if await watcher.run_once_async(client, concurrency=concurrency):
+                    dirty = True
+                if dirty and time.time() - last_export >= export_interval:
+                    export_from_store(store, watcher.files, json_path, xlsx_path)
+                    dirty = False
+                    last_export = time.time()
+                await asyncio.sleep(interval)
+    finally:
+        if dirty:
+            export_from_store(store, watcher.files, json_path, xlsx_path)
+
+
+def watch(directories, interval=5.0, settle_seconds=10.0, state_path=WATCH_STATE_PATH,
+          json_path="extracted_data.json", xlsx_path="extracted_data.xlsx", export_interval=60.0, concurrency=8,
+          patterns=SUPPORTED_PATTERNS):
+    try:
+        asyncio.run(watch_async(directories, interval, settle_seconds, state_path, json_path, xlsx_path,
+                                export_interval, concurrency, patterns))
+    except KeyboardInterrupt:
+        print("Stopping watcher.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch drawing folders and extract new or changed drawings.")
+    parser.add_argument("directories", nargs="+")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls.")
+    parser.add_argument("--settle", type=float, default=10.0, help="Seconds a file must stay unchanged before it is read.")
+    parser.add_argument("--state", default=WATCH_STATE_PATH)
+    parser.add_argument("--json", default="extracted_data.json")
+    parser.add_argument("--xlsx", default="extracted_data.xlsx")
+    parser.add_argument("--export-interval", type=float, default=60.0, help="Minimum seconds between export rewrites.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Changed drawings processed at once.")
+    parser.add_argument("--patterns", default="", help="Comma-separated glob patterns (default: PDFs and images).")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.enable_from_args(args)
+    watch(args.directories, args.interval, args.settle, args.state, args.json, args.xlsx, args.export_interval,
+          args.concurrency, parse_patterns(args.patterns))
+
+
+if __name__ == '__main__':
+    main()
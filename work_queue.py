@@ -0,0 +1,402 @@
+"""
+Multi-node batch execution over a shared-directory work queue.
+
+Several worker processes, on one machine or on many hosts mounting the same
+directory, claim drawings from a queue directory and run them through the async
+pipeline; a coordinator then merges their outputs into the usual JSON/Excel
+report. Only file creation with O_EXCL, atomic rename and atomic replace are
+relied on, which shared filesystems (NFS v3+, SMB) provide; SQLite locking on
+network mounts is not trustworthy, so no database is shared between nodes.
+
+Queue directory layout:
+    tasks/<id>.json     one per drawing: {"task_id", "path", "name"}
+    leases/<id>.lease   claim of a running task: {"worker", "expires_at", "attempt"}
+    done/<id>.json      written once (O_EXCL) by the worker whose result counts
+    shards/<worker>.jsonl
+                        each worker appends only to its own shard
+
+Workers renew their leases while a drawing is in flight, and only while the
+lease is still theirs and unexpired. A lease that has expired (its worker
+crashed or hung) is taken over by renaming it away and re-reading the moved
+file: the takeover only counts if that is still the expired lease the
+contender looked at, otherwise (it was renewed, or another contender already
+replaced it) the file is put back. The task is then retried, at most
+`max_attempts` times. If a slow worker finishes after losing its lease, its
+shard line is ignored because the done marker names the other worker. Lease
+expiry compares wall clocks, so nodes need synchronised time (NTP).
+
+Each worker scans the task list from a random offset and carries on from its
+last claim, remembering the tasks it has seen done, so claiming costs a pass
+over the queue per worker rather than per drawing. Queue file I/O runs on the
+pipeline's thread pool, off the event loop that carries the HTTP calls.
+
+Usage (testable on one box with a local directory):
+    python work_queue.py enqueue <queue_dir> <drawings_dir> [--patterns "*.pdf"]
+    python work_queue.py worker <queue_dir> [--concurrency 8] [--lease 300]   # run several
+    python work_queue.py status <queue_dir>
+    python work_queue.py merge <queue_dir> [--json extracted_data.json] [--xlsx extracted_data.xlsx]
+"""
+import os
+import json
+import time
+import uuid
+import random
+import socket
+import asyncio
+import hashlib
+import argparse
+
+import profiling
+from file_source import FileSource, list_files, parse_patterns
+
+LEASE_SECONDS = 300.0
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 10.0
+
+
+def task_id_for(name):
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()[:20]
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _write_atomic(path, obj):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+def _create_exclusive(path, obj):
+    """Creates `path` only if it does not exist yet; returns False if someone else got there first."""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+
+def _same_lease(a, b):
+    return a.get("worker") == b.get("worker") and a.get("expires_at") == b.get("expires_at")
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        # Missing, or caught mid-write by a non-atomic writer: treat as absent.
+        return None
+
+
+class WorkQueue:
+    def __init__(self, root, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.root = root
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._known_done = set()   # tasks seen done; a done marker is never removed
+        self._scan = None          # task ids of the current pass of next_claimable()
+        self._cursor = 0
+        for sub in ("tasks", "leases", "done", "shards"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def _path(self, sub, task_id, ext):
+        return os.path.join(self.root, sub, task_id + ext)
+
+    # --- producer ---
+
+    def enqueue(self, drawings_dir, patterns=None, recursive=True):
+        """Adds a task per drawing not queued yet; returns the number added."""
+        added = 0
+        for source in list_files(drawings_dir, patterns or parse_patterns(""), recursive):
+            task_id = task_id_for(source.name)
+            task = {"task_id": task_id, "path": os.path.abspath(source.path), "name": source.name}
+            if _create_exclusive(self._path("tasks", task_id, ".json"), task):
+                added += 1
+        return added
+
+    def task_ids(self):
+        return sorted(fn[:-5] for fn in os.listdir(os.path.join(self.root, "tasks")) if fn.endswith(".json"))
+
+    def is_done(self, task_id):
+        if task_id in self._known_done:
+            return True
+        if os.path.exists(self._path("done", task_id, ".json")):
+            self._known_done.add(task_id)
+            return True
+        return False
+
+    def all_done(self):
+        """True once every task has a done marker; only tasks not yet seen done are checked."""
+        return all(self.is_done(task_id) for task_id in self.task_ids())
+
+    # --- leases ---
+
+    def claim(self, task_id, worker_id, now=None):
+        """Takes the lease of a task that is free or whose lease expired; returns the lease or None."""
+        now = time.time() if now is None else now
+        lease_path = self._path("leases", task_id, ".lease")
+        lease = {"worker": worker_id, "expires_at": now + self.lease_seconds, "attempt": 1}
+        if _create_exclusive(lease_path, lease):
+            return lease
+        current = _read_json(lease_path)
+        if current is None or current["expires_at"] > now:
+            return None
+        # Expired: move it aside. The lease may have been renewed or taken over since it was
+        # read, so check that the moved file is still the same expired lease before dropping it.
+        stale_path = f"{lease_path}.expired-{uuid.uuid4().hex}"
+        try:
+            os.rename(lease_path, stale_path)
+        except FileNotFoundError:
+            return None
+        moved = _read_json(stale_path)
+        if moved is None or not _same_lease(moved, current):
+            if moved is not None:
+                _create_exclusive(lease_path, moved)
+            os.remove(stale_path)
+            return None
+        os.remove(stale_path)
+        lease["attempt"] = current.get("attempt", 1) + 1
+        return lease if _create_exclusive(lease_path, lease) else None
+
+    def renew(self, task_id, worker_id, lease):
+        """Extends a lease this worker still holds; returns False if it was lost."""
+        lease_path = self._path("leases", task_id, ".lease")
+        current = _read_json(lease_path)
+        now = time.time()
+        # An expired lease may already be in the middle of a takeover, so it is not renewed either.
+        if not current or not _same_lease(current, lease) or current["expires_at"] <= now:
+            return False
+        lease["expires_at"] = now + self.lease_seconds
+        _write_atomic(lease_path, lease)
+        return True
+
+    def release(self, task_id, worker_id):
+        lease_path = self._path("leases", task_id, ".lease")
+        current = _read_json(lease_path)
+        if current and current["worker"] == worker_id:
+            try:
+                os.remove(lease_path)
+            except FileNotFoundError:
+                pass
+
+    # --- results ---
+
+    def complete(self, task_id, worker_id, record):
+        """Appends the record to the worker's shard, then claims the done marker; False if another worker won."""
+        shard_path = os.path.join(self.root, "shards", f"{worker_id}.jsonl")
+        with open(shard_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"task_id": task_id, **record}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        won = _create_exclusive(self._path("done", task_id, ".json"),
+                                {"worker": worker_id, "finished_at": time.time(),
+                                 "error": "error" in (record.get("data") or {})})
+        self._known_done.add(task_id)
+        self.release(task_id, worker_id)
+        return won
+
+    def next_claimable(self, worker_id, skip=()):
+        """
+        Claims the next task that is not done and not leased by a live worker, carrying on
+        from the last claim. The task list is re-read when a pass finds nothing to claim.
+        """
+        if self._scan is None:
+            self._scan = self.task_ids()
+            self._cursor = random.randrange(len(self._scan)) if self._scan else 0
+        n = len(self._scan)
+        for step in range(n):
+            task_id = self._scan[(self._cursor + step) % n]
+            if task_id in skip or self.is_done(task_id):
+                continue
+            lease = self.claim(task_id, worker_id)
+            if lease:
+                self._cursor = (self._cursor + step + 1) % n
+                task = _read_json(self._path("tasks", task_id, ".json"))
+                return task, lease
+        self._scan = None
+        return None, None
+
+    def status(self):
+        now = time.time()
+        counts = {"tasks": 0, "done": 0, "failed": 0, "running": 0, "expired": 0, "pending": 0}
+        for task_id in self.task_ids():
+            counts["tasks"] += 1
+            done = _read_json(self._path("done", task_id, ".json"))
+            if done:
+                counts["failed" if done.get("error") else "done"] += 1
+                continue
+            lease = _read_json(self._path("leases", task_id, ".lease"))
+            if lease is None:
+                counts["pending"] += 1
+            else:
+                counts["running" if lease["expires_at"] > now else "expired"] += 1
+        return counts
+
+    # --- coordinator ---
+
+    def iter_merged(self):
+        """Yields the accepted {"filename", "data"} of every finished task, in task order."""
+        winners = {}
+        for task_id in self.task_ids():
+            done = _read_json(self._path("done", task_id, ".json"))
+            if done:
+                winners[task_id] = done["worker"]
+        accepted = {}
+        shard_dir = os.path.join(self.root, "shards")
+        for fn in sorted(os.listdir(shard_dir)):
+            if not fn.endswith(".jsonl"):
+                continue
+            worker_id = fn[:-len(".jsonl")]
+            with open(os.path.join(shard_dir, fn), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of a crashed worker
+                    if winners.get(record["task_id"]) == worker_id:
+                        accepted[record["task_id"]] = {"filename": record["filename"], "data": record["data"]}
+        for task_id in self.task_ids():
+            if task_id in accepted:
+                yield accepted[task_id]
+
+
+# --- Worker ---
+
+async def run_worker_async(queue, worker_id=None, concurrency=8, poll_seconds=POLL_SECONDS, exit_when_idle=False,
+                           store=None, config=None):
+    """
+    Claims and processes tasks until every task is done (or, with exit_when_idle, until
+    nothing is claimable) through backend12.process_many_async with one shared client. A
+    task is only claimed when a pipeline slot is free. Returns the number of tasks this
+    worker finished.
+    """
+    from backend12 import new_async_client, process_many_async, run_cpu
+    worker_id = worker_id or default_worker_id()
+    leases = {}          # task name -> (task, lease) of this worker's drawings in flight
+    lost = set()         # names whose lease another worker took over
+    slot_freed = asyncio.Event()
+    finished = 0
+
+    async def claimed_sources():
+        # Pulled by process_many_async whenever a slot is free.
+        while True:
+            task, lease = await run_cpu(queue.next_claimable, worker_id,
+                                        {t["task_id"] for t, _lease in leases.values()})
+            if task is None:
+                if not leases and (exit_when_idle or await run_cpu(queue.all_done)):
+                    return
+                # Remaining tasks are in flight here or leased by other workers; wait in case one of them dies.
+                slot_freed.clear()
+                try:
+                    await asyncio.wait_for(slot_freed.wait(), poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if lease["attempt"] > queue.max_attempts:
+                data = {"error": f"Gave up after {queue.max_attempts} attempts (worker crashes or timeouts)."}
+                await run_cpu(queue.complete, task["task_id"], worker_id, {"filename": task["name"], "data": data})
+                continue
+            print(f"→ [{worker_id}] Claimed {task['name']} (attempt {lease['attempt']})")
+            leases[task["name"]] = (task, lease)
+            yield FileSource(task["path"], name=task["name"])
+
+    async def renew_leases():
+        while True:
+            await asyncio.sleep(queue.lease_seconds / 3)
+            for name, (task, lease) in list(leases.items()):
+                if name not in lost and not await run_cpu(queue.renew, task["task_id"], worker_id, lease):
+                    # The drawing still finishes here, but its result is dropped in favour of the new owner's.
+                    print(f"-> [{worker_id}] Lost the lease on {name}; its result will be discarded.")
+                    lost.add(name)
+
+    async with new_async_client() as client:
+        renewer = asyncio.ensure_future(renew_leases())
+        try:
+            async for source, event in process_many_async(claimed_sources(), concurrency, store, client=client,
+                                                          config=config):
+                if "error" in event:
+                    data = {"error": event["error"]}
+                elif "final_result" in event:
+                    data = event["final_result"]["data"]
+                else:
+                    continue
+                task, _lease = leases.pop(source.name)
+                slot_freed.set()
+                if source.name in lost:
+                    lost.discard(source.name)
+                elif await run_cpu(queue.complete, task["task_id"], worker_id,
+                                   {"filename": task["name"], "data": data}):
+                    finished += 1
+                else:
+                    print(f"-> [{worker_id}] {task['name']} was finished by another worker; result discarded.")
+        finally:
+            renewer.cancel()
+    print(f" Done: worker {worker_id} finished {finished} drawings.")
+    return finished
+
+
+def merge(queue, json_path="extracted_data.json", xlsx_path="extracted_data.xlsx"):
+    """Coordinator step: writes the report from every accepted shard record."""
+    from backend12 import save_results
+    status = queue.status()
+    if status["done"] + status["failed"] < status["tasks"]:
+        print(f"Warning: {status['tasks'] - status['done'] - status['failed']} of {status['tasks']} drawings "
+              f"are not finished; the report covers finished drawings only.")
+    save_results(queue.iter_merged, json_path, xlsx_path)
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared-directory work queue for multi-node batch extraction.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_enqueue = sub.add_parser("enqueue", help="Add the drawings of a folder to the queue.")
+    p_enqueue.add_argument("queue_dir")
+    p_enqueue.add_argument("drawings_dir")
+    p_enqueue.add_argument("--patterns", default="", help="Comma-separated glob patterns (default: PDFs and images).")
+    p_enqueue.add_argument("--no-recursive", action="store_true")
+    p_worker = sub.add_parser("worker", help="Claim and process drawings until the queue is finished.")
+    p_worker.add_argument("queue_dir")
+    p_worker.add_argument("--worker-id")
+    p_worker.add_argument("--concurrency", type=int, default=8)
+    p_worker.add_argument("--lease", type=float, default=LEASE_SECONDS, help="Lease length in seconds.")
+    p_worker.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    p_worker.add_argument("--exit-when-idle", action="store_true",
+                          help="Stop when nothing is claimable instead of waiting for other workers' leases.")
+    p_worker.add_argument("--store", help="Local result store database (do not share one across nodes).")
+    profiling.add_argument(p_worker)
+    p_status = sub.add_parser("status", help="Show queue progress.")
+    p_status.add_argument("queue_dir")
+    p_merge = sub.add_parser("merge", help="Merge the worker shards into the JSON/Excel report.")
+    p_merge.add_argument("queue_dir")
+    p_merge.add_argument("--json", default="extracted_data.json")
+    p_merge.add_argument("--xlsx", default="extracted_data.xlsx")
+    args = parser.parse_args()
+    profiling.enable_from_args(args)
+
+    if args.command == "enqueue":
+        added = WorkQueue(args.queue_dir).enqueue(args.drawings_dir, parse_patterns(args.patterns),
+                                                  recursive=not args.no_recursive)
+        print(f" Done: {added} drawings added to {args.queue_dir}.")
+    elif args.command == "worker":
+        queue = WorkQueue(args.queue_dir, args.lease, args.max_attempts)
+        store = None
+        if args.store:
+            from result_store import ResultStore
+            store = ResultStore(args.store)
+        asyncio.run(run_worker_async(queue, args.worker_id, args.concurrency, exit_when_idle=args.exit_when_idle,
+                                     store=store))
+    elif args.command == "status":
+        print(json.dumps(WorkQueue(args.queue_dir).status(), indent=2))
+    else:
+        merge(WorkQueue(args.queue_dir), args.json, args.xlsx)
+
+
+if __name__ == '__main__':
+    main()